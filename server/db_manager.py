@@ -1,5 +1,7 @@
 import os
 import pathlib
+import threading
+from datetime import datetime
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from contextlib import contextmanager
@@ -9,6 +11,7 @@ from server.models import Base
 from server.models.user_model import User
 from server.models.thread_model import Thread
 from server.models.kb_models import KnowledgeDatabase, KnowledgeFile, KnowledgeNode, KnowledgeHierarchy
+from server.models.job_model import IngestionJob
 from src.utils import logger
 from server.models.ragflow_model import RagflowModel
 
@@ -28,6 +31,10 @@ class DBManager:
         # 确保表存在
         self.create_tables()
 
+        # 知识库层级的内存邻接索引，层级关系变化时失效
+        self._hierarchy_index = None
+        self._hierarchy_lock = threading.Lock()
+
     def ensure_db_dir(self):
         """确保数据库目录存在"""
         db_dir = os.path.dirname(self.db_path)
@@ -73,6 +80,7 @@ class DBManager:
             hierarchy = KnowledgeHierarchy(db_id=db_id, parent_db_id=parent_db_id, order=order, db_name=db_name)
             session.add(hierarchy)
             session.commit()
+            self.invalidate_hierarchy_index()
             return hierarchy.to_dict()  # 返回字典格式
 
     def get_knowledge_hierarchy(self, db_id):
@@ -93,6 +101,7 @@ class DBManager:
             session.query(KnowledgeHierarchy).filter_by(db_id=db_id).delete()
             session.query(KnowledgeHierarchy).filter_by(parent_db_id=db_id).delete()
             session.commit()
+        self.invalidate_hierarchy_index()
 
     def get_all_knowledge_hierarchy(self):
         """获取所有知识库层级关系"""
@@ -100,6 +109,67 @@ class DBManager:
             results = session.query(KnowledgeHierarchy).order_by(KnowledgeHierarchy.order).all()
             return [result.to_dict() for result in results]  # 返回字典列表
 
+    def invalidate_hierarchy_index(self):
+        """使层级邻接索引失效，下次访问时重建"""
+        self._hierarchy_index = None
+
+    def _get_hierarchy_index(self):
+        """获取层级邻接索引 {"parent_of": {db_id: parent_db_id}, "children_of": {db_id: [child_db_id, ...]}, "name_of": {db_id: db_name}}
+
+        整个层级表只查询一次，之后的子树、祖先查询都在内存中完成。
+        """
+        index = self._hierarchy_index
+        if index is not None:
+            return index
+
+        with self._hierarchy_lock:
+            if self._hierarchy_index is None:
+                parent_of, children_of, name_of = {}, {}, {}
+                for item in self.get_all_knowledge_hierarchy():
+                    parent_of[item["db_id"]] = item["parent_db_id"]
+                    name_of[item["db_id"]] = item.get("db_name")
+                    if item["parent_db_id"]:
+                        children_of.setdefault(item["parent_db_id"], []).append(item["db_id"])
+                self._hierarchy_index = {"parent_of": parent_of, "children_of": children_of, "name_of": name_of}
+            return self._hierarchy_index
+
+    def get_subtree_db_ids(self, db_id, include_self=True):
+        """获取某知识库子树中的全部知识库ID（广度优先，同层按 order 排序）"""
+        children_of = self._get_hierarchy_index()["children_of"]
+        result = [db_id] if include_self else []
+        visited = {db_id}
+        queue = [db_id]
+        while queue:
+            current = queue.pop(0)
+            for child in children_of.get(current, []):
+                if child not in visited:
+                    visited.add(child)
+                    result.append(child)
+                    queue.append(child)
+        return result
+
+    def has_knowledge_hierarchy(self, db_id):
+        return db_id in self._get_hierarchy_index()["parent_of"]
+
+    def get_hierarchy_db_names(self, db_ids):
+        """获取层级记录中的数据库名称 {db_id: db_name}"""
+        name_of = self._get_hierarchy_index()["name_of"]
+        return {db_id: name_of.get(db_id) for db_id in db_ids}
+
+    def get_ancestor_db_ids(self, db_id):
+        """获取某知识库的全部祖先ID，从直接父级开始"""
+        parent_of = self._get_hierarchy_index()["parent_of"]
+        ancestors = []
+        current = parent_of.get(db_id)
+        while current and current not in ancestors and current != db_id:
+            ancestors.append(current)
+            current = parent_of.get(current)
+        return ancestors
+
+    def would_create_cycle(self, db_id, parent_db_id):
+        """检查将 parent_db_id 设置为 db_id 的父级是否会形成循环依赖"""
+        return parent_db_id == db_id or db_id in self.get_ancestor_db_ids(parent_db_id)
+
     def update_knowledge_hierarchy_db_name(self, db_id, db_name):
         """更新知识库层级记录的数据库名称"""
         with self.get_session_context() as session:
@@ -107,6 +177,7 @@ class DBManager:
             if hierarchy:
                 hierarchy.db_name = db_name
                 session.commit()
+                self.invalidate_hierarchy_index()
                 logger.info(f"Updated hierarchy {db_id} db_name to: {db_name}")
                 return True
             return False
@@ -183,5 +254,84 @@ class DBManager:
             ragflows = session.query(RagflowModel).all()
             return ragflows
 
+    def add_ingestion_job(self, job_id, db_id, items, params=None):
+        """新增导入任务"""
+        with self.get_session_context() as session:
+            job = IngestionJob(job_id=job_id, db_id=db_id, items=items, params=params or {}, status="pending", progress={})
+            session.add(job)
+            session.commit()
+            return job.to_dict()
+
+    def get_ingestion_job(self, job_id):
+        """获取导入任务，返回 dict"""
+        with self.get_session_context() as session:
+            job = session.query(IngestionJob).filter_by(job_id=job_id).first()
+            return job.to_dict() if job else None
+
+    def list_ingestion_jobs(self, db_id=None, status=None, limit=50, offset=0):
+        """按创建时间倒序列出导入任务"""
+        with self.get_session_context() as session:
+            query = session.query(IngestionJob)
+            if db_id:
+                query = query.filter_by(db_id=db_id)
+            if status:
+                query = query.filter_by(status=status)
+            jobs = query.order_by(IngestionJob.id.desc()).offset(offset).limit(limit).all()
+            return [job.to_dict() for job in jobs]
+
+    def update_ingestion_job(self, job_id, **kwargs):
+        """更新导入任务字段"""
+        with self.get_session_context() as session:
+            job = session.query(IngestionJob).filter_by(job_id=job_id).first()
+            if not job:
+                return None
+            for key, value in kwargs.items():
+                if hasattr(job, key):
+                    setattr(job, key, value)
+            session.commit()
+            return job.to_dict()
+
+    def update_ingestion_job_progress(self, job_id, item_index, file_record):
+        """更新导入任务中单个内容的处理记录"""
+        with self.get_session_context() as session:
+            job = session.query(IngestionJob).filter_by(job_id=job_id).first()
+            if not job:
+                return None
+            # JSON 列需要整体赋值才会被识别为修改
+            progress = dict(job.progress or {})
+            progress[str(item_index)] = file_record
+            job.progress = progress
+            session.commit()
+            return job.to_dict()
+
+    def claim_next_ingestion_job(self):
+        """领取最早的待执行任务并标记为 running，没有待执行任务时返回 None"""
+        with self.get_session_context() as session:
+            job = session.query(IngestionJob).filter_by(status="pending").order_by(IngestionJob.id).first()
+            if not job:
+                return None
+            # 以状态作为条件更新，避免多个 worker 领取到同一个任务
+            updated = session.query(IngestionJob).filter_by(id=job.id, status="pending").update({
+                "status": "running",
+                "attempts": IngestionJob.attempts + 1,
+                "started_at": datetime.now(),
+                "finished_at": None,
+            })
+            session.commit()
+            if not updated:
+                return None
+            session.refresh(job)
+            return job.to_dict()
+
+    def requeue_running_ingestion_jobs(self):
+        """将上次服务退出时仍处于 running 的任务重新置为 pending，返回任务ID列表"""
+        with self.get_session_context() as session:
+            jobs = session.query(IngestionJob).filter_by(status="running").all()
+            job_ids = [job.job_id for job in jobs]
+            for job in jobs:
+                job.status = "pending"
+            session.commit()
+            return job_ids
+
 # 创建全局数据库管理器实例
 db_manager = DBManager()
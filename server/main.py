@@ -1,4 +1,5 @@
 import uvicorn
+from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, Request, HTTPException, status, Depends
 from fastapi.middleware.cors import CORSMiddleware
@@ -7,10 +8,24 @@ from starlette.middleware.base import BaseHTTPMiddleware
 
 from server.routers import router
 from server.utils.auth_middleware import is_public_path
+from server.utils.ingestion_queue import ingestion_queue
+from src import knowledge_base
+from src.models.embedding import aclose_async_client
 from src.utils.logging_config import logger
 
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 预热常用知识库的 LightRAG 实例，启动后台导入任务队列并恢复上次未完成的任务
+    await knowledge_base.startup()
+    await ingestion_queue.start()
+    yield
+    await ingestion_queue.stop()
+    await knowledge_base.shutdown()
+    await aclose_async_client()
+
+
+app = FastAPI(lifespan=lifespan)
 app.include_router(router, prefix="/api")
 
 # CORS 设置
@@ -0,0 +1,48 @@
+from sqlalchemy import Column, Integer, String, DateTime, JSON, Text
+from sqlalchemy.sql import func
+
+from server.models import Base
+
+# 文件记录的最终状态，skipped 表示内容与库中已有文档重复而未导入
+FINISHED_FILE_STATUSES = ("done", "failed", "skipped")
+
+
+class IngestionJob(Base):
+    """知识库内容导入任务表"""
+    __tablename__ = 'ingestion_jobs'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    job_id = Column(String(64), nullable=False, unique=True, index=True, comment="任务ID")
+    db_id = Column(String(64), nullable=False, index=True, comment="知识库ID")
+    items = Column(JSON, nullable=False, comment="待导入的文件路径或URL列表")
+    params = Column(JSON, nullable=True, comment="导入参数")
+    status = Column(String(32), nullable=False, default="pending", index=True, comment="状态: pending, running, done, failed, cancelled")
+    progress = Column(JSON, nullable=True, comment="每个内容的处理记录 {item_index: file_record}")
+    message = Column(Text, nullable=True, comment="结果说明")
+    attempts = Column(Integer, nullable=False, default=0, comment="执行次数")
+    created_at = Column(DateTime, default=func.now(), comment="创建时间")
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now(), comment="更新时间")
+    started_at = Column(DateTime, nullable=True, comment="最近一次开始执行时间")
+    finished_at = Column(DateTime, nullable=True, comment="最近一次结束时间")
+
+    def to_dict(self):
+        progress = self.progress or {}
+        items = self.items or []
+        return {
+            "job_id": self.job_id,
+            "db_id": self.db_id,
+            "items": items,
+            "params": self.params or {},
+            "status": self.status,
+            "progress": progress,
+            "total": len(items),
+            "finished": len([r for r in progress.values() if r.get("status") in FINISHED_FILE_STATUSES]),
+            "failed": len([r for r in progress.values() if r.get("status") == "failed"]),
+            "skipped": len([r for r in progress.values() if r.get("status") == "skipped"]),
+            "message": self.message,
+            "attempts": self.attempts,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
@@ -6,6 +6,7 @@ from fastapi import APIRouter, File, UploadFile, HTTPException, Depends, Body, F
 from src.utils import logger, hashstr
 from src import executor, config, knowledge_base
 from server.utils.auth_middleware import get_admin_user
+from server.utils.ingestion_queue import ingestion_queue
 from server.models.user_model import User
 
 data = APIRouter(prefix="/data")
@@ -52,6 +53,31 @@ async def query_test(query: str = Body(...), meta: dict = Body(...), current_use
     result = await knowledge_base.aquery(query, **meta)
     return result
 
+@data.get("/query-cache/stats")
+async def get_query_cache_stats(current_user: User = Depends(get_admin_user)):
+    return knowledge_base.get_query_cache_stats()
+
+@data.get("/parse-cache/stats")
+async def get_parse_cache_stats(current_user: User = Depends(get_admin_user)):
+    return knowledge_base.get_parse_cache_stats()
+
+@data.get("/embedding-cache/stats")
+async def get_embedding_cache_stats(current_user: User = Depends(get_admin_user)):
+    from src.models.embedding_cache import get_embedding_cache_stats
+    return get_embedding_cache_stats()
+
+@data.post("/query-multi")
+async def query_multi(
+    query: str = Body(...),
+    db_ids: list[str] | None = Body(None),
+    fusion: str = Body("rrf"),
+    timeout: float | None = Body(None),
+    meta: dict = Body(default={}),
+    current_user: User = Depends(get_admin_user)
+):
+    logger.debug(f"Federated query in {db_ids} with {fusion=}: {query}")
+    return await knowledge_base.afederated_query(query, db_ids=db_ids, timeout=timeout, fusion=fusion, **meta)
+
 @data.post("/add-files")
 async def add_files(db_id: str = Body(...), items: list[str] = Body(...), params: dict = Body(...), current_user: User = Depends(get_admin_user)):
     logger.debug(f"Add files/urls for db_id {db_id}: {items} {params=}")
@@ -60,16 +86,50 @@ async def add_files(db_id: str = Body(...), items: list[str] = Body(...), params
     content_type = params.get('content_type', 'file')
 
     try:
-        # 使用统一的 add_content 方法
-        processed_items = await knowledge_base.add_content(db_id, items, params=params)
+        # 提交到后台导入队列，通过 /data/jobs/{job_id} 查询处理进度
+        job = ingestion_queue.submit(db_id, items, params)
 
         item_type = "URLs" if content_type == 'url' else "files"
-        processed_failed_count = len([_p for _p in processed_items if _p['status'] == 'failed'])
-        processed_info = f"Processed {len(processed_items)} {item_type}, {processed_failed_count} {item_type} failed"
-        return {"message": processed_info, "items": processed_items, "status": "success"}
+        return {"message": f"Submitted {len(items)} {item_type} for processing", "job_id": job["job_id"], "job": job, "status": "success"}
     except Exception as e:
-        logger.error(f"Failed to process {content_type}s: {e}, {traceback.format_exc()}")
-        return {"message": f"Failed to process {content_type}s: {e}", "status": "failed"}
+        logger.error(f"Failed to submit {content_type}s: {e}, {traceback.format_exc()}")
+        return {"message": f"Failed to submit {content_type}s: {e}", "status": "failed"}
+
+@data.get("/jobs")
+async def list_jobs(
+    db_id: str | None = Query(None),
+    status: str | None = Query(None),
+    limit: int = Query(50, ge=1, le=500),
+    offset: int = Query(0, ge=0),
+    current_user: User = Depends(get_admin_user)
+):
+    return {"jobs": ingestion_queue.list(db_id=db_id, status=status, limit=limit, offset=offset)}
+
+@data.get("/jobs/{job_id}")
+async def get_job(job_id: str, current_user: User = Depends(get_admin_user)):
+    job = ingestion_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@data.post("/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str, current_user: User = Depends(get_admin_user)):
+    logger.debug(f"Cancel job {job_id}")
+    job = ingestion_queue.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {"message": "已提交取消", "job": job}
+
+@data.post("/jobs/{job_id}/retry")
+async def retry_job(job_id: str, current_user: User = Depends(get_admin_user)):
+    logger.debug(f"Retry job {job_id}")
+    try:
+        job = ingestion_queue.retry(job_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {"message": "已重新提交", "job": job}
 
 @data.post("/file-to-chunk")
 async def file_to_chunk(db_id: str = Body(...), files: list[str] = Body(...), params: dict = Body(...), current_user: User = Depends(get_admin_user)):
@@ -107,12 +167,38 @@ async def delete_document(db_id: str = Body(...), file_id: str = Body(...), curr
     await knowledge_base.delete_file(db_id, file_id)
     return {"message": "删除成功"}
 
+@data.post("/update-document")
+async def update_document(
+    db_id: str = Body(...),
+    file_id: str = Body(...),
+    file_path: str = Body(...),
+    params: dict = Body(default={}),
+    current_user: User = Depends(get_admin_user)
+):
+    """用新版本文件（通过 /data/upload 上传）更新文档，只对变化的 chunk 重新抽取实体"""
+    logger.debug(f"Update document {file_id} in {db_id} with {file_path}")
+    try:
+        result = await knowledge_base.update_document(db_id, file_id, file_path, params=params)
+        return {"message": "更新成功", "status": "success", **result}
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        logger.error(f"Failed to update document {file_id}: {e}, {traceback.format_exc()}")
+        return {"message": f"Failed to update document: {e}", "status": "failed"}
+
 @data.get("/document")
-async def get_document_info(db_id: str, file_id: str, current_user: User = Depends(get_admin_user)):
-    logger.debug(f"GET document {file_id} info in {db_id}")
+async def get_document_info(
+    db_id: str,
+    file_id: str,
+    offset: int = Query(0, ge=0),
+    limit: int | None = Query(None, ge=1),
+    max_content_length: int | None = Query(None, ge=1),
+    current_user: User = Depends(get_admin_user)
+):
+    logger.debug(f"GET document {file_id} info in {db_id}, {offset=}, {limit=}")
 
     try:
-        info = await knowledge_base.get_file_info(db_id, file_id)
+        info = await knowledge_base.get_file_info(db_id, file_id, offset=offset, limit=limit, max_content_length=max_content_length)
     except Exception as e:
         logger.error(f"Failed to get file info, {e}, {db_id=}, {file_id=}, {traceback.format_exc()}")
         info = {"message": "Failed to get file info", "status": "failed"}
@@ -159,21 +245,27 @@ async def index_nodes(data: dict = Body(default={}), current_user: User = Depend
     # 获取参数或使用默认值
     kgdb_name = data.get('kgdb_name', 'neo4j')
 
-    # 调用GraphDatabase的add_embedding_to_nodes方法
-    count = graph_base.add_embedding_to_nodes(kgdb_name=kgdb_name)
+    # 在后台批量建立索引，通过 /graph/index-nodes/{job_id} 查询进度
+    job = graph_base.start_index_nodes_job(kgdb_name=kgdb_name)
+    return {"status": "success", "message": "已开始为未索引节点添加嵌入向量", "job_id": job["job_id"]}
 
-    return {"status": "success", "message": f"已成功为{count}个节点添加嵌入向量", "indexed_count": count}
+@data.get("/graph/index-nodes/{job_id}")
+async def get_index_nodes_job(job_id: str, current_user: User = Depends(get_admin_user)):
+    job = graph_base.get_index_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="索引任务不存在")
+    return job
 
 @data.get("/graph/node")
 async def get_graph_node(entity_name: str, current_user: User = Depends(get_admin_user)):
-    result = graph_base.query_node(entity_name=entity_name)
+    result = await graph_base.aquery_node(entity_name=entity_name)
     return {"result": graph_base.format_query_result_to_graph(result), "message": "success"}
 
 @data.get("/graph/nodes")
 async def get_graph_nodes(kgdb_name: str, num: int, current_user: User = Depends(get_admin_user)):
 
     logger.debug(f"Get graph nodes in {kgdb_name} with {num} nodes")
-    result = graph_base.get_sample_nodes(kgdb_name, num)
+    result = await graph_base.aget_sample_nodes(kgdb_name, num)
     return {"result": graph_base.format_general_results(result), "message": "success"}
 
 @data.post("/graph/add-by-jsonl")
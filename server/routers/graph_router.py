@@ -36,17 +36,17 @@ async def get_subgraph(
     try:
         logger.info(f"获取子图数据 - db_id: {db_id}, node_label: {node_label}, max_depth: {max_depth}, max_nodes: {max_nodes}")
 
-        # 获取 LightRAG 实例
-        rag_instance = await knowledge_base._get_lightrag_instance(db_id)
-        if not rag_instance:
-            raise HTTPException(status_code=404, detail=f"数据库 {db_id} 不存在")
-
-        # 使用 LightRAG 的原生 get_knowledge_graph 方法
-        knowledge_graph = await rag_instance.get_knowledge_graph(
-            node_label=node_label,
-            max_depth=max_depth,
-            max_nodes=max_nodes
-        )
+        # 占用 LightRAG 实例，查询期间不会被实例池淘汰
+        async with knowledge_base._lease_lightrag_instance(db_id) as rag_instance:
+            if not rag_instance:
+                raise HTTPException(status_code=404, detail=f"数据库 {db_id} 不存在")
+
+            # 使用 LightRAG 的原生 get_knowledge_graph 方法
+            knowledge_graph = await rag_instance.get_knowledge_graph(
+                node_label=node_label,
+                max_depth=max_depth,
+                max_nodes=max_nodes
+            )
 
         # 将 LightRAG 的 KnowledgeGraph 格式转换为前端需要的格式
         nodes = []
@@ -105,13 +105,13 @@ async def get_graph_labels(
     try:
         logger.info(f"获取图谱标签 - db_id: {db_id}")
 
-        # 获取 LightRAG 实例
-        rag_instance = await knowledge_base._get_lightrag_instance(db_id)
-        if not rag_instance:
-            raise HTTPException(status_code=404, detail=f"数据库 {db_id} 不存在")
+        # 占用 LightRAG 实例，查询期间不会被实例池淘汰
+        async with knowledge_base._lease_lightrag_instance(db_id) as rag_instance:
+            if not rag_instance:
+                raise HTTPException(status_code=404, detail=f"数据库 {db_id} 不存在")
 
-        # 使用 LightRAG 的原生方法获取所有标签
-        labels = await rag_instance.get_graph_labels()
+            # 使用 LightRAG 的原生方法获取所有标签
+            labels = await rag_instance.get_graph_labels()
 
         return {
             "success": True,
@@ -219,17 +219,17 @@ async def get_graph_stats(
     try:
         logger.info(f"获取图谱统计信息 - db_id: {db_id}")
 
-        # 获取 LightRAG 实例
-        rag_instance = await knowledge_base._get_lightrag_instance(db_id)
-        if not rag_instance:
-            raise HTTPException(status_code=404, detail=f"数据库 {db_id} 不存在")
-
-        # 通过获取全图来统计节点和边的数量
-        knowledge_graph = await rag_instance.get_knowledge_graph(
-            node_label="*",
-            max_depth=1,
-            max_nodes=10000  # 设置较大值以获取完整统计
-        )
+        # 占用 LightRAG 实例，查询期间不会被实例池淘汰
+        async with knowledge_base._lease_lightrag_instance(db_id) as rag_instance:
+            if not rag_instance:
+                raise HTTPException(status_code=404, detail=f"数据库 {db_id} 不存在")
+
+            # 通过获取全图来统计节点和边的数量
+            knowledge_graph = await rag_instance.get_knowledge_graph(
+                node_label="*",
+                max_depth=1,
+                max_nodes=10000  # 设置较大值以获取完整统计
+            )
 
         # 统计实体类型分布
         entity_types = {}
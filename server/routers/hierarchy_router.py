@@ -53,6 +53,40 @@ async def get_all_knowledge_hierarchy(current_user: User = Depends(get_admin_use
     return {"all_hierarchy": all_hierarchy}  # 直接返回，因为已经是字典列表了
 
 
+@data.get("/subtree")
+async def get_knowledge_subtree(db_id: str, current_user: User = Depends(get_admin_user)):
+    return {"db_ids": db_manager.get_subtree_db_ids(db_id)}
+
+
+@data.post("/query")
+async def query_knowledge_subtree(
+        db_id: str = Body(...),
+        query: str = Body(...),
+        include_self: bool = Body(True),
+        fusion: str = Body("rrf"),
+        timeout: float = Body(None),
+        meta: dict = Body(default={}),
+        current_user: User = Depends(get_admin_user)
+):
+    """检索某知识库及其全部子知识库，子树中的知识库并发检索后融合结果
+
+    层级表中保存的是 RAGFlow dataset ID，检索前通过 knowledge_base.resolve_database_ids 映射到 LightRAG 知识库，
+    子树中存在无法映射的知识库时返回 422，而不是返回空结果。
+    """
+    if not db_manager.has_knowledge_hierarchy(db_id) and db_id not in knowledge_base.databases_meta:
+        raise HTTPException(status_code=404, detail=f"知识库 {db_id} 不存在")
+
+    db_ids = db_manager.get_subtree_db_ids(db_id, include_self=include_self)
+    resolved, unresolved = knowledge_base.resolve_database_ids(db_manager.get_hierarchy_db_names(db_ids))
+    if unresolved:
+        raise HTTPException(status_code=422, detail={"message": "以下知识库没有对应的 LightRAG 知识库", "unresolved": unresolved})
+
+    kb_ids = list(dict.fromkeys(resolved[ref] for ref in db_ids))
+    logger.debug(f"Query subtree of {db_id} ({len(kb_ids)} databases): {query}")
+    result = await knowledge_base.afederated_query(query, db_ids=kb_ids, timeout=timeout, fusion=fusion, **meta)
+    return result | {"db_ids": db_ids, "resolved": resolved}
+
+
 @data.delete("/delete")
 async def delete_knowledge_hierarchy(db_id: str = Body(...), current_user: User = Depends(get_admin_user)):
     db_manager.delete_knowledge_hierarchy(db_id)
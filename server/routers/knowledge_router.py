@@ -137,28 +137,8 @@ async def api_update_database_info(
     try:
         # 检测循环依赖
         if parent_db_id and parent_db_id != "null" and parent_db_id != "undefined":
-            # 检查是否会造成循环依赖
-            def check_circular_dependency(current_id, target_parent_id, visited=None):
-                if visited is None:
-                    visited = set()
-                
-                # if current_id in visited:
-                #     return False  # 没有循环
-                
-                visited.add(current_id)
-                
-                # 如果目标父级是当前节点，则形成循环
-                if target_parent_id == current_id:
-                    return True
-                
-                # 获取目标父级的父级
-                parent_info = db_manager.get_knowledge_hierarchy(target_parent_id)
-                if parent_info and parent_info.get('parent_db_id'):
-                    return check_circular_dependency(current_id, parent_info['parent_db_id'], visited)
-                
-                return False
-            
-            if check_circular_dependency(db_id, parent_db_id):
+            # 检查是否会造成循环依赖，使用内存中的层级索引，无需逐级查询数据库
+            if db_manager.would_create_cycle(db_id, parent_db_id):
                 raise HTTPException(status_code=400, detail="检测到循环依赖，无法设置此父级知识库")
         
         database = await update_dataset_http(db_id, name=name, description=description)
@@ -279,22 +259,29 @@ async def index_nodes(data: dict = Body(default={}), current_user: User = Depend
     # 获取参数或使用默认值
     kgdb_name = data.get('kgdb_name', 'neo4j')
 
-    # 调用GraphDatabase的add_embedding_to_nodes方法
-    count = graph_base.add_embedding_to_nodes(kgdb_name=kgdb_name)
+    # 在后台批量建立索引，通过 /graph/index-nodes/{job_id} 查询进度
+    job = graph_base.start_index_nodes_job(kgdb_name=kgdb_name)
+    return {"status": "success", "message": "已开始为未索引节点添加嵌入向量", "job_id": job["job_id"]}
+
 
-    return {"status": "success", "message": f"已成功为{count}个节点添加嵌入向量", "indexed_count": count}
+@data.get("/graph/index-nodes/{job_id}")
+async def get_index_nodes_job(job_id: str, current_user: User = Depends(get_admin_user)):
+    job = graph_base.get_index_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="索引任务不存在")
+    return job
 
 
 @data.get("/graph/node")
 async def get_graph_node(entity_name: str, current_user: User = Depends(get_admin_user)):
-    result = graph_base.query_node(entity_name=entity_name)
+    result = await graph_base.aquery_node(entity_name=entity_name)
     return {"result": graph_base.format_query_result_to_graph(result), "message": "success"}
 
 
 @data.get("/graph/nodes")
 async def get_graph_nodes(kgdb_name: str, num: int, current_user: User = Depends(get_admin_user)):
     logger.debug(f"Get graph nodes in {kgdb_name} with {num} nodes")
-    result = graph_base.get_sample_nodes(kgdb_name, num)
+    result = await graph_base.aget_sample_nodes(kgdb_name, num)
     return {"result": graph_base.format_general_results(result), "message": "success"}
 
 
@@ -0,0 +1,184 @@
+import os
+import asyncio
+import traceback
+from datetime import datetime
+
+from src import knowledge_base
+from src.utils import logger, hashstr
+from server.db_manager import db_manager
+
+
+class IngestionQueue:
+    """知识库内容导入的后台任务队列
+
+    任务持久化在 server.db 的 ingestion_jobs 表中，接口只负责提交任务并返回任务ID，
+    由随服务启动的 worker 调用 knowledge_base.add_content 执行。服务重启后，上次未完成的任务
+    会重新排队，并先清理其中处于 processing 状态的文件记录，再继续导入未完成的内容。
+    """
+
+    def __init__(self, num_workers=None, poll_interval=5.0):
+        self.num_workers = int(num_workers or os.getenv("INGESTION_WORKERS", 1))
+        self.poll_interval = poll_interval
+        self._workers: list[asyncio.Task] = []
+        self._running_tasks: dict[str, asyncio.Task] = {}
+        self._cancel_requested: set[str] = set()
+        self._wakeup: asyncio.Event | None = None
+
+    async def start(self):
+        """启动 worker，并恢复上次服务退出时未完成的任务"""
+        if self._workers:
+            return
+
+        self._wakeup = asyncio.Event()
+        requeued = db_manager.requeue_running_ingestion_jobs()
+        if requeued:
+            logger.info(f"Requeued {len(requeued)} interrupted ingestion jobs: {requeued}")
+
+        self._workers = [asyncio.create_task(self._worker_loop(i)) for i in range(self.num_workers)]
+        logger.info(f"Ingestion queue started with {self.num_workers} workers")
+
+    async def stop(self):
+        """停止 worker，正在执行的任务保持 running 状态，下次启动时恢复"""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        logger.info("Ingestion queue stopped")
+
+    def submit(self, db_id, items, params=None):
+        """提交导入任务，立即返回任务信息"""
+        job_id = f"job_{hashstr(db_id + str(items), 16, with_salt=True)}"
+        job = db_manager.add_ingestion_job(job_id, db_id, items, params)
+        self._notify()
+        logger.info(f"Submitted ingestion job {job_id} for {db_id} with {len(items)} items")
+        return job
+
+    def get(self, job_id):
+        return db_manager.get_ingestion_job(job_id)
+
+    def list(self, db_id=None, status=None, limit=50, offset=0):
+        return db_manager.list_ingestion_jobs(db_id=db_id, status=status, limit=limit, offset=offset)
+
+    def cancel(self, job_id):
+        """取消任务：待执行的任务直接取消，执行中的任务会被中断并清理未完成的文件记录"""
+        job = db_manager.get_ingestion_job(job_id)
+        if not job:
+            return None
+
+        if job["status"] == "pending":
+            return db_manager.update_ingestion_job(job_id, status="cancelled", message="任务已取消", finished_at=datetime.now())
+
+        if job["status"] == "running" and job_id in self._running_tasks:
+            self._cancel_requested.add(job_id)
+            self._running_tasks[job_id].cancel()
+
+        return job
+
+    def retry(self, job_id):
+        """重试失败或已取消的任务，已完成的内容不会重复导入"""
+        job = db_manager.get_ingestion_job(job_id)
+        if not job:
+            return None
+
+        if job["status"] not in ("failed", "cancelled"):
+            raise ValueError(f"只能重试失败或已取消的任务，当前任务状态为 {job['status']}")
+
+        job = db_manager.update_ingestion_job(job_id, status="pending", message=None, finished_at=None)
+        self._notify()
+        return job
+
+    def _notify(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _worker_loop(self, worker_idx):
+        logger.debug(f"Ingestion worker {worker_idx} started")
+        while True:
+            try:
+                job = db_manager.claim_next_ingestion_job()
+            except Exception as e:
+                logger.error(f"Failed to claim ingestion job: {e}, {traceback.format_exc()}")
+                job = None
+
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except TimeoutError:
+                    pass
+                continue
+
+            task = asyncio.create_task(self._run_job(job))
+            self._running_tasks[job["job_id"]] = task
+            try:
+                # 使用 wait 而不是直接 await，任务被用户取消时 worker 本身不会退出
+                await asyncio.wait({task})
+            except asyncio.CancelledError:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                raise
+            finally:
+                self._running_tasks.pop(job["job_id"], None)
+
+    async def _cleanup_unfinished(self, job):
+        """删除任务中未完成内容的文件记录及其在 LightRAG 中的残留，返回需要重新导入的内容下标"""
+        progress = job.get("progress") or {}
+        pending_indexes = []
+        for idx in range(len(job["items"])):
+            record = progress.get(str(idx))
+            # skipped（与库中已有文档重复）与 done 一样不需要重新导入，failed 的内容重试时重新导入
+            if record and record.get("status") in ("done", "skipped"):
+                continue
+            if record and record.get("file_id"):
+                try:
+                    await knowledge_base.delete_file(job["db_id"], record["file_id"])
+                except Exception as e:
+                    logger.warning(f"Failed to clean up file {record['file_id']} of job {job['job_id']}: {e}")
+            pending_indexes.append(idx)
+        return pending_indexes
+
+    async def _run_job(self, job):
+        job_id, db_id = job["job_id"], job["db_id"]
+        params = job.get("params") or {}
+        content_type = params.get("content_type", "file")
+        logger.info(f"Running ingestion job {job_id} (attempt {job['attempts']})")
+
+        pending_indexes = []
+
+        # add_content 会按 items 的顺序为每个内容先回调一次 queued 阶段，以此建立 file_id 与下标的对应关系
+        index_by_file_id = {}
+
+        def on_progress(file_record):
+            file_id = file_record["file_id"]
+            if file_id not in index_by_file_id:
+                index_by_file_id[file_id] = pending_indexes[len(index_by_file_id)]
+            db_manager.update_ingestion_job_progress(job_id, index_by_file_id[file_id], file_record)
+
+        try:
+            # 清理也可能被取消，放在 try 中以便正确标记任务状态
+            pending_indexes.extend(await self._cleanup_unfinished(job))
+            items = [job["items"][idx] for idx in pending_indexes]
+            await knowledge_base.add_content(db_id, items, params=params, progress_callback=on_progress)
+
+        except asyncio.CancelledError:
+            if job_id in self._cancel_requested:
+                self._cancel_requested.discard(job_id)
+                await self._cleanup_unfinished(db_manager.get_ingestion_job(job_id))
+                db_manager.update_ingestion_job(job_id, status="cancelled", message="任务已取消", finished_at=datetime.now())
+                logger.info(f"Ingestion job {job_id} cancelled")
+            raise
+
+        except Exception as e:
+            logger.error(f"Ingestion job {job_id} failed: {e}, {traceback.format_exc()}")
+            db_manager.update_ingestion_job(job_id, status="failed", message=str(e), finished_at=datetime.now())
+            return
+
+        job = db_manager.get_ingestion_job(job_id)
+        item_type = "URLs" if content_type == 'url' else "files"
+        message = f"Processed {job['total']} {item_type}, {job['failed']} {item_type} failed, {job['skipped']} {item_type} skipped as duplicates"
+        status = "failed" if job["failed"] else "done"
+        db_manager.update_ingestion_job(job_id, status=status, message=message, finished_at=datetime.now())
+        logger.info(f"Ingestion job {job_id} finished: {message}")
+
+
+ingestion_queue = IngestionQueue()
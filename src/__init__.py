@@ -2,14 +2,26 @@ from dotenv import load_dotenv
 
 load_dotenv("src/.env")
 
+import threading  # noqa: E402
 from concurrent.futures import ThreadPoolExecutor  # noqa: E402
 executor = ThreadPoolExecutor()
 
 from src.config import Config  # noqa: E402
 config = Config()
-#
-from src.core.lightrag_based_kb import LightRagBasedKB  # noqa: E402
-knowledge_base = LightRagBasedKB()
+
+# knowledge_base 在第一次 `from src import knowledge_base` 时才创建：
+# OCR 进程池等以 spawn / forkserver 启动的子进程会导入 src 包，不应在子进程中各自创建知识库（打开元数据库、实例池等）
+_knowledge_base_lock = threading.Lock()
+
+
+def __getattr__(name):
+    if name == "knowledge_base":
+        with _knowledge_base_lock:
+            if "knowledge_base" not in globals():
+                from src.core.lightrag_based_kb import LightRagBasedKB
+                globals()["knowledge_base"] = LightRagBasedKB()
+        return globals()["knowledge_base"]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # from src.core import GraphDatabase  # noqa: E402
 # graph_base = GraphDatabase()
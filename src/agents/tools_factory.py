@@ -20,6 +20,12 @@ class KnowledgeRetrieverModel(BaseModel):
         )
     )
 
+class MultiKnowledgeRetrieverModel(KnowledgeRetrieverModel):
+    db_ids: list[str] | None = Field(
+        default=None,
+        description="要同时检索的知识库ID列表（可使用ID前8位），不填写则检索全部知识库。",
+    )
+
 def get_all_tools():
     """获取所有工具"""
     tools = _TOOLS_REGISTRY.copy()
@@ -54,6 +60,36 @@ def get_all_tools():
             args_schema=KnowledgeRetrieverModel
         )
 
+    # 多个知识库时提供一个统一检索工具，一次调用并发检索多个知识库并融合结果
+    retrievers = knowledge_base.get_retrievers()
+    if len(retrievers) > 1:
+        kb_list = "\n".join(f"- {db_id[:8]}: {info['name']}" for db_id, info in retrievers.items())
+
+        async def multi_retriever_wrapper(query_text: str, db_ids: list[str] | None = None):
+            """并发检索多个知识库"""
+            try:
+                if db_ids:
+                    prefixes = db_ids
+                    db_ids = [db_id for db_id in retrievers if any(db_id.startswith(prefix) for prefix in prefixes)]
+                    # 指定了知识库但都不匹配时不能退化为检索全部知识库
+                    if not db_ids:
+                        return f"没有匹配的知识库: {', '.join(prefixes)}，可用的知识库：\n{kb_list}"
+                result = await knowledge_base.afederated_query(query_text, db_ids=db_ids or None)
+                return result["context"]
+            except Exception as e:
+                logger.error(f"Error in multi retriever: {e}")
+                return f"检索失败: {str(e)}"
+
+        tools["retrieve_multi_kb"] = StructuredTool.from_function(
+            coroutine=multi_retriever_wrapper,
+            name="retrieve_multi_kb",
+            description=(
+                "同时检索多个知识库并返回融合、去重后的结果。当问题涉及多个知识库时，优先使用此工具一次完成检索。\n"
+                f"可用的知识库：\n{kb_list}"
+            ),
+            args_schema=MultiKnowledgeRetrieverModel
+        )
+
     return tools
 
 class BaseToolOutput:
@@ -100,9 +136,9 @@ def calculator(a: float, b: float, operation: str) -> float:
         raise ValueError(f"Invalid operation: {operation}, only support add, subtract, multiply, divide")
 
 @tool
-def query_knowledge_graph(query: Annotated[str, "The keyword to query knowledge graph."]):
+async def query_knowledge_graph(query: Annotated[str, "The keyword to query knowledge graph."]):
     """Use this to query knowledge graph."""
-    return graph_base.query_node(query, hops=2)
+    return await graph_base.aquery_node(query, hops=2)
 
 
 
@@ -0,0 +1,204 @@
+import os
+import re
+from collections import deque
+from collections.abc import Iterable, Iterator
+
+from src.utils import estimate_tokens
+
+# 句子边界：换行、中文句末标点（含紧随的右引号/括号）、英文句末标点后跟空白
+_BOUNDARY_PATTERN = re.compile(r'\n+|[。！？；]+[”’」』）)]*|[.!?;]+(?=\s)')
+_HEADING_PATTERN = re.compile(r'^(#{1,6})\s+(.+?)\s*#*\s*$')
+
+_STREAM_BLOCK_SIZE = 64 * 1024
+
+_tiktoken_encoding = None
+
+
+def count_tokens(text: str) -> int:
+    """计算 token 数，安装了 tiktoken 时使用 CHUNK_TIKTOKEN_ENCODING（默认 o200k_base），否则按字符估计"""
+    global _tiktoken_encoding
+    if _tiktoken_encoding is None:
+        try:
+            import tiktoken  # type: ignore
+            _tiktoken_encoding = tiktoken.get_encoding(os.getenv("CHUNK_TIKTOKEN_ENCODING", "o200k_base"))
+        except Exception:
+            _tiktoken_encoding = False
+    if _tiktoken_encoding is False:
+        return estimate_tokens(text)
+    return len(_tiktoken_encoding.encode(text, disallowed_special=()))
+
+
+def iter_units(pieces: Iterable[str]) -> Iterator[str]:
+    """把任意切分的文本流重新切分为句子单元，单元首尾相接即为原文
+
+    每个输入片段只保留最后一个未结束的句子作为余量与下一个片段拼接，内存占用与最长句子成正比；
+    长时间没有边界的余量超过 _STREAM_BLOCK_SIZE 时直接作为一个单元输出，交给切分器硬切分。
+    """
+    remainder = ""
+    for piece in pieces:
+        if not piece:
+            continue
+        text = remainder + piece
+        start = 0
+        for match in _BOUNDARY_PATTERN.finditer(text):
+            # 位于末尾的边界可能在下一个片段中延续（连续换行、右引号），留到下一轮
+            if match.end() == len(text):
+                break
+            yield text[start:match.end()]
+            start = match.end()
+        remainder = text[start:]
+        if len(remainder) > _STREAM_BLOCK_SIZE:
+            yield remainder
+            remainder = ""
+    if remainder:
+        yield remainder
+
+
+def iter_file(file_path, block_size=_STREAM_BLOCK_SIZE, encoding="utf-8") -> Iterator[str]:
+    """按块读取文本文件"""
+    with open(file_path, encoding=encoding, errors="replace") as f:
+        while block := f.read(block_size):
+            yield block
+
+
+class TextChunker:
+    """流式文本切分器
+
+    以句子为最小单元贪心地装入 chunk，chunk 长度不超过 chunk_size，相邻 chunk 之间保留不超过
+    chunk_overlap 的尾部句子作为重叠。超过 chunk_size 的单个句子按长度硬切分。
+    unit="tokens" 时长度按 token 计算（见 count_tokens），"chars" 时按字符数计算。
+    """
+
+    def __init__(self, chunk_size=500, chunk_overlap=100, unit="chars"):
+        if chunk_overlap >= chunk_size:
+            raise ValueError(f"chunk_overlap ({chunk_overlap}) must be smaller than chunk_size ({chunk_size})")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.length = count_tokens if unit == "tokens" else len
+
+    def split_text(self, text: str) -> list[str]:
+        return list(self.iter_chunks([text]))
+
+    def iter_records(self, pieces: Iterable[str]) -> Iterator[tuple[str, dict]]:
+        """与 MarkdownChunker 一致的 (chunk, metadata) 接口"""
+        for chunk in self.iter_chunks(pieces):
+            yield chunk, {}
+
+    def iter_chunks(self, pieces: Iterable[str]) -> Iterator[str]:
+        """从文本流（文件对象、按块读取的迭代器等）中逐个产出 chunk"""
+        window: deque[tuple[str, int]] = deque()
+        size = 0
+        fresh = False  # 窗口中是否有尚未输出过的内容
+
+        for unit in iter_units(pieces):
+            for part, part_size in self._fit(unit):
+                if size + part_size > self.chunk_size and window:
+                    if fresh:
+                        yield self._join(window)
+                    # 保留尾部不超过 chunk_overlap 的单元作为下一个 chunk 的开头
+                    while window and (size > self.chunk_overlap or size + part_size > self.chunk_size):
+                        size -= window.popleft()[1]
+                    fresh = False
+                window.append((part, part_size))
+                size += part_size
+                fresh = fresh or bool(part.strip())
+
+        if fresh:
+            yield self._join(window)
+
+    def _fit(self, unit: str) -> Iterator[tuple[str, int]]:
+        """返回 (片段, 长度)，超长单元按 chunk_size 硬切分"""
+        unit_size = self.length(unit)
+        if unit_size <= self.chunk_size:
+            yield unit, unit_size
+            return
+
+        # 先按整体比例估计每个片段的字符数，超出时逐步收缩
+        step = max(1, int(self.chunk_size * len(unit) / unit_size))
+        start = 0
+        while start < len(unit):
+            piece = unit[start:start + step]
+            piece_size = self.length(piece)
+            while piece_size > self.chunk_size and len(piece) > 1:
+                piece = piece[:max(1, len(piece) * self.chunk_size // piece_size)]
+                piece_size = self.length(piece)
+            yield piece, piece_size
+            start += len(piece)
+
+    @staticmethod
+    def _join(window) -> str:
+        return "".join(part for part, _ in window).strip()
+
+
+class MarkdownChunker:
+    """按标题结构切分 markdown（适用于 MinerU / PaddleX 等解析结果）
+
+    chunk 不跨越标题，每个 chunk 的 metadata 中记录所在的标题路径；章节内部使用 TextChunker 切分。
+    代码块中的 # 不视为标题。
+    """
+
+    def __init__(self, chunk_size=500, chunk_overlap=100, unit="chars"):
+        self.text_chunker = TextChunker(chunk_size, chunk_overlap, unit)
+
+    def split_text(self, text: str) -> list[tuple[str, dict]]:
+        return list(self.iter_records([text]))
+
+    def iter_records(self, pieces: Iterable[str]) -> Iterator[tuple[str, dict]]:
+        """逐行读取 markdown 文本流，产出 (chunk, metadata)"""
+        headings: list[tuple[int, str]] = []
+        section: list[str] = []
+        in_code = False
+
+        def flush():
+            metadata = {"headings": [title for _, title in headings]}
+            for chunk in self.text_chunker.iter_chunks(section):
+                yield chunk, metadata.copy()
+            section.clear()
+
+        for line in self._iter_lines(pieces):
+            if line.lstrip().startswith(("```", "~~~")):
+                in_code = not in_code
+            match = None if in_code else _HEADING_PATTERN.match(line)
+            if match:
+                yield from flush()
+                level = len(match.group(1))
+                while headings and headings[-1][0] >= level:
+                    headings.pop()
+                headings.append((level, match.group(2)))
+            section.append(line)
+
+        yield from flush()
+
+    @staticmethod
+    def _iter_lines(pieces: Iterable[str]) -> Iterator[str]:
+        """把任意切分的文本流还原为按行的迭代器"""
+        remainder = ""
+        for piece in pieces:
+            lines = (remainder + piece).split("\n")
+            remainder = lines.pop()
+            yield from (line + "\n" for line in lines)
+        if remainder:
+            yield remainder
+
+
+def looks_like_markdown(text: str, probe_chars: int = 20000) -> bool:
+    """文本开头部分包含 markdown 标题时视为 markdown"""
+    return re.search(r'^#{1,6}\s+\S', text[:probe_chars], re.M) is not None
+
+
+def get_chunker(params: dict | None = None, markdown: bool = False):
+    """根据参数创建切分器
+
+    params:
+        - chunk_size / chunk_overlap: chunk 长度与重叠长度
+        - chunk_unit: chars（默认）或 tokens
+        - chunk_mode: auto（默认，markdown 内容按标题切分）、text 或 markdown
+    """
+    params = params or {}
+    chunk_size = int(params.get("chunk_size", 500))
+    chunk_overlap = int(params.get("chunk_overlap", 100))
+    unit = params.get("chunk_unit", "chars")
+    mode = params.get("chunk_mode", "auto")
+    if mode == "markdown" or (mode == "auto" and markdown):
+        return MarkdownChunker(chunk_size, chunk_overlap, unit)
+    return TextChunker(chunk_size, chunk_overlap, unit)
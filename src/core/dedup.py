@@ -0,0 +1,69 @@
+import re
+import zlib
+import hashlib
+
+import numpy as np
+
+
+class DocumentFingerprint:
+    """文档内容指纹
+
+    - content_hash：归一化（合并空白）后正文的 sha256，用于精确去重
+    - signature：字符 shingle 的 MinHash 签名，用于估计两篇文档的 Jaccard 相似度
+    - bands：签名按 LSH 分段后的桶键，同一知识库内至少有一个桶相同的文档才需要比较签名
+
+    字符 shingle 不依赖分词，对中文和英文文本都适用。
+    """
+
+    NUM_PERM = 128
+    BANDS = 32
+    SHINGLE_SIZE = 5
+    _BLOCK = 8192
+
+    # multiply-shift 哈希族：h(x) = ((a * x + b) mod 2^64) >> 32，a 为奇数，乘法按 uint64 自然溢出
+    _rng = np.random.default_rng(20240601)
+    _A = _rng.integers(0, np.iinfo(np.uint64).max, size=NUM_PERM, dtype=np.uint64, endpoint=True) | np.uint64(1)
+    _B = _rng.integers(0, np.iinfo(np.uint64).max, size=NUM_PERM, dtype=np.uint64, endpoint=True)
+
+    def __init__(self, content_hash: str, signature: np.ndarray):
+        self.content_hash = content_hash
+        self.signature = signature
+
+    @classmethod
+    def from_text(cls, text: str) -> "DocumentFingerprint":
+        normalized = re.sub(r"\s+", " ", text).strip()
+        content_hash = hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+        return cls(content_hash, cls._minhash(normalized.replace(" ", "").lower()))
+
+    @classmethod
+    def _minhash(cls, text: str) -> np.ndarray:
+        k = cls.SHINGLE_SIZE
+        shingles = {zlib.crc32(text[i:i + k].encode("utf-8")) for i in range(max(1, len(text) - k + 1))}
+        values = np.fromiter(shingles, dtype=np.uint64, count=len(shingles))
+
+        # 分块计算各哈希函数下的最小值，避免 shingle 数 x 排列数 的大矩阵
+        signature = np.full(cls.NUM_PERM, np.iinfo(np.uint64).max, dtype=np.uint64)
+        for start in range(0, len(values), cls._BLOCK):
+            block = values[start:start + cls._BLOCK, None]
+            hashed = (block * cls._A + cls._B) >> np.uint64(32)
+            np.minimum(signature, hashed.min(axis=0), out=signature)
+        return signature
+
+    @property
+    def bands(self) -> list[str]:
+        rows = self.NUM_PERM // self.BANDS
+        return [
+            f"{band}:{hashlib.md5(self.signature[band * rows:(band + 1) * rows].tobytes()).hexdigest()[:16]}"
+            for band in range(self.BANDS)
+        ]
+
+    def similarity(self, signature: np.ndarray) -> float:
+        """估计的 Jaccard 相似度"""
+        return float(np.mean(self.signature == signature))
+
+    def signature_bytes(self) -> bytes:
+        return self.signature.tobytes()
+
+    @staticmethod
+    def signature_from_bytes(data: bytes) -> np.ndarray:
+        return np.frombuffer(data, dtype=np.uint64)
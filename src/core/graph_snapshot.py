@@ -0,0 +1,334 @@
+import time
+import threading
+
+import numpy as np
+
+from src.utils import logger
+
+
+class GraphSnapshot:
+    """Entity 图的进程内只读副本
+
+    - 节点名称驻留在 names / name_to_idx 中，节点用整数下标表示
+    - 邻接关系为无向 CSR（indptr / adj_nbrs / adj_edges），增量写入的边先进入 _delta，
+      累积到一定比例后重新压缩为 CSR
+    - embedding 保存为归一化的 float32 矩阵，向量检索为一次矩阵乘法
+
+    查询结果与 GraphDatabase 扩展查询的 (n, [r...], m) 投影格式一致，可直接交给 format_query_result_to_graph。
+    """
+
+    COMPACT_RATIO = 0.1
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.ready = False
+        self._building = False
+        self._pending = []
+        self._reset()
+
+    def _reset(self):
+        self.names = []
+        self.name_to_idx = {}
+        self.node_ids = []
+        self.alive = np.zeros(0, dtype=bool)
+
+        self.types = []
+        self.type_to_idx = {}
+        self.edge_ids = []
+        self.edge_src = []
+        self.edge_dst = []
+        self.edge_type = []
+        self.edge_alive = []
+        self.edge_key_to_idx = {}
+
+        self.indptr = np.zeros(1, dtype=np.int64)
+        self.adj_nbrs = np.zeros(0, dtype=np.int32)
+        self.adj_edges = np.zeros(0, dtype=np.int32)
+        self._delta = {}
+        self._delta_count = 0
+
+        self.dimension = None
+        self.embeddings = None
+        self.has_embedding = np.zeros(0, dtype=bool)
+        self.built_at = None
+
+    @property
+    def node_count(self):
+        return int(self.alive[:len(self.names)].sum())
+
+    @property
+    def edge_count(self):
+        return sum(self.edge_alive)
+
+    # ---------- 构建 ----------
+
+    def build(self, driver):
+        """从 Neo4j 全量导出 Entity 图，构建完成后替换当前快照，并重放构建期间的增量修改"""
+        with self._lock:
+            self._building = True
+            self._pending = []
+
+        start_time = time.time()
+        fresh = GraphSnapshot()
+        try:
+            with driver.session() as session:
+                result = session.run("MATCH (n:Entity) RETURN elementId(n) AS id, n.name AS name, n.embedding AS embedding")
+                for record in result:
+                    fresh._intern_node(record["name"], record["id"])
+                    if record["embedding"] is not None:
+                        fresh._set_embedding(record["name"], record["embedding"])
+
+                result = session.run("""
+                MATCH (a:Entity)-[r]->(b:Entity)
+                RETURN elementId(r) AS id, elementId(a) AS h_id, a.name AS h, elementId(b) AS t_id, b.name AS t,
+                       coalesce(r.type, type(r)) AS type
+                """)
+                for record in result:
+                    fresh._add_edge(record)
+            fresh._compact()
+        except Exception:
+            with self._lock:
+                self._building = False
+                self._pending = []
+            raise
+
+        with self._lock:
+            # 先取出待重放的修改并结束构建状态，重放时不会再被 _record 追加到正在遍历的列表中
+            pending, self._pending = self._pending, []
+            self._building = False
+            state = {k: v for k, v in fresh.__dict__.items() if k not in ("_lock", "ready", "_building", "_pending")}
+            self.__dict__.update(state)
+            self.built_at = time.time()
+            for method, args in pending:
+                getattr(self, method)(*args)
+            self.ready = True
+
+        logger.info(f"Graph snapshot built: {self.node_count} nodes, {self.edge_count} edges in {time.time() - start_time:.2f}s")
+
+    def _record(self, method, *args):
+        """构建期间的修改同时记录下来，构建完成后在新快照上重放"""
+        if self._building:
+            self._pending.append((method, args))
+
+    # ---------- 增量修改 ----------
+
+    def apply_edges(self, records):
+        """写入新增（或已存在）的边，records 包含 id, h_id, h, t_id, t, type"""
+        with self._lock:
+            self._record("apply_edges", records)
+            for record in records:
+                self._add_edge(record)
+            if self._delta_count > max(1000, self.COMPACT_RATIO * len(self.edge_ids)):
+                self._compact()
+
+    def set_embeddings(self, entity_embedding_pairs):
+        with self._lock:
+            self._record("set_embeddings", entity_embedding_pairs)
+            for name, embedding in entity_embedding_pairs:
+                self._set_embedding(name, embedding)
+
+    def remove_node(self, name):
+        """删除节点及其所有关系（对应 DETACH DELETE）"""
+        with self._lock:
+            self._record("remove_node", name)
+            idx = self.name_to_idx.get(name)
+            if idx is None or not self.alive[idx]:
+                return
+            for edge, _ in list(self._neighbors(idx)):
+                self.edge_alive[edge] = False
+                key = (self.edge_src[edge], self.edge_dst[edge], self.edge_type[edge])
+                self.edge_key_to_idx.pop(key, None)
+            self.alive[idx] = False
+            self.has_embedding[idx] = False
+
+    def clear(self):
+        with self._lock:
+            self._record("clear")
+            self._reset()
+            self.built_at = time.time()
+
+    def _ensure_capacity(self, size):
+        if size <= len(self.alive):
+            return
+        capacity = max(1024, len(self.alive) * 2, size)
+        alive = np.zeros(capacity, dtype=bool)
+        alive[:len(self.alive)] = self.alive
+        self.alive = alive
+        has_embedding = np.zeros(capacity, dtype=bool)
+        has_embedding[:len(self.has_embedding)] = self.has_embedding
+        self.has_embedding = has_embedding
+        if self.embeddings is not None:
+            embeddings = np.zeros((capacity, self.dimension), dtype=np.float32)
+            embeddings[:len(self.embeddings)] = self.embeddings
+            self.embeddings = embeddings
+
+    def _intern_node(self, name, element_id):
+        idx = self.name_to_idx.get(name)
+        if idx is None:
+            idx = len(self.names)
+            self._ensure_capacity(idx + 1)
+            self.names.append(name)
+            self.node_ids.append(element_id)
+            self.name_to_idx[name] = idx
+        else:
+            self.node_ids[idx] = element_id
+        self.alive[idx] = True
+        return idx
+
+    def _intern_type(self, rel_type):
+        idx = self.type_to_idx.get(rel_type)
+        if idx is None:
+            idx = len(self.types)
+            self.types.append(rel_type)
+            self.type_to_idx[rel_type] = idx
+        return idx
+
+    def _add_edge(self, record):
+        src = self._intern_node(record["h"], record["h_id"])
+        dst = self._intern_node(record["t"], record["t_id"])
+        key = (src, dst, self._intern_type(record["type"]))
+        if key in self.edge_key_to_idx:
+            return
+
+        edge = len(self.edge_ids)
+        self.edge_ids.append(record["id"])
+        self.edge_src.append(src)
+        self.edge_dst.append(dst)
+        self.edge_type.append(key[2])
+        self.edge_alive.append(True)
+        self.edge_key_to_idx[key] = edge
+        self._delta.setdefault(src, []).append(edge)
+        if dst != src:
+            self._delta.setdefault(dst, []).append(edge)
+        self._delta_count += 1
+
+    def _set_embedding(self, name, embedding):
+        idx = self.name_to_idx.get(name)
+        if idx is None:
+            return
+        vector = np.asarray(embedding, dtype=np.float32)
+        if self.embeddings is None:
+            self.dimension = len(vector)
+            self.embeddings = np.zeros((len(self.alive), self.dimension), dtype=np.float32)
+        if len(vector) != self.dimension:
+            return
+        norm = np.linalg.norm(vector)
+        self.embeddings[idx] = vector / norm if norm else vector
+        self.has_embedding[idx] = True
+
+    def _compact(self):
+        """将所有存活的边重新压缩为无向 CSR"""
+        n = len(self.names)
+        edges = np.flatnonzero(np.asarray(self.edge_alive, dtype=bool))
+        src = np.asarray(self.edge_src, dtype=np.int32)[edges]
+        dst = np.asarray(self.edge_dst, dtype=np.int32)[edges]
+
+        nodes = np.concatenate([src, dst])
+        order = np.argsort(nodes, kind="stable")
+        self.indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(nodes, minlength=n), out=self.indptr[1:])
+        self.adj_nbrs = np.concatenate([dst, src])[order].astype(np.int32)
+        self.adj_edges = np.concatenate([edges, edges])[order].astype(np.int32)
+        self._delta = {}
+        self._delta_count = 0
+
+    # ---------- 查询 ----------
+
+    def _neighbors(self, idx):
+        """遍历节点的 (边, 邻居)，包含 CSR 与尚未压缩的增量边，跳过已删除的边"""
+        if idx + 1 < len(self.indptr):
+            start, end = self.indptr[idx], self.indptr[idx + 1]
+            for edge, nbr in zip(self.adj_edges[start:end].tolist(), self.adj_nbrs[start:end].tolist()):
+                if self.edge_alive[edge]:
+                    yield edge, nbr
+        for edge in self._delta.get(idx, ()):
+            if self.edge_alive[edge]:
+                src, dst = self.edge_src[edge], self.edge_dst[edge]
+                yield edge, dst if src == idx else src
+
+    def vector_search(self, embedding, top_k=10):
+        """返回与 embedding 余弦相似度最高的 [(节点下标, 分数), ...]"""
+        n = len(self.names)
+        if self.embeddings is None or n == 0:
+            return []
+        query = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+
+        valid = self.has_embedding[:n] & self.alive[:n]
+        k = min(top_k, int(valid.sum()))
+        if k == 0:
+            return []
+        scores = self.embeddings[:n] @ query
+        scores[~valid] = -np.inf
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(i), float(scores[i])) for i in top]
+
+    def expand(self, start, hops=2, fanout=20, limit=100):
+        """从 start 逐跳扩展，语义与 GraphDatabase._expansion_cypher 一致，返回 [(边下标元组, 终点)]"""
+        results = []
+        frontier = [((), start)]
+        for _ in range(max(1, int(hops))):
+            next_frontier = []
+            for rels, node in frontier:
+                taken = 0
+                for edge, nbr in self._neighbors(node):
+                    if taken >= fanout:
+                        break
+                    if edge in rels:
+                        continue
+                    next_frontier.append((rels + (edge,), nbr))
+                    taken += 1
+            results.extend(next_frontier)
+            frontier = next_frontier
+            if len(results) >= limit or not frontier:
+                break
+        return results[:limit]
+
+    def _to_rows(self, start, paths):
+        """转换为与 GraphDatabase 扩展查询投影一致的 (n, [r...], m) 行"""
+        def node(idx):
+            return {"id": self.node_ids[idx], "name": self.names[idx]}
+
+        def relationship(e):
+            src, dst = self.edge_src[e], self.edge_dst[e]
+            return {
+                "id": self.edge_ids[e],
+                "type": self.types[self.edge_type[e]],
+                "source_id": self.node_ids[src],
+                "source_name": self.names[src],
+                "target_id": self.node_ids[dst],
+                "target_name": self.names[dst],
+            }
+
+        return [[node(start), [relationship(e) for e in rels], node(end)] for rels, end in paths]
+
+    def query_by_embedding(self, embedding, threshold=0.9, max_entities=5, hops=2, fanout=20, limit=100, top_k=10):
+        """向量检索命中实体并扩展邻域，对应 GraphDatabase.query_node"""
+        with self._lock:
+            matches = [idx for idx, score in self.vector_search(embedding, top_k) if score > threshold][:max_entities]
+            rows = []
+            for idx in matches:
+                rows.extend(self._to_rows(idx, self.expand(idx, hops, fanout, limit)))
+            return rows
+
+    def query_entity(self, entity_name, hops=2, fanout=20, limit=100):
+        """按名称扩展邻域，对应 GraphDatabase.query_specific_entity"""
+        with self._lock:
+            idx = self.name_to_idx.get(entity_name)
+            if idx is None or not self.alive[idx]:
+                return []
+            return self._to_rows(idx, self.expand(idx, hops, fanout, limit))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "ready": self.ready,
+                "nodes": self.node_count,
+                "edges": self.edge_count,
+                "embedded_nodes": int((self.has_embedding[:len(self.names)] & self.alive[:len(self.names)]).sum()),
+                "pending_delta_edges": self._delta_count,
+                "built_at": self.built_at,
+            }
@@ -1,14 +1,20 @@
 import os
 import json
+import time
+import asyncio
+import threading
 import warnings
 import traceback
+import contextlib
 
 from neo4j import GraphDatabase as GD
+from neo4j import AsyncGraphDatabase as AsyncGD
 from neo4j import Query
 
 from src import config
+from src.core.graph_snapshot import GraphSnapshot
 from src.models.embedding import get_embedding_model
-from src.utils import logger
+from src.utils import logger, hashstr
 
 warnings.filterwarnings("ignore", category=UserWarning)
 
@@ -18,11 +24,29 @@ UIE_MODEL = None
 class GraphDatabase:
     def __init__(self):
         self.driver = None
+        self.async_driver = None
         self.files = []
         self.status = "closed"
         self.kgdb_name = "neo4j"
         self.embed_model_name = os.getenv("GRAPH_EMBED_MODEL_NAME") or "siliconflow/BAAI/bge-m3"
         self.embed_model = get_embedding_model(self.embed_model_name)
+        self.import_batch_size = int(os.getenv("GRAPH_IMPORT_BATCH_SIZE", 1000))
+        self._constraint_ready = False
+        self._index_cache = {}  # index_name -> (exists, checked_at)
+
+        # 图统计信息缓存：写入路径增量更新，后台按最小间隔全量校准
+        self._graph_stats = None
+        self._graph_stats_refreshed_at = 0
+        self._graph_stats_lock = threading.Lock()
+        self._graph_stats_refreshing = False
+        self.graph_stats_interval = float(os.getenv("GRAPH_STATS_REFRESH_INTERVAL", 60))
+
+        # 可选的进程内只读副本，启用后 query_node / query_specific_entity 直接在内存中完成
+        snapshot_enabled = os.getenv("GRAPH_SNAPSHOT_ENABLED", "false").lower() in ("1", "true", "yes")
+        self.snapshot = GraphSnapshot() if snapshot_enabled else None
+
+        # 后台节点索引任务：job_id -> 进度信息
+        self.index_jobs = {}
         self.work_dir = os.path.join(config.save_dir, "knowledge_graph", self.kgdb_name)
         os.makedirs(self.work_dir, exist_ok=True)
 
@@ -37,12 +61,20 @@ class GraphDatabase:
         username = os.environ.get("NEO4J_USERNAME", "neo4j")
         password = os.environ.get("NEO4J_PASSWORD", "0123456789")
         logger.info(f"Connecting to Neo4j: {uri}/{self.kgdb_name}")
+        # 同步驱动与异步驱动共用连接池配置
+        pool_options = {
+            "max_connection_pool_size": int(os.getenv("NEO4J_MAX_POOL_SIZE", 50)),
+            "connection_acquisition_timeout": float(os.getenv("NEO4J_POOL_ACQUIRE_TIMEOUT", 60)),
+        }
         try:
-            self.driver = GD.driver(f"{uri}/{self.kgdb_name}", auth=(username, password))
+            self.driver = GD.driver(f"{uri}/{self.kgdb_name}", auth=(username, password), **pool_options)
+            self.async_driver = AsyncGD.driver(f"{uri}/{self.kgdb_name}", auth=(username, password), **pool_options)
             self.status = "open"
             logger.info(f"Connected to Neo4j: {self.get_graph_info(self.kgdb_name)}")
             # 连接成功后保存图数据库信息
             self.save_graph_info(self.kgdb_name)
+            if self.snapshot is not None:
+                self.refresh_snapshot(background=True)
         except Exception as e:
             logger.error(f"Failed to connect to Neo4j: {e}, {uri}, {self.kgdb_name}, {username}, {password}")
 
@@ -51,21 +83,47 @@ class GraphDatabase:
         assert self.driver is not None, "Database is not connected"
         self.driver.close()
 
+    async def aclose(self):
+        """关闭同步与异步数据库连接"""
+        self.close()
+        if self.async_driver is not None:
+            await self.async_driver.close()
+
     def is_running(self):
         """检查图数据库是否正在运行"""
         return self.status == "open"
 
+    # 只返回 id / name / type 等展示所需字段，embedding 不会随结果传输
+    _SAMPLE_NODES_QUERY = """
+        MATCH (n)-[r]->(m)
+        RETURN {id: elementId(n), name: coalesce(n.name, 'unknown')} AS n,
+               {id: elementId(r), type: coalesce(r.type, type(r))} AS r,
+               {id: elementId(m), name: coalesce(m.name, 'unknown')} AS m
+        LIMIT $num
+        """
+
     def get_sample_nodes(self, kgdb_name='neo4j', num=50):
         """获取指定数据库的 num 个节点信息"""
         assert self.driver is not None, "Database is not connected"
         self.use_database(kgdb_name)
         def query(tx, num):
-            result = tx.run("MATCH (n)-[r]->(m) RETURN n, r, m LIMIT $num", num=int(num))
+            result = tx.run(self._SAMPLE_NODES_QUERY, num=int(num))
             return result.values()
 
         with self.driver.session() as session:
             return session.execute_read(query, num)
 
+    async def aget_sample_nodes(self, kgdb_name='neo4j', num=50):
+        """get_sample_nodes 的异步版本"""
+        assert self.async_driver is not None, "Database is not connected"
+        self.use_database(kgdb_name)
+        async def query(tx, num):
+            result = await tx.run(self._SAMPLE_NODES_QUERY, num=int(num))
+            return await result.values()
+
+        async with self.async_driver.session() as session:
+            return await session.execute_read(query, num)
+
     def create_graph_database(self, kgdb_name):
         """创建新的数据库，如果已存在则返回已有数据库的名称"""
         assert self.driver is not None, "Database is not connected"
@@ -88,153 +146,433 @@ class GraphDatabase:
             self.start()
 
     def txt_add_entity(self, triples, kgdb_name='neo4j'):
-        """添加实体三元组"""
+        """添加实体三元组，关系类型取自三元组中的 r"""
         assert self.driver is not None, "Database is not connected"
         self.use_database(kgdb_name)
-        def create(tx, triples):
-            for triple in triples:
-                h = triple['h']
-                t = triple['t']
-                r = triple['r']
+
+        # 关系类型无法参数化，按类型分组后各自批量写入
+        rows_by_type = {}
+        for triple in triples:
+            rel_type = triple['r'].replace(" ", "_").replace("`", "")
+            rows_by_type.setdefault(rel_type, []).append({"h": triple['h'], "t": triple['t']})
+
+        with self.driver.session() as session:
+            self._ensure_entity_constraint(session)
+            for rel_type, rows in rows_by_type.items():
                 query = (
-                    "MERGE (a:Entity {name: $h}) "
-                    "MERGE (b:Entity {name: $t}) "
-                    "MERGE (a)-[:" + r.replace(" ", "_") + "]->(b)"
+                    "UNWIND $rows AS row "
+                    "MERGE (a:Entity {name: row.h}) "
+                    "MERGE (b:Entity {name: row.t}) "
+                    "MERGE (a)-[:`" + rel_type + "`]->(b)"
                 )
-                tx.run(query, h=h, t=t)
+                stats = self._write_in_batches(session, query, rows, label=f"triples[{rel_type}]")
+                self._update_graph_stats(stats["nodes_created"], stats["relationships_created"], stats["nodes_created"])
+                self._sync_snapshot_edges([{**row, "r": rel_type} for row in rows])
+
+    def _ensure_entity_constraint(self, session):
+        """创建 Entity.name 唯一约束，使 MERGE 走索引而不是全标签扫描"""
+        if self._constraint_ready:
+            return
+        try:
+            session.run("CREATE CONSTRAINT entity_name_unique IF NOT EXISTS FOR (n:Entity) REQUIRE n.name IS UNIQUE").consume()
+            self._constraint_ready = True
+        except Exception as e:
+            # 已有重复的实体名称时约束无法创建，仍可继续导入，只是 MERGE 会变慢
+            logger.warning(f"创建 Entity.name 唯一约束失败: {e}")
+
+    def _write_in_batches(self, session, query, rows, batch_size=None, label="rows"):
+        """将 rows 按批次以 UNWIND $rows 参数写入，返回导入统计（含新建节点、关系数量）"""
+        batch_size = batch_size or self.import_batch_size
+        start_time = time.time()
+        nodes_created = relationships_created = 0
+        for i in range(0, len(rows), batch_size):
+            batch = rows[i:i + batch_size]
+            summary = session.execute_write(lambda tx, batch=batch: tx.run(query, rows=batch).consume())
+            nodes_created += summary.counters.nodes_created
+            relationships_created += summary.counters.relationships_created
+
+        elapsed = time.time() - start_time
+        stats = {
+            "rows": len(rows),
+            "seconds": round(elapsed, 3),
+            "rows_per_sec": round(len(rows) / elapsed, 1) if elapsed else None,
+            "nodes_created": nodes_created,
+            "relationships_created": relationships_created,
+        }
+        logger.info(f"Imported {label}: {stats['rows']} rows in {stats['seconds']}s ({stats['rows_per_sec']} rows/s)")
+        return stats
 
+    def import_triples(self, triples, batch_size=None):
+        """批量导入 {h, r, t} 三元组（关系统一为 RELATION，类型存于 type 属性），返回导入统计"""
+        assert self.driver is not None, "Database is not connected"
+        rows = [{"h": entry['h'], "t": entry['t'], "r": entry['r']} for entry in triples]
+        with self.driver.session() as session:
+            self._ensure_entity_constraint(session)
+            stats = self._write_in_batches(session, """
+                UNWIND $rows AS row
+                MERGE (h:Entity {name: row.h})
+                MERGE (t:Entity {name: row.t})
+                MERGE (h)-[r:RELATION {type: row.r}]->(t)
+                """, rows, batch_size=batch_size, label="triples")
+        # 新建的节点都还没有 embedding
+        self._update_graph_stats(stats["nodes_created"], stats["relationships_created"], stats["nodes_created"])
+        self._sync_snapshot_edges(rows)
+        return stats
+
+    def set_embeddings(self, entity_embedding_pairs, batch_size=None):
+        """批量设置实体的嵌入向量"""
+        assert self.driver is not None, "Database is not connected"
+        rows = [{"name": name, "embedding": embedding} for name, embedding in entity_embedding_pairs]
+        with self.driver.session() as session:
+            stats = self._write_in_batches(session, """
+                UNWIND $rows AS row
+                MATCH (e:Entity {name: row.name})
+                CALL db.create.setNodeVectorProperty(e, 'embedding', row.embedding)
+                """, rows, batch_size=batch_size, label="embeddings")
+        # 调用方只为没有 embedding 的节点写入向量，偏差由后台校准修正
+        self._update_graph_stats(unindexed=-len(rows))
+        if self.snapshot is not None:
+            self.snapshot.set_embeddings(entity_embedding_pairs)
+        return stats
+
+    async def _awrite_in_batches(self, session, query, rows, batch_size=None, label="rows"):
+        """_write_in_batches 的异步版本"""
+        async def work(tx, batch):
+            result = await tx.run(query, rows=batch)
+            return await result.consume()
+
+        batch_size = batch_size or self.import_batch_size
+        start_time = time.time()
+        nodes_created = relationships_created = 0
+        for i in range(0, len(rows), batch_size):
+            summary = await session.execute_write(work, rows[i:i + batch_size])
+            nodes_created += summary.counters.nodes_created
+            relationships_created += summary.counters.relationships_created
+
+        elapsed = time.time() - start_time
+        stats = {
+            "rows": len(rows),
+            "seconds": round(elapsed, 3),
+            "rows_per_sec": round(len(rows) / elapsed, 1) if elapsed else None,
+            "nodes_created": nodes_created,
+            "relationships_created": relationships_created,
+        }
+        logger.info(f"Imported {label}: {stats['rows']} rows in {stats['seconds']}s ({stats['rows_per_sec']} rows/s)")
+        return stats
+
+    async def aimport_triples(self, triples, batch_size=None):
+        """import_triples 的异步版本"""
+        assert self.async_driver is not None, "Database is not connected"
+        if not self._constraint_ready:
+            await asyncio.to_thread(self._ensure_entity_constraint_once)
+
+        rows = [{"h": entry['h'], "t": entry['t'], "r": entry['r']} for entry in triples]
+        async with self.async_driver.session() as session:
+            stats = await self._awrite_in_batches(session, """
+                UNWIND $rows AS row
+                MERGE (h:Entity {name: row.h})
+                MERGE (t:Entity {name: row.t})
+                MERGE (h)-[r:RELATION {type: row.r}]->(t)
+                """, rows, batch_size=batch_size, label="triples")
+        self._update_graph_stats(stats["nodes_created"], stats["relationships_created"], stats["nodes_created"])
+        await self._async_snapshot_edges(rows)
+        return stats
+
+    async def aset_embeddings(self, entity_embedding_pairs, batch_size=None):
+        """set_embeddings 的异步版本"""
+        assert self.async_driver is not None, "Database is not connected"
+        rows = [{"name": name, "embedding": embedding} for name, embedding in entity_embedding_pairs]
+        async with self.async_driver.session() as session:
+            stats = await self._awrite_in_batches(session, """
+                UNWIND $rows AS row
+                MATCH (e:Entity {name: row.name})
+                CALL db.create.setNodeVectorProperty(e, 'embedding', row.embedding)
+                """, rows, batch_size=batch_size, label="embeddings")
+        self._update_graph_stats(unindexed=-len(rows))
+        if self.snapshot is not None:
+            self.snapshot.set_embeddings(entity_embedding_pairs)
+        return stats
+
+    def _ensure_entity_constraint_once(self):
         with self.driver.session() as session:
-            session.execute_write(create, triples)
+            self._ensure_entity_constraint(session)
+
+    # 按 {h, t, r} 查回刚写入的关系（走 Entity.name 索引），用于增量更新快照
+    _SNAPSHOT_EDGES_QUERY = """
+        UNWIND $rows AS row
+        MATCH (h:Entity {name: row.h})-[r]->(t:Entity {name: row.t})
+        WHERE coalesce(r.type, type(r)) = row.r
+        RETURN elementId(r) AS id, elementId(h) AS h_id, h.name AS h, elementId(t) AS t_id, t.name AS t,
+               coalesce(r.type, type(r)) AS type
+        """
+
+    def snapshot_ready(self):
+        return self.snapshot is not None and self.snapshot.ready
+
+    def refresh_snapshot(self, background=False):
+        """从 Neo4j 全量重建进程内快照"""
+        if self.snapshot is None:
+            return
+
+        def build():
+            try:
+                self.snapshot.build(self.driver)
+            except Exception as e:
+                logger.error(f"构建图快照失败：{e}, {traceback.format_exc()}")
+
+        if background:
+            threading.Thread(target=build, daemon=True).start()
+        else:
+            build()
+
+    def _sync_snapshot_edges(self, rows):
+        if self.snapshot is None or not rows:
+            return
+        try:
+            with self.driver.session() as session:
+                records = session.execute_read(lambda tx: tx.run(self._SNAPSHOT_EDGES_QUERY, rows=rows).data())
+            self.snapshot.apply_edges(records)
+        except Exception as e:
+            logger.warning(f"增量更新图快照失败，将在下次重建时修正：{e}")
+
+    async def _async_snapshot_edges(self, rows):
+        if self.snapshot is None or not rows:
+            return
+
+        async def query(tx):
+            result = await tx.run(self._SNAPSHOT_EDGES_QUERY, rows=rows)
+            return await result.data()
+
+        try:
+            async with self.async_driver.session() as session:
+                records = await session.execute_read(query)
+            self.snapshot.apply_edges(records)
+        except Exception as e:
+            logger.warning(f"增量更新图快照失败，将在下次重建时修正：{e}")
 
     async def txt_add_vector_entity(self, triples, kgdb_name='neo4j'):
         """添加实体三元组"""
         assert self.driver is not None, "Database is not connected"
         self.use_database(kgdb_name)
-        def _index_exists(tx, index_name):
-            """检查索引是否存在"""
-            result = tx.run("SHOW INDEXES")
-            for record in result:
-                if record["name"] == index_name:
-                    return True
-            return False
+        cur_embed_info = self._check_embed_model()
 
-        def _create_graph(tx, data):
-            """添加一个三元组"""
-            for entry in data:
-                tx.run("""
-                MERGE (h:Entity {name: $h})
-                MERGE (t:Entity {name: $t})
-                MERGE (h)-[r:RELATION {type: $r}]->(t)
-                """, h=entry['h'], t=entry['t'], r=entry['r'])
+        logger.info(f"Adding entity to {kgdb_name}")
+        await self.aimport_triples(triples)
 
-        def _create_vector_index(tx, dim):
-            """创建向量索引"""
-            # NOTE 这里是否是会重复构建索引？
-            index_name = "entityEmbeddings"
-            if not _index_exists(tx, index_name):
-                tx.run(f"""
-                CREATE VECTOR INDEX {index_name}
-                FOR (n: Entity) ON (n.embedding)
-                OPTIONS {{indexConfig: {{
-                `vector.dimensions`: {dim},
-                `vector.similarity_function`: 'cosine'
-                }} }};
-                """)
-
-        def _get_nodes_without_embedding(tx, entity_names):
-            """获取没有embedding的节点列表"""
-            # 构建参数字典，将列表转换为"param0"、"param1"等键值对形式
-            params = {f"param{i}": name for i, name in enumerate(entity_names)}
-
-            # 构建查询参数列表
-            param_placeholders = ", ".join([f"${key}" for key in params.keys()])
-
-            # 执行查询
-            result = tx.run(f"""
-            MATCH (n:Entity)
-            WHERE n.name IN [{param_placeholders}] AND n.embedding IS NULL
-            RETURN n.name AS name
-            """, params)
+        logger.info(f"Creating vector index for {kgdb_name} with {config.embed_model}")
+        await asyncio.to_thread(self._ensure_vector_index, cur_embed_info['dimension'])
 
-            return [record["name"] for record in result]
+        # 收集所有需要处理的实体名称，去重
+        all_entities = list(dict.fromkeys(name for entry in triples for name in (entry['h'], entry['t'])))
+        await self._embed_missing_entities(all_entities)
 
-        def _batch_set_embeddings(tx, entity_embedding_pairs):
-            """批量设置实体的嵌入向量"""
-            for entity_name, embedding in entity_embedding_pairs:
-                tx.run("""
-                MATCH (e:Entity {name: $name})
-                CALL db.create.setNodeVectorProperty(e, 'embedding', $embedding)
-                """, name=entity_name, embedding=embedding)
+        # 数据添加完成后保存图信息
+        self.save_graph_info()
 
-        # 判断模型名称是否匹配
+    def _check_embed_model(self):
+        """判断模型名称是否匹配，返回当前 embedding 模型信息"""
         cur_embed_info = config.embed_model_names[config.embed_model]
         self.embed_model_name = self.embed_model_name or cur_embed_info.get('name')
         assert self.embed_model_name == cur_embed_info.get('name') or self.embed_model_name is None, \
             f"embed_model_name={self.embed_model_name}, {cur_embed_info.get('name')=}"
+        return cur_embed_info
 
-        with self.driver.session() as session:
-            logger.info(f"Adding entity to {kgdb_name}")
-            session.execute_write(_create_graph, triples)
-            logger.info(f"Creating vector index for {kgdb_name} with {config.embed_model}")
-            session.execute_write(_create_vector_index, cur_embed_info['dimension'])
-
-            # 收集所有需要处理的实体名称，去重
-            all_entities = []
-            for entry in triples:
-                if entry['h'] not in all_entities:
-                    all_entities.append(entry['h'])
-                if entry['t'] not in all_entities:
-                    all_entities.append(entry['t'])
-
-            # 筛选出没有embedding的节点
-            nodes_without_embedding = session.execute_read(_get_nodes_without_embedding, all_entities)
-            if not nodes_without_embedding:
-                logger.info("所有实体已有embedding，无需重新计算")
-                return
-
-            logger.info(f"需要为{len(nodes_without_embedding)}/{len(all_entities)}个实体计算embedding")
+    def _index_exists(self, index_name, session=None):
+        """检查索引是否存在，结果会被缓存：存在则一直有效，不存在时最多每 60 秒重新检查一次"""
+        exists, checked_at = self._index_cache.get(index_name, (False, 0))
+        if exists or time.time() - checked_at < 60:
+            return exists
 
-            # 批量处理实体
-            max_batch_size = 1024  # 限制此部分的主要是内存大小 1024 * 1024 * 4 / 1024 / 1024 = 4GB
-            total_entities = len(nodes_without_embedding)
-
-            for i in range(0, total_entities, max_batch_size):
-                batch_entities = nodes_without_embedding[i:i+max_batch_size]
-                logger.debug(
-                    f"Processing entities batch "
-                    f"{i//max_batch_size + 1}/{(total_entities-1)//max_batch_size + 1} "
-                    f"({len(batch_entities)} entities)"
-                )
+        def query(tx):
+            result = tx.run("SHOW INDEXES YIELD name WHERE name = $name RETURN count(*) AS count", name=index_name)
+            return result.single()["count"] > 0
 
-                # 批量获取嵌入向量
-                batch_embeddings = await self.aget_embedding(batch_entities)
+        if session is None:
+            with self.driver.session() as session:
+                exists = session.execute_read(query)
+        else:
+            exists = session.execute_read(query)
+        self._index_cache[index_name] = (exists, time.time())
+        return exists
 
-                # 将实体名称和嵌入向量配对
-                entity_embedding_pairs = list(zip(batch_entities, batch_embeddings))
+    def _ensure_vector_index(self, dim, index_name="entityEmbeddings"):
+        """创建向量索引（已存在则跳过）"""
+        def _create_vector_index(tx, dim):
+            tx.run(f"""
+            CREATE VECTOR INDEX {index_name} IF NOT EXISTS
+            FOR (n: Entity) ON (n.embedding)
+            OPTIONS {{indexConfig: {{
+            `vector.dimensions`: {dim},
+            `vector.similarity_function`: 'cosine'
+            }} }};
+            """)
 
-                # 批量写入数据库
-                session.execute_write(_batch_set_embeddings, entity_embedding_pairs)
+        with self.driver.session() as session:
+            if self._index_exists(index_name, session):
+                return
+            session.execute_write(_create_vector_index, dim)
+        self._index_cache[index_name] = (True, time.time())
 
-            # 数据添加完成后保存图信息
-            self.save_graph_info()
+    def _get_nodes_without_embedding(self, entity_names):
+        """从给定实体中筛选出还没有 embedding 的节点"""
+        def query(tx, entity_names):
+            result = tx.run("""
+            UNWIND $names AS name
+            MATCH (n:Entity {name: name})
+            WHERE n.embedding IS NULL
+            RETURN n.name AS name
+            """, names=entity_names)
+            return [record["name"] for record in result]
 
-    async def jsonl_file_add_entity(self, file_path, kgdb_name='neo4j'):
+        with self.driver.session() as session:
+            return session.execute_read(query, entity_names)
+
+    async def _aget_nodes_without_embedding(self, entity_names):
+        """_get_nodes_without_embedding 的异步版本"""
+        async def query(tx, entity_names):
+            result = await tx.run("""
+            UNWIND $names AS name
+            MATCH (n:Entity {name: name})
+            WHERE n.embedding IS NULL
+            RETURN n.name AS name
+            """, names=entity_names)
+            return [record["name"] async for record in result]
+
+        async with self.async_driver.session() as session:
+            return await session.execute_read(query, entity_names)
+
+    async def _embed_missing_entities(self, entity_names, max_batch_size=1024):
+        """为还没有 embedding 的实体计算并写入向量，返回处理的实体数量"""
+        # 筛选出没有embedding的节点
+        nodes_without_embedding = await self._aget_nodes_without_embedding(entity_names)
+        if not nodes_without_embedding:
+            logger.info("所有实体已有embedding，无需重新计算")
+            return 0
+
+        logger.info(f"需要为{len(nodes_without_embedding)}/{len(entity_names)}个实体计算embedding")
+
+        # 批量处理实体，限制此部分的主要是内存大小 1024 * 1024 * 4 / 1024 / 1024 = 4GB
+        total_entities = len(nodes_without_embedding)
+        for i in range(0, total_entities, max_batch_size):
+            batch_entities = nodes_without_embedding[i:i+max_batch_size]
+            logger.debug(
+                f"Processing entities batch "
+                f"{i//max_batch_size + 1}/{(total_entities-1)//max_batch_size + 1} "
+                f"({len(batch_entities)} entities)"
+            )
+
+            # 批量获取嵌入向量
+            batch_embeddings = await self.aget_embedding(batch_entities)
+
+            # 将实体名称和嵌入向量配对后批量写入数据库
+            entity_embedding_pairs = list(zip(batch_entities, batch_embeddings))
+            await self.aset_embeddings(entity_embedding_pairs)
+
+        return total_entities
+
+    def _checkpoint_path(self, file_path):
+        stat = os.stat(file_path)
+        key = hashstr(f"{os.path.abspath(file_path)}:{stat.st_size}", length=16)
+        return os.path.join(self.work_dir, "import_checkpoints", f"{key}.json")
+
+    def _load_checkpoint(self, file_path):
+        checkpoint_path = self._checkpoint_path(file_path)
+        if not os.path.exists(checkpoint_path):
+            return {"offset": 0, "lines": 0}
+        with open(checkpoint_path, encoding='utf-8') as f:
+            return json.load(f)
+
+    def _save_checkpoint(self, file_path, offset, lines):
+        checkpoint_path = self._checkpoint_path(file_path)
+        os.makedirs(os.path.dirname(checkpoint_path), exist_ok=True)
+        tmp_path = checkpoint_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"file_path": file_path, "offset": offset, "lines": lines, "updated_at": time.time()}, f)
+        os.replace(tmp_path, checkpoint_path)
+
+    async def jsonl_file_add_entity(self, file_path, kgdb_name='neo4j', chunk_lines=None):
+        """流式导入 JSONL 三元组文件
+
+        按 chunk_lines 行分块读取，图写入与 embedding 计算两个阶段流水线并行：
+        第 N 块计算 embedding 时第 N+1 块已在写入 Neo4j。每块两个阶段都完成后
+        记录文件字节偏移量，中断后再次导入同一文件会从断点继续。
+        """
         assert self.driver is not None, "Database is not connected"
         self.status = "processing"
         kgdb_name = kgdb_name or 'neo4j'
         self.use_database(kgdb_name)  # 切换到指定数据库
+        chunk_lines = chunk_lines or int(os.getenv("GRAPH_IMPORT_CHUNK_LINES", 5000))
+
+        checkpoint = self._load_checkpoint(file_path)
+        if checkpoint["offset"]:
+            logger.info(f"Resuming import of {file_path} from line {checkpoint['lines']} (offset {checkpoint['offset']})")
         logger.info(f"Start adding entity to {kgdb_name} with {file_path}")
 
-        def read_triples(file_path):
-            with open(file_path, encoding='utf-8') as file:
-                for line in file:
+        cur_embed_info = self._check_embed_model()
+        await asyncio.to_thread(self._ensure_vector_index, cur_embed_info['dimension'])
+
+        def read_chunks(offset, lines):
+            """从 offset 开始按块读取三元组，产出 (triples, 块结束偏移量, 累计行数)"""
+            with open(file_path, 'rb') as file:
+                file.seek(offset)
+                triples = []
+                while line := file.readline():
+                    offset += len(line)
+                    lines += 1
                     if line.strip():
-                        yield json.loads(line.strip())
-
-        triples = list(read_triples(file_path))
-
-        await self.txt_add_vector_entity(triples, kgdb_name)
+                        triples.append(json.loads(line))
+                    if len(triples) >= chunk_lines:
+                        yield triples, offset, lines
+                        triples = []
+                if triples or lines:
+                    yield triples, offset, lines
+
+        # 只保存实体名称的摘要用于去重，内存占用与实体数线性相关而与名称长度无关
+        seen_entities = set()
+        embed_queue = asyncio.Queue(maxsize=2)
+        start_time = time.time()
+
+        async def write_stage():
+            chunks = read_chunks(checkpoint["offset"], checkpoint["lines"])
+            while chunk := await asyncio.to_thread(next, chunks, None):
+                triples, offset, lines = chunk
+                if triples:
+                    await self.aimport_triples(triples)
+
+                new_entities = []
+                for entry in triples:
+                    for name in (entry['h'], entry['t']):
+                        digest = hashstr(name, length=16)
+                        if digest not in seen_entities:
+                            seen_entities.add(digest)
+                            new_entities.append(name)
+                await embed_queue.put((new_entities, offset, lines))
+            # 只在正常结束时发送结束标记，任一阶段出错时由下方统一取消两个阶段
+            await embed_queue.put(None)
+
+        async def embed_stage():
+            while (item := await embed_queue.get()) is not None:
+                new_entities, offset, lines = item
+                if new_entities:
+                    await self._embed_missing_entities(new_entities)
+                self._save_checkpoint(file_path, offset, lines)
+                elapsed = time.time() - start_time
+                logger.info(f"Imported {lines} lines of {file_path} ({(lines - checkpoint['lines']) / elapsed:.1f} lines/s)")
+
+        stages = [asyncio.create_task(write_stage()), asyncio.create_task(embed_stage())]
+        try:
+            await asyncio.gather(*stages)
+        except BaseException:
+            # 一个阶段失败或导入被取消时，另一个阶段可能阻塞在队列上，一并取消
+            for stage in stages:
+                stage.cancel()
+            await asyncio.gather(*stages, return_exceptions=True)
+            self.status = "open"
+            raise
 
+        # 空文件不会产生任何块，也就没有断点文件
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self._checkpoint_path(file_path))
         self.status = "open"
         # 更新并保存图数据库信息
         self.save_graph_info()
@@ -249,6 +587,12 @@ class GraphDatabase:
                 session.execute_write(self._delete_specific_entity, entity_name)
             else:
                 session.execute_write(self._delete_all_entities)
+        if self.snapshot is not None:
+            if entity_name:
+                self.snapshot.remove_node(entity_name)
+            else:
+                self.snapshot.clear()
+        self.refresh_graph_stats(background=True, force=True)
 
     def _delete_specific_entity(self, tx, entity_name):
         query = """
@@ -265,7 +609,11 @@ class GraphDatabase:
         tx.run(query)
 
     def query_node(self, entity_name, threshold=0.9, kgdb_name='neo4j', hops=2, max_entities=5, **kwargs):
-        """知识图谱查询节点的入口:"""
+        """知识图谱查询节点的入口:
+
+        向量检索与所有命中实体的 k 跳扩展在一次 Cypher 查询中完成，
+        每一跳的扩展数量受 fanout 限制，每个命中实体最多返回 limit 条路径。
+        """
         assert self.driver is not None, "Database is not connected"
         # TODO 添加判断节点数量为 0 停止检索
         # 判断是否启动
@@ -273,85 +621,187 @@ class GraphDatabase:
             raise Exception("图数据库未启动")
 
         self.use_database(kgdb_name)
-        def _index_exists(tx, index_name):
-            """检查索引是否存在"""
-            result = tx.run("SHOW INDEXES")
-            for record in result:
-                if record["name"] == index_name:
-                    return True
-            return False
+        if self.snapshot_ready():
+            embedding = self.get_embedding(entity_name)
+            return self._query_node_snapshot(embedding, threshold, hops, max_entities, **kwargs)
 
-        def query(tx, text):
-            # 首先检查索引是否存在
-            if not _index_exists(tx, "entityEmbeddings"):
-                raise Exception("向量索引不存在，请先创建索引")
+        if not self._index_exists("entityEmbeddings"):
+            logger.error("向量索引不存在，请先创建索引")
+            return []
 
-            embedding = self.get_embedding(text)
-            result = tx.run("""
-            CALL db.index.vector.queryNodes('entityEmbeddings', 10, $embedding)
-            YIELD node AS similarEntity, score
-            RETURN similarEntity.name AS name, score
-            """, embedding=embedding)
-            return result.values()
+        embedding = self.get_embedding(entity_name)
+        query_str, params = self._query_node_cypher(embedding, threshold, hops, max_entities, **kwargs)
+        values = self._run_expansion(query_str, params)
+        logger.debug(f"Graph Query Entities: {entity_name}, {len(values)} paths")
+        return values
 
-        try:
-            with self.driver.session() as session:
-                results = session.execute_read(query, entity_name)
-        except Exception as e:
-            if "向量索引不存在" in str(e):
-                logger.error(f"向量索引不存在，请先创建索引: {e}, {traceback.format_exc()}")
-                return []
-            raise e
+    def query_specific_entity(self, entity_name, kgdb_name='neo4j', hops=2, limit=100, fanout=None):
+        """查询指定实体三元组信息（无向关系）"""
+        assert self.driver is not None, "Database is not connected"
+        if not entity_name:
+            logger.warning("实体名称为空")
+            return []
 
-        # 筛选出分数高于阈值的实体
-        qualified_entities = [result[0] for result in results[:max_entities] if result[1] > threshold]
-        logger.debug(f"Graph Query Entities: {entity_name}, {qualified_entities=}")
+        self.use_database(kgdb_name)
+        if self.snapshot_ready():
+            return self._query_specific_entity_snapshot(entity_name, hops, limit, fanout)
+
+        query_str, params = self._query_specific_entity_cypher(entity_name, hops, limit, fanout)
+        values = self._run_expansion(query_str, params)
+        if not values:
+            logger.info(f"未找到实体 {entity_name} 的相关信息")
+        return values
+
+    async def aquery_node(self, entity_name, threshold=0.9, kgdb_name='neo4j', hops=2, max_entities=5, **kwargs):
+        """query_node 的异步版本"""
+        assert self.async_driver is not None, "Database is not connected"
+        if not self.is_running():
+            raise Exception("图数据库未启动")
 
-        # 对每个合格的实体进行查询
-        all_query_results = []
-        for entity in qualified_entities:
-            query_result = self.query_specific_entity(entity_name=entity, hops=hops, kgdb_name=kgdb_name)
-            all_query_results.extend(query_result)
+        self.use_database(kgdb_name)
+        if self.snapshot_ready():
+            embedding = await self.aget_embedding(entity_name)
+            return self._query_node_snapshot(embedding, threshold, hops, max_entities, **kwargs)
 
-        return all_query_results
+        if not await asyncio.to_thread(self._index_exists, "entityEmbeddings"):
+            logger.error("向量索引不存在，请先创建索引")
+            return []
 
-    def query_specific_entity(self, entity_name, kgdb_name='neo4j', hops=2, limit=100):
-        """查询指定实体三元组信息（无向关系）"""
-        assert self.driver is not None, "Database is not connected"
+        embedding = await self.aget_embedding(entity_name)
+        query_str, params = self._query_node_cypher(embedding, threshold, hops, max_entities, **kwargs)
+        values = await self._arun_expansion(query_str, params)
+        logger.debug(f"Graph Query Entities: {entity_name}, {len(values)} paths")
+        return values
+
+    async def aquery_specific_entity(self, entity_name, kgdb_name='neo4j', hops=2, limit=100, fanout=None):
+        """query_specific_entity 的异步版本"""
+        assert self.async_driver is not None, "Database is not connected"
         if not entity_name:
             logger.warning("实体名称为空")
             return []
 
         self.use_database(kgdb_name)
+        if self.snapshot_ready():
+            return self._query_specific_entity_snapshot(entity_name, hops, limit, fanout)
+
+        query_str, params = self._query_specific_entity_cypher(entity_name, hops, limit, fanout)
+        values = await self._arun_expansion(query_str, params)
+        if not values:
+            logger.info(f"未找到实体 {entity_name} 的相关信息")
+        return values
+
+    def _query_node_cypher(self, embedding, threshold, hops, max_entities, **kwargs):
+        query_str = """
+        CALL db.index.vector.queryNodes('entityEmbeddings', 10, $embedding)
+        YIELD node, score
+        WITH node, score WHERE score > $threshold
+        WITH node AS start ORDER BY score DESC LIMIT $max_entities
+        """ + self._expansion_cypher(hops)
+
+        params = {
+            "embedding": embedding,
+            "threshold": threshold,
+            "max_entities": max_entities,
+            "fanout": int(kwargs.get("fanout") or os.getenv("GRAPH_HOP_FANOUT", 20)),
+            "limit": int(kwargs.get("limit", 100)),
+        }
+        return query_str, params
+
+    def _query_node_snapshot(self, embedding, threshold, hops, max_entities, **kwargs):
+        fanout = int(kwargs.get("fanout") or os.getenv("GRAPH_HOP_FANOUT", 20))
+        values = self.snapshot.query_by_embedding(embedding, threshold, max_entities, hops, fanout, int(kwargs.get("limit", 100)))
+        return self._dedupe_paths(values)
+
+    def _query_specific_entity_snapshot(self, entity_name, hops, limit, fanout):
+        values = self.snapshot.query_entity(entity_name, hops, int(fanout or os.getenv("GRAPH_HOP_FANOUT", 20)), int(limit))
+        if not values:
+            logger.info(f"未找到实体 {entity_name} 的相关信息")
+        return values
+
+    def _query_specific_entity_cypher(self, entity_name, hops, limit, fanout):
+        query_str = "MATCH (start {name: $entity_name})" + self._expansion_cypher(hops)
+        params = {
+            "entity_name": entity_name,
+            "fanout": int(fanout or os.getenv("GRAPH_HOP_FANOUT", 20)),
+            "limit": int(limit),
+        }
+        return query_str, params
 
-        def query(tx, entity_name, hops, limit):
-            try:
-                query_str = f"""
-                MATCH (n {{name: $entity_name}})-[r*1..{hops}]-(m)
-                RETURN n AS n, r, m AS m
-                LIMIT $limit
-                """
-                result = tx.run(query_str, entity_name=entity_name, limit=limit)
-
-                if not result:
-                    logger.info(f"未找到实体 {entity_name} 的相关信息")
-                    return []
-
-                values = result.values()
-                # 安全地处理embedding属性
-                values = clean_triples_embedding(values)
-                return values
+    @staticmethod
+    def _expansion_cypher(hops):
+        """生成从 start 出发逐跳扩展的 Cypher 片段
 
-            except Exception as e:
-                logger.error(f"查询实体 {entity_name} 失败: {str(e)}")
-                return []
+        每一跳用一个 CALL 子查询扩展上一跳的全部路径，每条路径最多扩展 $fanout 条关系，
+        且不重复经过同一关系。返回 (n, r, m) 行，n / m 为 {id, name}，r 为路径上的关系列表，
+        每个关系为 {id, type, source_id, source_name, target_id, target_name}，不包含 embedding。
+        """
+        hop = """
+        CALL {
+            WITH frontier
+            UNWIND frontier AS p
+            CALL {
+                WITH p
+                WITH p.node AS x, p.rels AS rels
+                MATCH (x)-[r]-(y)
+                WHERE NOT r IN rels
+                RETURN r, y
+                LIMIT $fanout
+            }
+            RETURN collect({rels: p.rels + r, node: y}) AS next
+        }
+        WITH start, next AS frontier, results + next AS results
+        """
+        return """
+        WITH start, [{rels: [], node: start}] AS frontier, [] AS results
+        """ + hop * max(1, int(hops)) + """
+        UNWIND results[0..$limit] AS p
+        RETURN {id: elementId(start), name: start.name} AS n,
+               [rel IN p.rels | {
+                   id: elementId(rel), type: coalesce(rel.type, type(rel)),
+                   source_id: elementId(startNode(rel)), source_name: startNode(rel).name,
+                   target_id: elementId(endNode(rel)), target_name: endNode(rel).name
+               }] AS r,
+               {id: elementId(p.node), name: p.node.name} AS m
+        """
+
+    def _run_expansion(self, query_str, params):
+        """执行扩展查询并对路径去重"""
+        def query(tx):
+            return tx.run(query_str, **params).values()
 
         try:
             with self.driver.session() as session:
-                return session.execute_read(query, entity_name, hops, limit)
+                values = session.execute_read(query)
         except Exception as e:
-            logger.error(f"数据库会话异常: {str(e)}")
+            logger.error(f"图查询失败: {str(e)}")
             return []
+        return self._dedupe_paths(values)
+
+    async def _arun_expansion(self, query_str, params):
+        """_run_expansion 的异步版本"""
+        async def query(tx):
+            result = await tx.run(query_str, **params)
+            return await result.values()
+
+        try:
+            async with self.async_driver.session() as session:
+                values = await session.execute_read(query)
+        except Exception as e:
+            logger.error(f"图查询失败: {str(e)}")
+            return []
+        return self._dedupe_paths(values)
+
+    @staticmethod
+    def _dedupe_paths(values):
+        """对经过相同关系集合的路径去重（例如两个命中实体互为邻居时的正反两条路径）"""
+        seen = set()
+        deduped = []
+        for n, rels, m in values:
+            key = frozenset(r["id"] for r in rels)
+            if key not in seen:
+                seen.add(key)
+                deduped.append([n, rels, m])
+        return deduped
 
     def query_all_nodes_and_relationships(self, kgdb_name='neo4j', hops = 2):
         """查询图数据库中所有三元组信息 NEVER USE"""
@@ -425,8 +875,8 @@ class GraphDatabase:
             outputs = await self.embed_model.abatch_encode(text, batch_size=40)
             return outputs
         else:
-            outputs = await self.embed_model.aencode(text)
-            return outputs
+            outputs = await self.embed_model.aencode([text])
+            return outputs[0]
 
     def get_embedding(self, text):
         if isinstance(text, list):
@@ -443,41 +893,95 @@ class GraphDatabase:
         """, name=entity_name, embedding=embedding)
 
     def get_graph_info(self, graph_name="neo4j"):
+        """获取图数据库信息，统计数据来自缓存，过期时在后台刷新"""
         assert self.driver is not None, "Database is not connected"
         self.use_database(graph_name)
+
+        try:
+            if self.status == "open" and self.driver and self.is_running():
+                if self._graph_stats is None:
+                    self.refresh_graph_stats()
+                elif time.time() - self._graph_stats_refreshed_at > self.graph_stats_interval:
+                    self.refresh_graph_stats(background=True)
+
+                with self._graph_stats_lock:
+                    graph_info = dict(self._graph_stats)
+
+                graph_info.update({
+                    "graph_name": graph_name,
+                    "status": self.status,
+                    "embed_model_name": self.embed_model_name,
+                })
+                if self.snapshot is not None:
+                    graph_info["snapshot"] = self.snapshot.stats()
+                return graph_info
+
+        except Exception as e:
+            logger.error(f"获取图数据库信息失败：{e}, {traceback.format_exc()}")
+            return None
+
+    def refresh_graph_stats(self, background=False, force=False):
+        """从数据库重新统计图信息
+
+        节点数和关系数直接读取 count store；未索引节点数需要扫描 Entity 节点，
+        因此两次刷新之间至少间隔 graph_stats_interval 秒（force=True 时除外），
+        同一时间只有一个刷新在执行。
+        """
+        with self._graph_stats_lock:
+            too_soon = time.time() - self._graph_stats_refreshed_at < self.graph_stats_interval
+            if self._graph_stats_refreshing or (too_soon and not force and self._graph_stats is not None):
+                return
+            self._graph_stats_refreshing = True
+
         def query(tx):
             entity_count = tx.run("MATCH (n) RETURN count(n) AS count").single()["count"]
             relationship_count = tx.run("MATCH ()-[r]->() RETURN count(r) AS count").single()["count"]
-            triples_count = tx.run("MATCH (n)-[r]->(m) RETURN count(n) AS count").single()["count"]
+            unindexed_count = tx.run("MATCH (n:Entity) WHERE n.embedding IS NULL RETURN count(n) AS count").single()["count"]
 
             # 获取所有标签
             labels = tx.run("CALL db.labels() YIELD label RETURN collect(label) AS labels").single()["labels"]
 
             return {
-                "graph_name": graph_name,
                 "entity_count": entity_count,
                 "relationship_count": relationship_count,
-                "triples_count": triples_count,
+                # 每条关系恰好对应一个三元组
+                "triples_count": relationship_count,
                 "labels": labels,
-                "status": self.status,
-                "embed_model_name": self.embed_model_name,
-                "unindexed_node_count": self.query_nodes_without_embedding(graph_name)
+                "unindexed_node_count": unindexed_count,
             }
 
-        try:
-            if self.status == "open" and self.driver and self.is_running():
-                # 获取数据库信息
+        def refresh():
+            try:
                 with self.driver.session() as session:
-                    graph_info = session.execute_read(query)
+                    stats = session.execute_read(query)
+                from datetime import datetime
+                stats["last_updated"] = datetime.now().isoformat()
+                with self._graph_stats_lock:
+                    self._graph_stats = stats
+                    self._graph_stats_refreshed_at = time.time()
+            except Exception as e:
+                logger.error(f"刷新图数据库统计信息失败：{e}")
+            finally:
+                with self._graph_stats_lock:
+                    self._graph_stats_refreshing = False
 
-                    # 添加时间戳
-                    from datetime import datetime
-                    graph_info["last_updated"] = datetime.now().isoformat()
-                    return graph_info
+        if background:
+            threading.Thread(target=refresh, daemon=True).start()
+        else:
+            refresh()
 
-        except Exception as e:
-            logger.error(f"获取图数据库信息失败：{e}, {traceback.format_exc()}")
-            return None
+    def _update_graph_stats(self, nodes=0, relationships=0, unindexed=0):
+        """写入路径增量更新缓存的统计信息"""
+        from datetime import datetime
+        with self._graph_stats_lock:
+            if self._graph_stats is None:
+                return
+            stats = self._graph_stats
+            stats["entity_count"] += nodes
+            stats["relationship_count"] += relationships
+            stats["triples_count"] += relationships
+            stats["unindexed_node_count"] = max(0, stats["unindexed_node_count"] + unindexed)
+            stats["last_updated"] = datetime.now().isoformat()
 
     def save_graph_info(self, graph_name="neo4j"):
         """
@@ -570,69 +1074,127 @@ class GraphDatabase:
                 try:
                     embedding = self.get_embedding(node_name)
                     session.execute_write(self.set_embedding, node_name, embedding)
+                    if self.snapshot is not None:
+                        self.snapshot.set_embeddings([(node_name, embedding)])
                     count += 1
                 except Exception as e:
                     logger.error(f"为节点 '{node_name}' 添加嵌入向量失败: {e}, {traceback.format_exc()}")
 
+        self._update_graph_stats(unindexed=-count)
         return count
 
+    async def aadd_embedding_to_nodes(self, node_names=None, kgdb_name='neo4j', progress=None):
+        """add_embedding_to_nodes 的异步版本
 
-    def _extract_relationship_info(self, relationship, source_name=None, target_name=None, node_dict=None):
-        """
-        提取关系信息并返回格式化的节点和边信息
+        node_names 为 None 时分页读取没有 embedding 的节点，每页并发分批计算向量后用 UNWIND 批量写入。
+        progress 为可选的进度字典，会更新其中的 indexed / failed 字段。
         """
-        rel_id = relationship.element_id
-        nodes = relationship.nodes
-        if len(nodes) != 2:
-            return None, None
-
-        source, target = nodes
-        source_id = source.element_id
-        target_id = target.element_id
-
-        assert node_dict is not None, "node_dict is required"
-        source_name = node_dict[source_id]["name"] if source_name is None else source_name
-        target_name = node_dict[target_id]["name"] if target_name is None else target_name
-
-        relationship_type = relationship._properties.get("type", "unknown")
-        if relationship_type == "unknown":
-            relationship_type = relationship.type
-
-        edge_info = {
-            "id": rel_id,
-            "type": relationship_type,
-            "source_id": source_id,
-            "target_id": target_id,
-            "source_name": source_name,
-            "target_name": target_name,
-        }
-
-        node_info = [
-            {"id": source_id, "name": source_name},
-            {"id": target_id, "name": target_name},
-        ]
+        assert self.async_driver is not None, "Database is not connected"
+        self.use_database(kgdb_name)
+        progress = progress if progress is not None else {"indexed": 0, "failed": 0}
 
-        return node_info, edge_info
+        if node_names is not None:
+            progress["indexed"] += await self._embed_missing_entities(node_names)
+            return progress["indexed"]
 
-    def format_general_results(self, results):
-        formatted_results = {"nodes": [], "edges": []}
+        page_size = int(os.getenv("GRAPH_INDEX_PAGE_SIZE", 2000))
+        failed_names = []
+        while names := await self._aget_unindexed_page(page_size, failed_names):
+            try:
+                embeddings = await self.aget_embedding(names)
+                await self.aset_embeddings(list(zip(names, embeddings)))
+                progress["indexed"] += len(names)
+            except Exception as e:
+                # 跳过失败的一页，避免下一页重复取到同样的节点
+                logger.error(f"为 {len(names)} 个节点添加嵌入向量失败: {e}, {traceback.format_exc()}")
+                failed_names.extend(names)
+                progress["failed"] += len(names)
 
-        for item in results:
-            relationship = item[1]
-            source_name = item[0]._properties.get("name", "unknown")
-            target_name = item[2]._properties.get("name", "unknown") if len(item) > 2 else "unknown"
+        return progress["indexed"]
 
-            node_info, edge_info = self._extract_relationship_info(relationship, source_name, target_name)
-            if node_info is None or edge_info is None:
-                continue
-
-            for node in node_info:
-                if node["id"] not in [n["id"] for n in formatted_results["nodes"]]:
-                    formatted_results["nodes"].append(node)
+    async def _aget_unindexed_page(self, page_size, exclude):
+        """读取一页没有 embedding 的节点名称，已写入的节点自然不会再被取到，因此无需 SKIP"""
+        async def query(tx):
+            result = await tx.run("""
+            MATCH (n:Entity)
+            WHERE n.embedding IS NULL AND NOT n.name IN $exclude
+            RETURN n.name AS name
+            LIMIT $limit
+            """, exclude=exclude, limit=page_size)
+            return [record["name"] async for record in result]
+
+        async with self.async_driver.session() as session:
+            return await session.execute_read(query)
+
+    async def _acount_unindexed(self):
+        async def query(tx):
+            result = await tx.run("MATCH (n:Entity) WHERE n.embedding IS NULL RETURN count(n) AS count")
+            record = await result.single()
+            return record["count"]
+
+        async with self.async_driver.session() as session:
+            return await session.execute_read(query)
+
+    def start_index_nodes_job(self, kgdb_name='neo4j'):
+        """在后台为所有未索引节点建立向量索引，返回任务信息；已有任务在运行时直接返回该任务"""
+        for job in self.index_jobs.values():
+            if job["status"] in ("pending", "running"):
+                return job
+
+        job_id = hashstr(f"index-nodes-{time.time()}", length=16)
+        job = {
+            "job_id": job_id,
+            "kgdb_name": kgdb_name,
+            "status": "pending",
+            "total": None,
+            "indexed": 0,
+            "failed": 0,
+            "message": "",
+            "created_at": time.time(),
+            "finished_at": None,
+        }
+        self.index_jobs[job_id] = job
+        job["_task"] = asyncio.create_task(self._run_index_nodes_job(job))
+        return job
 
-            formatted_results["edges"].append(edge_info)
+    async def _run_index_nodes_job(self, job):
+        job["status"] = "running"
+        try:
+            job["total"] = await self._acount_unindexed()
+            await self.aadd_embedding_to_nodes(kgdb_name=job["kgdb_name"], progress=job)
+            job["status"] = "done" if not job["failed"] else "partial"
+            job["message"] = f"已成功为{job['indexed']}个节点添加嵌入向量" + (f"，{job['failed']}个失败" if job["failed"] else "")
+        except Exception as e:
+            logger.error(f"节点索引任务失败: {e}, {traceback.format_exc()}")
+            job["status"] = "failed"
+            job["message"] = str(e)
+        finally:
+            job["finished_at"] = time.time()
+            await asyncio.to_thread(self.save_graph_info)
+
+    def get_index_job(self, job_id):
+        job = self.index_jobs.get(job_id)
+        if job is None:
+            return None
+        return {k: v for k, v in job.items() if not k.startswith("_")}
 
-        return formatted_results
+    def format_general_results(self, results):
+        """将 get_sample_nodes 的结果转换为 {"nodes": [], "edges": []}，一次遍历完成"""
+        nodes = {}
+        edges = []
+
+        for n, r, m in results:
+            nodes.setdefault(n["id"], n)
+            nodes.setdefault(m["id"], m)
+            edges.append({
+                **r,
+                "source_id": n["id"],
+                "target_id": m["id"],
+                "source_name": n["name"],
+                "target_name": m["name"],
+            })
+
+        return {"nodes": list(nodes.values()), "edges": edges}
 
     def format_query_result_to_graph(self, query_results):
         """将检索到的结果转换为 {"nodes": [], "edges": []} 的格式
@@ -663,38 +1225,25 @@ class GraphDatabase:
             ]
         }
         """
-        formatted_results = {"nodes": [], "edges": []}
         node_dict = {}
         edge_dict = {}
 
         for item in query_results:
             # 检查数据格式
-            if len(item) < 2 or not isinstance(item[1], list):
+            if len(item) < 3 or not isinstance(item[1], list):
                 continue
 
-            node_dict[item[0].element_id] = dict(id=item[0].element_id, name=item[0]._properties.get("name", "Unknown"))
-            node_dict[item[2].element_id] = dict(id=item[2].element_id, name=item[2]._properties.get("name", "Unknown"))
-
-            # 处理关系列表中的每个关系
-            for i, relationship in enumerate(item[1]):
-                try:
-                    # 提取关系信息
-                    node_info, edge_info = self._extract_relationship_info(relationship, node_dict=node_dict)
-                    if node_info is None or edge_info is None:
-                        continue
-
-                    # 添加边
-                    edge_dict[edge_info["id"]] = edge_info
-                except Exception as e:
-                    logger.error(f"处理关系时出错: {e}, 关系: {relationship}, {traceback.format_exc()}")
-                    continue
-
-        # 将节点字典转换为列表
-        formatted_results["nodes"] = list(node_dict.values())
-        formatted_results["edges"] = list(edge_dict.values())
+            n, rels, m = item[0], item[1], item[2]
+            node_dict.setdefault(n["id"], {"id": n["id"], "name": n.get("name") or "Unknown"})
+            node_dict.setdefault(m["id"], {"id": m["id"], "name": m.get("name") or "Unknown"})
 
+            # 路径中间节点也从关系两端补齐
+            for rel in rels:
+                node_dict.setdefault(rel["source_id"], {"id": rel["source_id"], "name": rel.get("source_name") or "Unknown"})
+                node_dict.setdefault(rel["target_id"], {"id": rel["target_id"], "name": rel.get("target_name") or "Unknown"})
+                edge_dict.setdefault(rel["id"], rel)
 
-        return formatted_results
+        return {"nodes": list(node_dict.values()), "edges": list(edge_dict.values())}
 
 def clean_triples_embedding(triples):
     for item in triples:
@@ -1,105 +1,78 @@
 import os
+import uuid
 import asyncio
 from pathlib import Path
 from langchain.schema.document import Document
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.document_loaders import (
     TextLoader,
     PyPDFLoader,
     Docx2txtLoader,
-    UnstructuredMarkdownLoader,
     UnstructuredHTMLLoader,
     CSVLoader,
     JSONLoader
 )
 
-from src.utils import hashstr, logger
+from src.utils import hashstr, logger, extract_pdf_text_layer, is_garbled_text
+from src.core.chunking import get_chunker, iter_file, looks_like_markdown
 
 
 def chunk_with_parser(file_path, params=None):
     """
     使用文件解析器将文件切分成固定大小的块
 
+    .txt / .md 文件按块流式读取并切分，不会一次性加载整个文件；其他格式先由对应的加载器解析。
+    切分参数见 src.core.chunking.get_chunker，.md 文件默认按标题结构切分。
+
     Args:
         file_path: 文件路径
         params: 参数
     """
-    params = params or {}
-    chunk_size = int(params.get("chunk_size", 500))
-    chunk_overlap = int(params.get("chunk_overlap", 100))
-
     file_type = Path(file_path).suffix.lower()
+    chunker = get_chunker(params, markdown=file_type == '.md')
 
-    # 选择合适的加载器
-    if file_type in ['.txt']:
-        loader = TextLoader(file_path)
-
-    elif file_type in ['.md']:
-        loader = UnstructuredMarkdownLoader(file_path)
+    if file_type in ['.txt', '.md']:
+        records = ((text, {"source": str(file_path), **metadata})
+                   for text, metadata in chunker.iter_records(iter_file(file_path)))
 
-    elif file_type in ['.docx', '.doc']:
-        loader = Docx2txtLoader(file_path)
-
-    elif file_type in ['.html', '.htm']:
-        loader = UnstructuredHTMLLoader(file_path)
-
-    elif file_type in ['.json']:
-        loader = JSONLoader(file_path, jq_schema=".")
+    else:
+        # 选择合适的加载器
+        if file_type in ['.docx', '.doc']:
+            loader = Docx2txtLoader(file_path)
 
-    elif file_type in ['.csv']:
-        loader = CSVLoader(file_path)
+        elif file_type in ['.html', '.htm']:
+            loader = UnstructuredHTMLLoader(file_path)
 
-    else:
-        raise ValueError(f"不支持的文件类型: {file_type}")
+        elif file_type in ['.json']:
+            loader = JSONLoader(file_path, jq_schema=".")
 
-    # 加载文档
-    docs = loader.load()
+        elif file_type in ['.csv']:
+            loader = CSVLoader(file_path)
 
-    # 创建文本分割器
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=chunk_size,
-        chunk_overlap=chunk_overlap,
-        separators=["\n\n", "\n", ".", " ", ""],
-    )
+        else:
+            raise ValueError(f"不支持的文件类型: {file_type}")
 
-    # 分割文档
-    nodes = text_splitter.split_documents(docs)
+        records = ((text, {**(doc.metadata or {}), **metadata})
+                   for doc in loader.lazy_load()
+                   for text, metadata in chunker.iter_records([doc.page_content]))
 
     # 添加序号信息到metadata
-    for i, node in enumerate(nodes):
-        if node.metadata is None:
-            node.metadata = {}
-        node.metadata["chunk_idx"] = i
-
-    return nodes
+    return [Document(page_content=text, metadata={**metadata, "chunk_idx": i}) for i, (text, metadata) in enumerate(records)]
 
 def chunk_text(text, params=None):
     """
-    将文本切分成固定大小的块
+    将文本切分成固定大小的块，包含 markdown 标题时（如 MinerU / PaddleX 的解析结果）默认按标题结构切分
     """
-    params = params or {}
-    chunk_size = int(params.get("chunk_size", 500))
-    chunk_overlap = int(params.get("chunk_overlap", 100))
-
-    # 创建文本分割器
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=chunk_size,
-        chunk_overlap=chunk_overlap,
-        separators=["\n\n", "\n", ".", " ", ""]
-    )
-
-    # 分割文档
-    nodes = text_splitter.split_text(text)
+    chunker = get_chunker(params, markdown=looks_like_markdown(text))
 
     # 添加序号信息到metadata
-    nodes = [{"text": node, "metadata": {"chunk_idx": i}} for i, node in enumerate(nodes)]
-    return nodes
+    return [{"text": chunk, "metadata": {**metadata, "chunk_idx": i}} for i, (chunk, metadata) in enumerate(chunker.iter_records([text]))]
 
 def chunk(text_or_path, params=None):
     raise NotImplementedError("chunk is deprecated, use chunk_with_parser or chunk_text instead")
 
 def pdfreader(file_path, params=None):
     """读取PDF文件并返回text文本"""
+    file_path = Path(file_path)
     assert file_path.exists(), "File not found"
     assert file_path.suffix.lower() == ".pdf", "File format not supported"
 
@@ -121,24 +94,102 @@ def plainreader(file_path):
     text = "\n\n".join([d.page_content for d in docs])
     return text
 
-def parse_pdf(file, params=None):
+def use_hybrid_ocr(params=None):
+    """是否使用文本层优先的混合解析，params["hybrid_ocr"] 优先，其次 PDF_HYBRID_OCR，默认开启"""
+    params = params or {}
+    return str(params.get("hybrid_ocr", os.getenv("PDF_HYBRID_OCR", "true"))).lower() in ("1", "true", "yes")
+
+def _check_ocr_result(text, report):
+    """OCR 引擎出错时返回空文本（见 OCRPlugin.process_pdf / process_pdf_paddlex），记为解析不完整"""
+    if report is not None and not text.strip():
+        report["complete"] = False
+    return text
+
+def parse_pdf(file, params=None, report=None):
+    """解析 PDF
+
+    开启 OCR 时默认使用混合模式（见 use_hybrid_ocr）：
+    先一次性提取所有页面的文本层，只有文本层为空或乱码的页面才交给 OCR 引擎。
+    传入 report 时，任一 OCR 步骤没有得到结果都会写入 report["complete"] = False，调用方据此判断结果能否缓存。
+    """
     params = params or {}
     opt_ocr = params.get("enable_ocr", "disable")
 
+    if opt_ocr not in ("onnx_rapid_ocr", "mineru_ocr", "paddlex_ocr"):
+        return pdfreader(file, params=params)
+
+    if use_hybrid_ocr(params):
+        return parse_pdf_hybrid(file, opt_ocr, report=report)
+
+    from src.plugins import ocr
     if opt_ocr == "onnx_rapid_ocr":
-        from src.plugins import ocr
-        return ocr.process_pdf(file)
+        return _check_ocr_result(ocr.process_pdf(file), report)
 
     elif opt_ocr == "mineru_ocr":
-        from src.plugins import ocr
-        return ocr.process_pdf_mineru(file)
-
-    elif opt_ocr == "paddlex_ocr":
-        from src.plugins import ocr
-        return ocr.process_pdf_paddlex(file)
+        return _check_ocr_result(ocr.process_pdf_mineru(file), report)
 
     else:
-        return pdfreader(file, params=params)
+        return _check_ocr_result(ocr.process_pdf_paddlex(file), report)
 
-async def parse_pdf_async(file, params=None):
-    return await asyncio.to_thread(parse_pdf, file, params=params)
+def parse_pdf_hybrid(file, opt_ocr, report=None):
+    """文本层优先的混合解析，OCR 只处理文本层为空或乱码的页面"""
+    from src.plugins import ocr
+
+    page_texts = extract_pdf_text_layer(file)
+    ocr_pages = [i for i, text in enumerate(page_texts) if is_garbled_text(text)]
+    logger.info(f"PDF {os.path.basename(str(file))}: {len(ocr_pages)}/{len(page_texts)} pages need OCR ({opt_ocr})")
+    if not ocr_pages:
+        return "\n\n".join(page_texts)
+
+    if opt_ocr == "onnx_rapid_ocr":
+        # 逐页 OCR，直接替换对应页面的文本
+        for page, text in zip(ocr_pages, ocr.ocr_pdf_pages(file, ocr_pages)):
+            page_texts[page] = text
+        return "\n\n".join(page_texts)
+
+    # MinerU / PaddleX 以文档为单位处理，将连续的待 OCR 页面拆成子 PDF 分别识别
+    process = ocr.process_pdf_mineru if opt_ocr == "mineru_ocr" else ocr.process_pdf_paddlex
+    if len(ocr_pages) == len(page_texts):
+        return _check_ocr_result(process(file), report)
+
+    parts = []
+    run_starts = {start: end for start, end in _consecutive_runs(ocr_pages)}
+    page = 0
+    while page < len(page_texts):
+        if page in run_starts:
+            end = run_starts[page]
+            parts.append(_check_ocr_result(_process_pdf_pages(file, page, end, process), report))
+            page = end + 1
+        else:
+            parts.append(page_texts[page])
+            page += 1
+    return "\n\n".join(parts)
+
+def _consecutive_runs(pages):
+    """将有序页码列表合并为连续区间 [(start, end), ...]"""
+    runs = []
+    for page in pages:
+        if runs and page == runs[-1][1] + 1:
+            runs[-1][1] = page
+        else:
+            runs.append([page, page])
+    return [tuple(run) for run in runs]
+
+def _process_pdf_pages(file, start, end, process):
+    """将 [start, end] 页另存为子 PDF 后交给 OCR 引擎处理"""
+    import fitz
+
+    tmp_dir = os.path.join(os.getcwd(), "tmp", "pdf_pages")
+    os.makedirs(tmp_dir, exist_ok=True)
+    sub_path = os.path.join(tmp_dir, f"{Path(str(file)).stem}_{start}-{end}_{uuid.uuid4().hex[:8]}.pdf")
+    try:
+        with fitz.open(file) as doc, fitz.open() as sub_doc:
+            sub_doc.insert_pdf(doc, from_page=start, to_page=end)
+            sub_doc.save(sub_path)
+        return process(sub_path)
+    finally:
+        if os.path.exists(sub_path):
+            os.remove(sub_path)
+
+async def parse_pdf_async(file, params=None, report=None):
+    return await asyncio.to_thread(parse_pdf, file, params=params, report=report)
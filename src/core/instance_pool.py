@@ -0,0 +1,177 @@
+import time
+import asyncio
+import traceback
+from collections import Counter, OrderedDict
+from contextlib import asynccontextmanager
+
+from src.utils import logger
+
+
+class LightRAGInstancePool:
+    """LightRAG 实例池
+
+    - 实例数量有上限，超出时按 LRU 淘汰最久未使用且当前没有被占用的实例
+    - 超过 idle_ttl 秒未使用的实例会被回收
+    - 淘汰时调用 finalize_storages 释放 Milvus / PG 等存储连接
+    - 同一 db_id 的并发首次请求共享同一次初始化
+
+    长时间使用实例的调用方（如导入、检索）应使用 lease() 或 acquire()/release() 占用实例，避免使用期间被淘汰。
+    """
+
+    def __init__(self, factory, max_size=32, idle_ttl=1800, on_usage_flush=None):
+        """
+        Args:
+            factory: 异步函数 factory(db_id) -> LightRAG | None，用于创建并初始化实例
+            max_size: 最多保留的实例数量
+            idle_ttl: 空闲回收时间（秒），0 表示不按空闲时间回收
+            on_usage_flush: 可选回调 on_usage_flush({db_id: count})，用于持久化各实例的使用次数
+        """
+        self._factory = factory
+        self.max_size = max_size
+        self.idle_ttl = idle_ttl
+        self._on_usage_flush = on_usage_flush
+        self._entries: OrderedDict[str, dict] = OrderedDict()
+        self._pending: dict[str, asyncio.Task] = {}
+        self._usage: Counter = Counter()
+        self._sweeper: asyncio.Task | None = None
+
+    def __contains__(self, db_id):
+        return db_id in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    async def get(self, db_id):
+        """获取实例，不存在时创建，创建失败返回 None"""
+        entry = self._entries.get(db_id)
+        if entry is not None:
+            self._touch(db_id, entry)
+            return entry["rag"]
+
+        task = self._pending.get(db_id)
+        if task is None:
+            task = asyncio.ensure_future(self._create(db_id))
+            self._pending[db_id] = task
+            task.add_done_callback(lambda _: self._pending.pop(db_id, None))
+
+        # shield 避免某个等待方被取消时中断其他等待方共享的初始化
+        rag = await asyncio.shield(task)
+        entry = self._entries.get(db_id)
+        if entry is not None:
+            self._touch(db_id, entry)
+        return rag
+
+    async def _create(self, db_id):
+        try:
+            rag = await self._factory(db_id)
+        except Exception as e:
+            logger.error(f"Failed to create LightRAG instance for {db_id}: {e}, {traceback.format_exc()}")
+            return None
+
+        if rag is not None:
+            self._entries[db_id] = {"rag": rag, "last_used": time.time(), "leases": 0}
+            # 刚创建的实例即将返回给调用方，不能作为淘汰对象
+            await self._evict_overflow(keep=db_id)
+        return rag
+
+    def _touch(self, db_id, entry):
+        entry["last_used"] = time.time()
+        self._entries.move_to_end(db_id)
+        self._usage[db_id] += 1
+
+    async def acquire(self, db_id):
+        """获取并占用实例，占用期间不会被淘汰，使用完毕后需调用 release"""
+        rag = await self.get(db_id)
+        entry = self._entries.get(db_id)
+        if entry is not None:
+            entry["leases"] += 1
+        return rag
+
+    def release(self, db_id):
+        entry = self._entries.get(db_id)
+        if entry is not None and entry["leases"] > 0:
+            entry["leases"] -= 1
+            entry["last_used"] = time.time()
+
+    @asynccontextmanager
+    async def lease(self, db_id):
+        """在 async with 块内占用实例"""
+        rag = await self.acquire(db_id)
+        try:
+            yield rag
+        finally:
+            self.release(db_id)
+
+    async def _evict_overflow(self, keep=None):
+        overflow = len(self._entries) - self.max_size
+        if overflow <= 0:
+            return
+
+        # OrderedDict 的顺序即 LRU 顺序，跳过正在被占用的实例
+        victims = [db_id for db_id, entry in self._entries.items() if entry["leases"] == 0 and db_id != keep][:overflow]
+        if len(victims) < overflow:
+            logger.warning(f"LightRAG instance pool exceeds max_size={self.max_size}, all other instances are in use")
+        for db_id in victims:
+            await self.remove(db_id)
+
+    async def evict_idle(self):
+        """回收超过 idle_ttl 未使用的实例"""
+        if not self.idle_ttl:
+            return
+        deadline = time.time() - self.idle_ttl
+        for db_id in [db_id for db_id, entry in self._entries.items() if entry["leases"] == 0 and entry["last_used"] < deadline]:
+            logger.info(f"Evicting idle LightRAG instance {db_id}")
+            await self.remove(db_id)
+
+    async def remove(self, db_id):
+        """移除实例并释放其存储连接"""
+        entry = self._entries.pop(db_id, None)
+        if entry is None:
+            return
+        try:
+            await entry["rag"].finalize_storages()
+            logger.info(f"Finalized LightRAG instance {db_id}")
+        except Exception as e:
+            logger.error(f"Failed to finalize LightRAG instance {db_id}: {e}")
+
+    def discard(self, db_id):
+        """同步上下文中移除实例，存储的释放在事件循环中异步完成"""
+        if db_id not in self._entries:
+            return
+        try:
+            asyncio.get_running_loop().create_task(self.remove(db_id))
+        except RuntimeError:
+            self._entries.pop(db_id, None)
+
+    def most_used(self, n):
+        return [db_id for db_id, _ in self._usage.most_common(n)]
+
+    def flush_usage(self):
+        """将内存中累计的使用次数交给 on_usage_flush 持久化"""
+        if self._on_usage_flush and self._usage:
+            usage, self._usage = dict(self._usage), Counter()
+            try:
+                self._on_usage_flush(usage)
+            except Exception as e:
+                logger.error(f"Failed to flush LightRAG instance usage: {e}")
+
+    def start_sweeper(self, interval=60):
+        """启动后台任务，定期回收空闲实例并持久化使用次数"""
+        async def sweep():
+            while True:
+                await asyncio.sleep(interval)
+                await self.evict_idle()
+                self.flush_usage()
+
+        if self._sweeper is None:
+            self._sweeper = asyncio.create_task(sweep())
+
+    async def close(self):
+        """停止后台任务并释放所有实例"""
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            await asyncio.gather(self._sweeper, return_exceptions=True)
+            self._sweeper = None
+        self.flush_usage()
+        for db_id in list(self._entries):
+            await self.remove(db_id)
@@ -0,0 +1,310 @@
+import os
+import json
+import sqlite3
+import threading
+
+from src.utils import logger
+
+
+class KBMetadataStore:
+    """知识库元数据存储
+
+    使用 SQLite（WAL 模式）保存数据库与文件记录，文件表按 database_id 建立索引，
+    每次状态变化只更新对应的一行，而不是重写整个元数据文件。
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._create_tables()
+
+    def _create_tables(self):
+        with self._lock:
+            self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS databases (
+                db_id TEXT PRIMARY KEY,
+                meta TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS files (
+                file_id TEXT PRIMARY KEY,
+                database_id TEXT NOT NULL,
+                status TEXT,
+                record TEXT NOT NULL,
+                created_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS idx_files_database_id ON files (database_id, created_at);
+            CREATE TABLE IF NOT EXISTS doc_chunks (
+                doc_id TEXT NOT NULL,
+                chunk_id TEXT NOT NULL,
+                chunk_order INTEGER NOT NULL,
+                database_id TEXT NOT NULL,
+                PRIMARY KEY (doc_id, chunk_order)
+            );
+            CREATE INDEX IF NOT EXISTS idx_doc_chunks_database_id ON doc_chunks (database_id);
+            CREATE TABLE IF NOT EXISTS doc_fingerprints (
+                doc_id TEXT PRIMARY KEY,
+                database_id TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                signature BLOB
+            );
+            CREATE INDEX IF NOT EXISTS idx_doc_fingerprints_hash ON doc_fingerprints (database_id, content_hash);
+            CREATE TABLE IF NOT EXISTS doc_lsh_bands (
+                database_id TEXT NOT NULL,
+                band TEXT NOT NULL,
+                doc_id TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_doc_lsh_bands ON doc_lsh_bands (database_id, band);
+            CREATE INDEX IF NOT EXISTS idx_doc_lsh_bands_doc_id ON doc_lsh_bands (doc_id);
+            CREATE TABLE IF NOT EXISTS chunk_index_backfilled (
+                database_id TEXT PRIMARY KEY
+            );
+            CREATE TABLE IF NOT EXISTS usage (
+                db_id TEXT PRIMARY KEY,
+                count INTEGER NOT NULL DEFAULT 0
+            );
+            """)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    # ---------------------------------------------------------------- databases
+
+    def get_all_databases(self) -> dict[str, dict]:
+        with self._lock:
+            rows = self._conn.execute("SELECT db_id, meta FROM databases").fetchall()
+        return {db_id: json.loads(meta) for db_id, meta in rows}
+
+    def upsert_database(self, db_id: str, meta: dict):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO databases (db_id, meta) VALUES (?, ?) "
+                "ON CONFLICT(db_id) DO UPDATE SET meta = excluded.meta",
+                (db_id, json.dumps(meta, ensure_ascii=False)),
+            )
+
+    def delete_database(self, db_id: str):
+        """删除数据库及其全部文件记录"""
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.execute("DELETE FROM doc_chunks WHERE database_id = ?", (db_id,))
+                self._conn.execute("DELETE FROM chunk_index_backfilled WHERE database_id = ?", (db_id,))
+                self._conn.execute("DELETE FROM doc_fingerprints WHERE database_id = ?", (db_id,))
+                self._conn.execute("DELETE FROM doc_lsh_bands WHERE database_id = ?", (db_id,))
+                self._conn.execute("DELETE FROM usage WHERE db_id = ?", (db_id,))
+                self._conn.execute("DELETE FROM files WHERE database_id = ?", (db_id,))
+                self._conn.execute("DELETE FROM databases WHERE db_id = ?", (db_id,))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def add_usage(self, counts: dict[str, int]):
+        """累加各数据库的使用次数"""
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO usage (db_id, count) VALUES (?, ?) "
+                "ON CONFLICT(db_id) DO UPDATE SET count = count + excluded.count",
+                list(counts.items()),
+            )
+
+    def get_most_used(self, n: int) -> list[str]:
+        with self._lock:
+            rows = self._conn.execute("SELECT db_id FROM usage ORDER BY count DESC LIMIT ?", (n,)).fetchall()
+        return [row[0] for row in rows]
+
+    # -------------------------------------------------------------------- files
+
+    def get_file(self, file_id: str) -> dict | None:
+        with self._lock:
+            row = self._conn.execute("SELECT record FROM files WHERE file_id = ?", (file_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get_files_by_database(self, db_id: str) -> dict[str, dict]:
+        """通过 database_id 索引获取某个数据库的全部文件记录"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT file_id, record FROM files WHERE database_id = ? ORDER BY created_at", (db_id,)
+            ).fetchall()
+        return {file_id: json.loads(record) for file_id, record in rows}
+
+    def count_files_by_database(self, db_id: str) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT count(*) FROM files WHERE database_id = ?", (db_id,)).fetchone()[0]
+
+    def upsert_file(self, file_id: str, record: dict):
+        with self._lock:
+            self._upsert_file(file_id, record)
+
+    def upsert_files(self, records: dict[str, dict]):
+        """在一个事务中批量写入文件记录"""
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                for file_id, record in records.items():
+                    self._upsert_file(file_id, record)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _upsert_file(self, file_id: str, record: dict):
+        self._conn.execute(
+            "INSERT INTO files (file_id, database_id, status, record, created_at) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(file_id) DO UPDATE SET database_id = excluded.database_id, status = excluded.status, record = excluded.record",
+            (
+                file_id,
+                record.get("database_id"),
+                record.get("status"),
+                json.dumps(record, ensure_ascii=False),
+                record.get("created_at"),
+            ),
+        )
+
+    def update_file(self, file_id: str, **fields) -> dict | None:
+        """更新文件记录中的部分字段，返回更新后的记录"""
+        with self._lock:
+            row = self._conn.execute("SELECT record FROM files WHERE file_id = ?", (file_id,)).fetchone()
+            if not row:
+                return None
+            record = json.loads(row[0]) | fields
+            self._upsert_file(file_id, record)
+        return record
+
+    def delete_file(self, file_id: str):
+        """删除文件记录及其 chunk 索引、内容指纹"""
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.execute("DELETE FROM doc_chunks WHERE doc_id = ?", (file_id,))
+                self._delete_fingerprint(file_id)
+                self._conn.execute("DELETE FROM files WHERE file_id = ?", (file_id,))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    # --------------------------------------------------------------- doc chunks
+
+    def set_doc_chunks(self, db_id: str, doc_id: str, chunk_ids: list[str]):
+        """覆盖写入文档的 chunk 索引，chunk_ids 按 chunk 在文档中的顺序排列"""
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.execute("DELETE FROM doc_chunks WHERE doc_id = ?", (doc_id,))
+                self._conn.executemany(
+                    "INSERT INTO doc_chunks (doc_id, chunk_id, chunk_order, database_id) VALUES (?, ?, ?, ?)",
+                    [(doc_id, chunk_id, order, db_id) for order, chunk_id in enumerate(chunk_ids)],
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def get_doc_chunk_ids(self, doc_id: str, offset: int = 0, limit: int | None = None) -> list[str]:
+        """按顺序分页获取文档的 chunk id"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT chunk_id FROM doc_chunks WHERE doc_id = ? ORDER BY chunk_order LIMIT ? OFFSET ?",
+                (doc_id, -1 if limit is None else limit, offset),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def count_doc_chunks(self, doc_id: str) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT count(*) FROM doc_chunks WHERE doc_id = ?", (doc_id,)).fetchone()[0]
+
+    def is_chunk_index_backfilled(self, db_id: str) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM chunk_index_backfilled WHERE database_id = ?", (db_id,)).fetchone() is not None
+
+    def mark_chunk_index_backfilled(self, db_id: str):
+        """记录数据库已完成旧文档的 chunk 索引补建，之后不再全量扫描"""
+        with self._lock:
+            self._conn.execute("INSERT OR IGNORE INTO chunk_index_backfilled (database_id) VALUES (?)", (db_id,))
+
+    # ------------------------------------------------------------- fingerprints
+
+    def set_fingerprint(self, db_id: str, doc_id: str, content_hash: str, signature: bytes, bands: list[str]):
+        """写入文档的内容指纹与 LSH 分段桶键"""
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._delete_fingerprint(doc_id)
+                self._conn.execute(
+                    "INSERT INTO doc_fingerprints (doc_id, database_id, content_hash, signature) VALUES (?, ?, ?, ?)",
+                    (doc_id, db_id, content_hash, signature),
+                )
+                self._conn.executemany(
+                    "INSERT INTO doc_lsh_bands (database_id, band, doc_id) VALUES (?, ?, ?)",
+                    [(db_id, band, doc_id) for band in bands],
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _delete_fingerprint(self, doc_id: str):
+        self._conn.execute("DELETE FROM doc_fingerprints WHERE doc_id = ?", (doc_id,))
+        self._conn.execute("DELETE FROM doc_lsh_bands WHERE doc_id = ?", (doc_id,))
+
+    def find_doc_by_hash(self, db_id: str, content_hash: str) -> str | None:
+        """按正文哈希查找同一数据库中内容完全相同的文档"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT doc_id FROM doc_fingerprints WHERE database_id = ? AND content_hash = ? LIMIT 1", (db_id, content_hash)
+            ).fetchone()
+        return row[0] if row else None
+
+    def find_lsh_candidates(self, db_id: str, bands: list[str]) -> dict[str, bytes]:
+        """返回与任一桶键相同的文档及其 MinHash 签名 {doc_id: signature}"""
+        if not bands:
+            return {}
+        placeholders = ",".join("?" * len(bands))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT f.doc_id, f.signature FROM doc_fingerprints f WHERE f.doc_id IN "
+                f"(SELECT DISTINCT doc_id FROM doc_lsh_bands WHERE database_id = ? AND band IN ({placeholders}))",
+                (db_id, *bands),
+            ).fetchall()
+        return {doc_id: signature for doc_id, signature in rows if signature}
+
+    # ---------------------------------------------------------------- migration
+
+    def migrate_from_json(self, meta_file: str) -> bool:
+        """从旧版 metadata.json 一次性导入元数据，导入后将原文件重命名为 metadata.json.migrated"""
+        if not os.path.exists(meta_file):
+            return False
+
+        with open(meta_file, encoding='utf-8') as f:
+            data = json.load(f)
+
+        databases = data.get("databases", {})
+        files = data.get("files", {})
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                for db_id, meta in databases.items():
+                    self._conn.execute(
+                        "INSERT OR IGNORE INTO databases (db_id, meta) VALUES (?, ?)",
+                        (db_id, json.dumps(meta, ensure_ascii=False)),
+                    )
+                for file_id, record in files.items():
+                    self._conn.execute(
+                        "INSERT OR IGNORE INTO files (file_id, database_id, status, record, created_at) VALUES (?, ?, ?, ?, ?)",
+                        (file_id, record.get("database_id"), record.get("status"),
+                         json.dumps(record, ensure_ascii=False), record.get("created_at")),
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+        os.replace(meta_file, f"{meta_file}.migrated")
+        logger.info(f"Migrated {len(databases)} databases and {len(files)} files from {meta_file} to {self.db_path}")
+        return True
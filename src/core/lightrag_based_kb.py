@@ -1,21 +1,28 @@
 import os
-import json
 import time
 import traceback
 import shutil
 import asyncio
 from pathlib import Path
+from contextlib import asynccontextmanager
 from typing import Optional
 from datetime import datetime
 
 from lightrag import LightRAG, QueryParam
 from lightrag.llm.openai import openai_complete_if_cache, openai_embed
-from lightrag.utils import EmbeddingFunc, setup_logger
-from lightrag.kg.shared_storage import initialize_pipeline_status
+from lightrag.utils import EmbeddingFunc, setup_logger, compute_mdhash_id, clean_text
+from lightrag.constants import GRAPH_FIELD_SEP
+from lightrag.kg.shared_storage import initialize_pipeline_status, get_graph_db_lock
 
 from src import config
 from src.utils import logger, hashstr, get_docker_safe_url
 from src.plugins import ocr
+from src.core.kb_metadata import KBMetadataStore
+from src.core.query_cache import QueryCache
+from src.core.parse_cache import get_parse_cache
+from src.core.dedup import DocumentFingerprint
+from src.core.instance_pool import LightRAGInstancePool
+from src.core.retrieval_fusion import fuse_contexts
 
 work_dir = os.path.join(config.save_dir, "lightrag_data")
 log_dir = os.path.join(work_dir, "logs", "lightrag")
@@ -25,59 +32,79 @@ class LightRagBasedKB:
     """基于 LightRAG 的知识库管理类"""
 
     def __init__(self) -> None:
-        # 存储 LightRAG 实例映射 {db_id: LightRAG}
-        self.instances: dict[str, LightRAG] = {}
-        # 数据库元信息存储 {db_id: metadata}
-        self.databases_meta: dict[str, dict] = {}
-        # 文件信息存储 {file_id: file_info}
-        self.files_meta: dict[str, dict] = {}
         # 工作目录
         self.work_dir = os.path.join(config.save_dir, "lightrag_data")
         os.makedirs(self.work_dir, exist_ok=True)
 
+        # 元数据存储，文件记录按需从存储中查询，不再常驻内存
+        self.meta_store = KBMetadataStore(os.path.join(self.work_dir, "metadata.db"))
+        # 数据库元信息存储 {db_id: metadata}，数量较少，作为存储的内存副本
+        self.databases_meta: dict[str, dict] = {}
+
+        # LightRAG 实例池，按 LRU 和空闲时间回收实例
+        self.instance_pool = LightRAGInstancePool(
+            self._create_lightrag_instance,
+            max_size=int(os.getenv("KB_MAX_INSTANCES", 32)),
+            idle_ttl=float(os.getenv("KB_INSTANCE_IDLE_TTL", 1800)),
+            on_usage_flush=self.meta_store.add_usage,
+        )
+
+        # 检索结果缓存，KB_QUERY_CACHE_SIMILARITY 为 0 时仅使用精确匹配
+        self.query_cache = QueryCache(
+            max_size=int(os.getenv("KB_QUERY_CACHE_SIZE", 1024)),
+            ttl=float(os.getenv("KB_QUERY_CACHE_TTL", 3600)),
+            similarity_threshold=float(os.getenv("KB_QUERY_CACHE_SIMILARITY", 0)) or None,
+        )
+
+        # 文档解析结果缓存，相同内容的文件无需重复解析
+        self.parse_cache = get_parse_cache(config.save_dir)
+
         # 加载已有的元数据
         self._load_metadata()
 
         logger.info("LightRagBasedKB initialized")
 
     def _load_metadata(self):
-        """加载元数据"""
+        """加载元数据，首次启动时从旧版 metadata.json 迁移"""
         meta_file = os.path.join(self.work_dir, "metadata.json")
-        if os.path.exists(meta_file):
-            try:
-                with open(meta_file, encoding='utf-8') as f:
-                    data = json.load(f)
-                    self.databases_meta = data.get("databases", {})
-                    self.files_meta = data.get("files", {})
-                logger.info(f"Loaded metadata for {len(self.databases_meta)} databases")
-            except Exception as e:
-                logger.error(f"Failed to load metadata: {e}")
+        try:
+            self.meta_store.migrate_from_json(meta_file)
+        except Exception as e:
+            logger.error(f"Failed to migrate metadata from {meta_file}: {e}, {traceback.format_exc()}")
 
-    def _save_metadata(self):
-        """保存元数据"""
-        # 确保工作目录存在
-        os.makedirs(self.work_dir, exist_ok=True)
+        try:
+            self.databases_meta = self.meta_store.get_all_databases()
+            logger.info(f"Loaded metadata for {len(self.databases_meta)} databases")
+        except Exception as e:
+            logger.error(f"Failed to load metadata: {e}")
 
-        meta_file = os.path.join(self.work_dir, "metadata.json")
+    def _save_database_meta(self, db_id):
+        """保存单个数据库的元信息"""
         try:
-            data = {
-                "databases": self.databases_meta,
-                "files": self.files_meta
-            }
-            with open(meta_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
+            self.meta_store.upsert_database(db_id, self.databases_meta[db_id])
         except Exception as e:
-            logger.error(f"Failed to save metadata: {e}")
+            logger.error(f"Failed to save metadata of {db_id}: {e}")
 
     async def _get_lightrag_instance(self, db_id: str) -> LightRAG | None:
         """获取或创建 LightRAG 实例"""
-        logger.info(f"Getting or creating LightRAG instance for {db_id}")
+        if db_id not in self.databases_meta:
+            return None
 
-        if db_id in self.instances:
-            return self.instances[db_id]
+        return await self.instance_pool.get(db_id)
 
+    @asynccontextmanager
+    async def _lease_lightrag_instance(self, db_id: str):
+        """在 async with 块内占用 LightRAG 实例，使用期间不会被实例池淘汰，数据库不存在时得到 None"""
         if db_id not in self.databases_meta:
-            return None
+            yield None
+            return
+
+        async with self.instance_pool.lease(db_id) as rag:
+            yield rag
+
+    async def _create_lightrag_instance(self, db_id: str) -> LightRAG | None:
+        """创建并初始化 LightRAG 实例，由实例池调用"""
+        logger.info(f"Creating LightRAG instance for {db_id}")
 
         llm_info = self.databases_meta[db_id].get("llm_info", {})
         embed_info = self.databases_meta[db_id].get("embed_info", {})
@@ -104,7 +131,6 @@ class LightRagBasedKB:
             # 异步初始化存储
             await self._initialize_rag_storages(rag)
 
-            self.instances[db_id] = rag
             return rag
 
         except Exception as e:
@@ -158,47 +184,82 @@ class LightRagBasedKB:
         )
 
     async def _process_file_to_markdown(self, file_path: str, params: dict | None = None) -> str:
-        """将不同类型的文件转换为 markdown 格式"""
+        """将不同类型的文件转换为 markdown 格式
+
+        除纯文本外，解析得到的正文按 (文件内容哈希, 解析器, 解析参数) 缓存，
+        标题行包含文件名，不放入缓存，因此同一内容以不同文件名上传也能命中。
+        """
         file_path_obj = Path(file_path)
         file_ext = file_path_obj.suffix.lower()
 
         if file_ext == '.pdf':
-            # 使用 OCR 处理 PDF
-            from src.core.indexing import parse_pdf_async
-            text = await parse_pdf_async(str(file_path_obj), params=params)
-            return f"Using OCR to process {file_path_obj.name}\n\n{text}"
+            header = f"Using OCR to process {file_path_obj.name}\n\n"
+        else:
+            header = f"# {file_path_obj.name}\n\n"
 
-        elif file_ext in ['.txt', '.md']:
+        if file_ext in ['.txt', '.md']:
             # 直接读取文本文件
             with open(file_path_obj, encoding='utf-8') as f:
                 content = f.read()
-            return f"# {file_path_obj.name}\n\n{content}"
+            return header + content
+
+        cache_key = None
+        if self.parse_cache is not None:
+            cache_key = await asyncio.to_thread(self.parse_cache.make_key, file_path_obj, file_ext, self._parser_cache_params(file_ext, params))
+            cached = await asyncio.to_thread(self.parse_cache.get, cache_key)
+            if cached is not None:
+                logger.info(f"Parse cache hit for {file_path_obj.name}")
+                return header + cached
+
+        # 混合解析中某个 OCR 步骤失败时会得到缺页的正文，这种结果不缓存，下次上传重新解析
+        report = {"complete": True}
+        text = await self._parse_file_body(file_path_obj, file_ext, params, report=report)
+        if cache_key is not None and text and report["complete"]:
+            await asyncio.to_thread(self.parse_cache.put, cache_key, text)
+        return header + text
+
+    @staticmethod
+    def _parser_cache_params(file_ext: str, params: dict | None) -> dict:
+        """影响解析结果的参数，作为解析缓存键的一部分"""
+        if file_ext == '.pdf':
+            from src.core.indexing import use_hybrid_ocr
+            params = params or {}
+            return {
+                "enable_ocr": params.get("enable_ocr", "disable"),
+                "hybrid_ocr": use_hybrid_ocr(params),
+            }
+        return {}
+
+    async def _parse_file_body(self, file_path_obj: Path, file_ext: str, params: dict | None = None, report: dict | None = None) -> str:
+        """解析文件正文，report 见 parse_pdf"""
+        if file_ext == '.pdf':
+            # 使用 OCR 处理 PDF
+            from src.core.indexing import parse_pdf_async
+            return await parse_pdf_async(str(file_path_obj), params=params, report=report)
 
         elif file_ext in ['.doc', '.docx']:
             # 处理 Word 文档
 
             from docx import Document  # type: ignore
-            doc = Document(file_path_obj)
-            text = '\n'.join([para.text for para in doc.paragraphs])
-            return f"# {file_path_obj.name}\n\n{text}"
+            doc = await asyncio.to_thread(Document, file_path_obj)
+            return '\n'.join([para.text for para in doc.paragraphs])
 
         elif file_ext in ['.jpg', '.jpeg', '.png', '.bmp']:
             # 使用 OCR 处理图片
-            text = ocr.process_image(str(file_path_obj))
-            return f"# {file_path_obj.name}\n\n{text}"
+            return await asyncio.to_thread(ocr.process_image, str(file_path_obj))
 
         else:
             # 尝试作为文本文件读取
             import textract  # type: ignore
-            text = textract.process(file_path_obj)
-            return f"# {file_path_obj.name}\n\n{text}"
+            text = await asyncio.to_thread(textract.process, file_path_obj)
+            return text.decode('utf-8', errors='replace') if isinstance(text, bytes) else str(text)
 
     async def _process_url_to_markdown(self, url: str, params: dict | None = None) -> str:
         """将 URL 转换为 markdown 格式"""
         import requests
         from bs4 import BeautifulSoup
 
-        response = requests.get(url, timeout=30)
+        response = await asyncio.to_thread(requests.get, url, timeout=30)
         soup = BeautifulSoup(response.content, 'html.parser')
         text_content = soup.get_text()
         return f"# {url}\n\n{text_content}"
@@ -210,30 +271,25 @@ class LightRagBasedKB:
     def get_databases(self):
         """获取所有数据库信息 - data_router.py 使用"""
         databases = []
-        for db_id, meta in self.databases_meta.items():
-            db_dict = meta.copy()
-            db_dict["db_id"] = db_id
-
-            # 获取文件信息
-            db_files = {}
-            for file_id, file_info in self.files_meta.items():
-                if file_info.get("database_id") == db_id:
-                    db_files[file_id] = {
-                        "file_id": file_id,
-                        "filename": file_info.get("filename", ""),
-                        "path": file_info.get("path", ""),
-                        "type": file_info.get("file_type", ""),
-                        "status": file_info.get("status", "done"),
-                        "created_at": file_info.get("created_at", time.time())
-                    }
-
-            db_dict["files"] = db_files
-            db_dict["row_count"] = len(db_files)
-            db_dict["status"] = "已连接"
-            databases.append(db_dict)
+        for db_id in self.databases_meta:
+            databases.append(self.get_database_info(db_id))
 
         return {"databases": databases}
 
+    def _format_db_files(self, db_id):
+        """通过 database_id 索引获取数据库的文件信息"""
+        db_files = {}
+        for file_id, file_info in self.meta_store.get_files_by_database(db_id).items():
+            db_files[file_id] = {
+                "file_id": file_id,
+                "filename": file_info.get("filename", ""),
+                "path": file_info.get("path", ""),
+                "type": file_info.get("file_type", ""),
+                "status": file_info.get("status", "done"),
+                "created_at": file_info.get("created_at", time.time())
+            }
+        return db_files
+
     def create_database(self, database_name, description, embed_info: dict | None = None, **kwargs):
         """创建数据库 - data_router.py 使用"""
         db_id = f"kb_{hashstr(database_name, with_salt=True)}"
@@ -246,7 +302,7 @@ class LightRagBasedKB:
             "metadata": kwargs,
             "created_at": datetime.now().isoformat()
         }
-        self._save_metadata()
+        self._save_database_meta(db_id)
 
         # 创建工作目录
         working_dir = os.path.join(self.work_dir, db_id)
@@ -263,20 +319,13 @@ class LightRagBasedKB:
         """删除数据库 - data_router.py 使用"""
         # TODO 删除数据库时，需要删除文件记录，并删除 LightRAG 中的文件
         if db_id in self.databases_meta:
-            # 删除相关文件记录
-            files_to_delete = [fid for fid, finfo in self.files_meta.items()
-                             if finfo.get("database_id") == db_id]
-            for file_id in files_to_delete:
-                del self.files_meta[file_id]
-
-            # 删除数据库记录
+            # 删除数据库记录及相关文件记录
+            self.meta_store.delete_database(db_id)
             del self.databases_meta[db_id]
+            self.query_cache.invalidate(db_id)
 
             # 删除 LightRAG 实例
-            if db_id in self.instances:
-                del self.instances[db_id]
-
-            self._save_metadata()
+            self.instance_pool.discard(db_id)
 
         # 删除工作目录
         working_dir = os.path.join(self.work_dir, db_id)
@@ -288,80 +337,243 @@ class LightRagBasedKB:
 
         return {"message": "删除成功"}
 
-    async def add_content(self, db_id, items, params: dict | None = None):
-        """通用的内容添加方法 - 支持文件和URL"""
+    async def add_content(self, db_id, items, params: dict | None = None, progress_callback=None):
+        """通用的内容添加方法 - 支持文件和URL
+
+        内容按「解析 -> LightRAG 插入」两个阶段以流水线方式处理，两个阶段各自有独立的并发上限，
+        阶段之间使用有界队列衔接（队列满时解析阶段会等待，形成背压）。单个文件解析或插入失败
+        只会把该文件标记为 failed，不会阻塞同一批次的其他文件。
+
+        Args:
+            db_id: 数据库ID
+            items: 文件路径或 URL 列表
+            params: 处理参数，除解析参数外还支持：
+                - parse_concurrency: 解析阶段并发数
+                - insert_concurrency: 插入阶段并发数
+                - pipeline_queue_size: 阶段间队列长度
+                - parse_timeout / insert_timeout: 单个文件在各阶段的超时时间（秒），insert_timeout 默认为 KB_INSERT_TIMEOUT（3600）
+                - on_duplicate: 正文与库中已有文档完全相同时的处理方式，skip（默认，标记为 skipped 并记录 duplicate_of）
+                  或 insert（仍然导入）；近似重复的文档照常导入，并在记录中标注 near_duplicate_of 与 similarity
+            progress_callback: 可选回调，每个文件的阶段发生变化时以文件记录（dict）调用，支持协程函数。
+                所有文件会先按 items 的顺序各回调一次 queued 阶段
+        """
         if db_id not in self.databases_meta:
             raise ValueError(f"Database {db_id} not found")
 
-        rag = await self._get_lightrag_instance(db_id)
+        # 导入过程中占用实例，避免被实例池淘汰
+        rag = await self.instance_pool.acquire(db_id)
         if not rag:
             raise ValueError(f"Failed to get LightRAG instance for {db_id}")
 
-        content_type = params.get('content_type', 'file') if params else 'file'
-
-        processed_items_info = []
-
-        for item in items:
-            # 根据内容类型生成不同的ID和文件名
-            if content_type == "file":
-                file_path = Path(item)
-                file_id = f"file_{hashstr(str(file_path) + str(time.time()), 6)}"
-                file_type = file_path.suffix.lower().replace(".", "")
-                filename = file_path.name
-                item_path = str(file_path)
-            else:  # URL
-                file_id = f"url_{hashstr(item + str(time.time()), 6)}"
-                file_type = "url"
-                filename = f"webpage_{hashstr(item, 6)}.md"
-                item_path = item
-
-            # 添加文件记录
-            file_record = {
-                "database_id": db_id,
-                "filename": filename,
-                "path": item_path,
-                "file_type": file_type,
-                "status": "processing",
-                "created_at": time.time()
-            }
-            self.files_meta[file_id] = file_record
-            self._save_metadata()
-
-            # 添加 file_id 到返回数据
-            file_record = file_record.copy()
-            file_record["file_id"] = file_id
-
+        try:
+            return await self._run_ingestion(db_id, rag, items, params, progress_callback)
+        finally:
+            self.instance_pool.release(db_id)
+
+    async def _run_ingestion(self, db_id, rag: LightRAG, items, params: dict | None, progress_callback=None):
+        """add_content 的分阶段导入流水线"""
+        params = params or {}
+        content_type = params.get('content_type', 'file')
+        parse_concurrency = max(1, int(params.get("parse_concurrency") or os.getenv("KB_PARSE_CONCURRENCY", 4)))
+        insert_concurrency = max(1, int(params.get("insert_concurrency") or os.getenv("KB_INSERT_CONCURRENCY", 2)))
+        queue_size = max(1, int(params.get("pipeline_queue_size") or os.getenv("KB_PIPELINE_QUEUE_SIZE", parse_concurrency * 2)))
+        parse_timeout = params.get("parse_timeout") or None
+        # 插入阶段轮询 doc_status 等待 LightRAG 处理完成，文档一直停留在 pending / processing 时由超时结束等待
+        insert_timeout = float(params.get("insert_timeout") or os.getenv("KB_INSERT_TIMEOUT", 3600))
+        dedup_enabled = os.getenv("KB_DEDUP_ENABLED", "true").lower() in ("1", "true", "yes")
+        on_duplicate = params.get("on_duplicate", "skip")
+        # 本批次中已认领的正文哈希 -> file_id，同一批次内的重复文件只导入第一个
+        claimed: dict[str, str] = {}
+
+        # 先为所有内容创建文件记录，前端可以立即看到整批文件的处理状态
+        file_records = [self._create_file_record(db_id, item, content_type) for item in items]
+        self.meta_store.upsert_files({r["file_id"]: {k: v for k, v in r.items() if k != "file_id"} for r in file_records})
+
+        pending_queue: asyncio.Queue = asyncio.Queue()
+        for item, file_record in zip(items, file_records):
+            pending_queue.put_nowait((item, file_record))
+        parsed_queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+
+        async def report(file_record, stage, status=None, error=None):
+            """更新单个文件的处理阶段并回调通知"""
+            file_record["stage"] = stage
+            if status:
+                file_record["status"] = status
+            if error:
+                file_record["error"] = error
+            self.meta_store.upsert_file(file_record["file_id"], {k: v for k, v in file_record.items() if k != "file_id"})
+            if progress_callback:
+                try:
+                    result = progress_callback(file_record.copy())
+                    if asyncio.iscoroutine(result):
+                        await result
+                except Exception as e:
+                    logger.warning(f"Progress callback failed for {file_record['file_id']}: {e}")
+
+        async def parse_worker():
+            while True:
+                try:
+                    item, file_record = pending_queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+
+                await report(file_record, "parsing")
+                try:
+                    if content_type == "file":
+                        parse_coro = self._process_file_to_markdown(item, params=params)
+                    else:  # URL
+                        parse_coro = self._process_url_to_markdown(item, params=params)
+                    markdown_content = await asyncio.wait_for(parse_coro, timeout=parse_timeout)
+                except Exception as e:
+                    logger.error(f"解析{content_type} {item} 失败: {e}, {traceback.format_exc()}")
+                    await report(file_record, "failed", status="failed", error=f"parse failed: {e}")
+                    continue
+
+                fingerprint = None
+                if dedup_enabled:
+                    # 标题行包含文件名，不参与指纹计算
+                    fingerprint = await asyncio.to_thread(DocumentFingerprint.from_text, markdown_content.partition("\n\n")[2])
+                    duplicate_of = claimed.get(fingerprint.content_hash) or self.meta_store.find_doc_by_hash(db_id, fingerprint.content_hash)
+                    if duplicate_of and on_duplicate == "skip":
+                        logger.info(f"Skip {content_type} {item}: same content as {duplicate_of}")
+                        file_record["duplicate_of"] = duplicate_of
+                        await report(file_record, "duplicate", status="skipped")
+                        continue
+                    claimed.setdefault(fingerprint.content_hash, file_record["file_id"])
+                    near_duplicate = self._find_near_duplicate(db_id, fingerprint)
+                    if near_duplicate:
+                        file_record["near_duplicate_of"], file_record["similarity"] = near_duplicate
+
+                await report(file_record, "waiting_insert")
+                # 队列已满时在此等待，避免解析结果在内存中无限堆积
+                await parsed_queue.put((item, file_record, markdown_content, fingerprint))
+
+        async def insert_worker():
+            while True:
+                entry = await parsed_queue.get()
+                if entry is None:
+                    return
+                try:
+                    await insert_one(*entry)
+                except Exception as e:
+                    # 记录状态等失败时只影响当前文件，worker 继续消费队列，避免解析阶段阻塞在已满的队列上
+                    logger.error(f"插入{content_type} {entry[0]} 时出错: {e}, {traceback.format_exc()}")
+
+        async def insert_one(item, file_record, markdown_content, fingerprint):
+            await report(file_record, "inserting")
             try:
-                # 根据内容类型处理内容
-                if content_type == "file":
-                    markdown_content = await self._process_file_to_markdown(item, params=params)
-                    # logger.info(f"Markdown content: {markdown_content[:100].replace('\n', ' ')}...")
-                else:  # URL
-                    markdown_content = await self._process_url_to_markdown(item, params=params)
-
-                # 使用 LightRAG 插入内容
-                await rag.ainsert(
-                    input=markdown_content,
-                    ids=file_id,
-                    file_paths=item_path
+                await asyncio.wait_for(
+                    self._insert_document(db_id, rag, markdown_content, file_record["file_id"], file_record["path"]),
+                    timeout=insert_timeout
                 )
-
                 logger.info(f"Inserted {content_type} {item} into LightRAG. Done.")
+                if fingerprint is not None:
+                    self._save_fingerprint(db_id, file_record["file_id"], fingerprint)
+                self.query_cache.invalidate(db_id)
+                await report(file_record, "done", status="done")
+            except Exception as e:
+                logger.error(f"插入{content_type} {item} 失败: {e}, {traceback.format_exc()}")
+                if fingerprint is not None and claimed.get(fingerprint.content_hash) == file_record["file_id"]:
+                    del claimed[fingerprint.content_hash]
+                # 插入失败时文档可能已部分写入图谱，同样需要让缓存失效
+                self.query_cache.invalidate(db_id)
+                error = f"insert timed out after {insert_timeout:g}s" if isinstance(e, TimeoutError) else f"insert failed: {e}"
+                await report(file_record, "failed", status="failed", error=error)
+
+        # 按 items 的顺序报告 queued 阶段，调用方可据此将 file_id 与输入内容一一对应
+        for file_record in file_records:
+            await report(file_record, "queued")
+
+        async def run_parse_stage():
+            # 等所有解析 worker 结束（包括异常退出的）后再发送结束标记，否则插入阶段会一直等待队列
+            results = await asyncio.gather(*[parse_worker() for _ in range(min(parse_concurrency, len(file_records)) or 1)], return_exceptions=True)
+            for _ in range(insert_concurrency):
+                await parsed_queue.put(None)
+            for result in results:
+                if isinstance(result, BaseException):
+                    raise result
+
+        # 解析阶段出错时插入阶段仍会处理完已解析的文件并正常退出，全部结束后再抛出异常
+        results = await asyncio.gather(
+            run_parse_stage(),
+            *[insert_worker() for _ in range(insert_concurrency)],
+            return_exceptions=True,
+        )
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+
+        return [file_record.copy() for file_record in file_records]
+
+    def _find_near_duplicate(self, db_id: str, fingerprint: DocumentFingerprint) -> tuple[str, float] | None:
+        """通过 LSH 桶找出候选文档，返回估计相似度最高且超过阈值的 (doc_id, similarity)"""
+        threshold = float(os.getenv("KB_NEAR_DUPLICATE_THRESHOLD", 0.8))
+        best = None
+        for doc_id, signature in self.meta_store.find_lsh_candidates(db_id, fingerprint.bands).items():
+            similarity = fingerprint.similarity(DocumentFingerprint.signature_from_bytes(signature))
+            if similarity >= threshold and (best is None or similarity > best[1]):
+                best = (doc_id, round(similarity, 4))
+        return best
+
+    def _save_fingerprint(self, db_id: str, doc_id: str, fingerprint: DocumentFingerprint):
+        try:
+            self.meta_store.set_fingerprint(db_id, doc_id, fingerprint.content_hash, fingerprint.signature_bytes(), fingerprint.bands)
+        except Exception as e:
+            logger.warning(f"Failed to save fingerprint of {doc_id}: {e}")
+
+    def _create_file_record(self, db_id, item, content_type):
+        """为待处理的文件或URL生成文件记录（尚未写入存储），返回带 file_id 的记录"""
+        # 根据内容类型生成不同的ID和文件名
+        if content_type == "file":
+            file_path = Path(item)
+            file_id = f"file_{hashstr(str(file_path) + str(time.time()), 6)}"
+            file_type = file_path.suffix.lower().replace(".", "")
+            filename = file_path.name
+            item_path = str(file_path)
+        else:  # URL
+            file_id = f"url_{hashstr(item + str(time.time()), 6)}"
+            file_type = "url"
+            filename = f"webpage_{hashstr(item, 6)}.md"
+            item_path = item
+
+        file_record = {
+            "database_id": db_id,
+            "filename": filename,
+            "path": item_path,
+            "file_type": file_type,
+            "status": "processing",
+            "stage": "queued",
+            "created_at": time.time()
+        }
 
-                # 更新状态为完成
-                self.files_meta[file_id]["status"] = "done"
-                self._save_metadata()
-                file_record['status'] = "done"
+        file_record = file_record.copy()
+        file_record["file_id"] = file_id
+        return file_record
 
-            except Exception as e:
-                logger.error(f"处理{content_type} {item} 失败: {e}, {traceback.format_exc()}")
-                self.files_meta[file_id]["status"] = "failed"
-                self._save_metadata()
-                file_record['status'] = "failed"
+    async def _insert_document(self, db_id: str, rag: LightRAG, content: str, doc_id: str, file_path: str, poll_interval: float = 1.0):
+        """插入文档并等待 LightRAG 处理完成
+
+        多个 ainsert 并发执行时，LightRAG 的处理流水线是共享的：后到的调用只会把文档加入队列并立即返回，
+        由正在运行的流水线负责处理。因此这里以 doc_status 中的状态为准判断文档是否真正处理完成。
+        """
+        await rag.ainsert(input=content, ids=doc_id, file_paths=file_path)
+
+        while True:
+            doc_status = await rag.doc_status.get_by_id(doc_id)
+            if not doc_status:
+                raise RuntimeError(f"Document {doc_id} not found in doc_status after insert")
 
-            processed_items_info.append(file_record)
+            status = getattr(doc_status.get("status"), "value", doc_status.get("status"))
+            if status == "processed":
+                try:
+                    await self._index_doc_chunks(db_id, rag, doc_id, doc_status)
+                except Exception as e:
+                    logger.warning(f"Failed to index chunks of {doc_id}, will rebuild on read: {e}")
+                return
+            if status == "failed":
+                raise RuntimeError(doc_status.get("error") or f"LightRAG failed to process {doc_id}")
 
-        return processed_items_info
+            await asyncio.sleep(poll_interval)
 
     def get_database_info(self, db_id):
         """获取数据库详细信息 - data_router.py 使用"""
@@ -372,69 +584,312 @@ class LightRagBasedKB:
         meta["db_id"] = db_id
 
         # 获取文件信息
-        db_files = {}
-        for file_id, file_info in self.files_meta.items():
-            if file_info.get("database_id") == db_id:
-                db_files[file_id] = {
-                    "file_id": file_id,
-                    "filename": file_info.get("filename", ""),
-                    "path": file_info.get("path", ""),
-                    "type": file_info.get("file_type", ""),
-                    "status": file_info.get("status", "done"),
-                    "created_at": file_info.get("created_at", time.time())
-                }
+        db_files = self._format_db_files(db_id)
 
         meta["files"] = db_files
         meta["row_count"] = len(db_files)
         meta["status"] = "已连接"
         return meta
 
+    async def _index_doc_chunks(self, db_id: str, rag: LightRAG, doc_id: str, doc_status: dict | None = None) -> list[str]:
+        """建立文档 doc_id -> chunk_ids 的索引，返回按顺序排列的 chunk id
+
+        优先使用 doc_status 中记录的 chunks_list；旧版本 LightRAG 没有该字段时，
+        使用与插入时相同的切分函数重新切分全文并计算 chunk id，再通过 text_chunks 校验归属。
+        """
+        chunk_ids = list((doc_status or {}).get("chunks_list") or [])
+
+        if not chunk_ids:
+            full_doc = await rag.full_docs.get_by_id(doc_id)
+            if full_doc and full_doc.get("content"):
+                chunking_results = rag.chunking_func(
+                    rag.tokenizer,
+                    full_doc["content"],
+                    None,
+                    False,
+                    rag.chunk_overlap_token_size,
+                    rag.chunk_token_size,
+                )
+                chunk_ids = list(dict.fromkeys(compute_mdhash_id(dp["content"], prefix="chunk-") for dp in chunking_results))
+
+        chunks = await rag.text_chunks.get_by_ids(chunk_ids) if chunk_ids else []
+        doc_chunks = [
+            (chunk.get("chunk_order_index", order), chunk_id)
+            for order, (chunk_id, chunk) in enumerate(zip(chunk_ids, chunks))
+            if chunk and chunk.get("full_doc_id") == doc_id
+        ]
+        doc_chunks.sort()
+        chunk_ids = [chunk_id for _, chunk_id in doc_chunks]
+        self.meta_store.set_doc_chunks(db_id, doc_id, chunk_ids)
+        return chunk_ids
+
+    async def _backfill_doc_chunks(self, rag: LightRAG, db_id: str):
+        """为建立索引之前导入的文档一次性补建 chunk 索引，完成后记录标记，每个数据库最多执行一次"""
+        logger.info(f"Backfilling chunk index for {db_id}")
+        all_chunks = await rag.text_chunks.get_all()  # type: ignore
+
+        doc_chunks: dict[str, list] = {}
+        for chunk_id, chunk_data in all_chunks.items():
+            if isinstance(chunk_data, dict) and chunk_data.get("full_doc_id"):
+                doc_chunks.setdefault(chunk_data["full_doc_id"], []).append((chunk_data.get("chunk_order_index", 0), chunk_id))
+
+        indexed_files = self.meta_store.get_files_by_database(db_id)
+        for doc_id, chunks in doc_chunks.items():
+            if doc_id in indexed_files and not self.meta_store.count_doc_chunks(doc_id):
+                chunks.sort()
+                self.meta_store.set_doc_chunks(db_id, doc_id, [chunk_id for _, chunk_id in chunks])
+        # 全量扫描之后仍没有 chunk 的文档不会因为再次扫描而出现，每个数据库只补建一次
+        self.meta_store.mark_chunk_index_backfilled(db_id)
+
     async def delete_file(self, db_id, file_id):
         """删除文件 - data_router.py 使用"""
         # TODO 删除文件时，需要删除文件记录，并删除 LightRAG 中的文件
-        rag = await self._get_lightrag_instance(db_id)
-        if rag:
-            try:
-                # 使用 LightRAG 删除文档
-                await rag.adelete_by_doc_id(file_id)
-            except Exception as e:
-                logger.error(f"Error deleting file {file_id} from LightRAG: {e}")
+        async with self._lease_lightrag_instance(db_id) as rag:
+            if rag:
+                try:
+                    # 使用 LightRAG 删除文档
+                    await rag.adelete_by_doc_id(file_id)
+                except Exception as e:
+                    logger.error(f"Error deleting file {file_id} from LightRAG: {e}")
 
         # 删除文件记录
-        if file_id in self.files_meta:
-            del self.files_meta[file_id]
-            self._save_metadata()
+        self.meta_store.delete_file(file_id)
+        self.query_cache.invalidate(db_id)
+
+    async def update_document(self, db_id, file_id, file_path, params: dict | None = None):
+        """用新版本文件更新已导入的文档，只对变化的部分重新抽取实体
+
+        旧版本的 chunk 在新正文中按顺序逐个查找，原样出现的 chunk 保留（不再调用 LLM），
+        相邻保留 chunk 之间的新增或修改文本重新切分为新 chunk 并通过 ainsert_custom_chunks 抽取实体；
+        新 chunk 写入成功后，新版本中不再出现的 chunk 才被删除，并从图谱实体、关系的 source_id 中移除，
+        没有剩余来源的实体和关系一并删除。
+        因此 LLM 的抽取开销与修改量成正比，而不是与文档长度成正比。
+
+        Returns:
+            dict: kept / added / removed 三类 chunk 的数量
+        """
+        if db_id not in self.databases_meta:
+            raise ValueError(f"Database {db_id} not found")
+        file_record = self.meta_store.get_file(file_id)
+        if file_record is None or file_record.get("database_id") != db_id:
+            raise ValueError(f"File {file_id} not found in {db_id}")
+
+        rag = await self.instance_pool.acquire(db_id)
+        if not rag:
+            raise ValueError(f"Failed to get LightRAG instance for {db_id}")
+
+        try:
+            self.meta_store.update_file(file_id, status="processing", stage="parsing")
+            content = await self._process_file_to_markdown(file_path, params=params)
 
-    async def get_file_info(self, db_id, file_id):
-        """获取文件信息和其 chunks - data_router.py 使用"""
-        if file_id not in self.files_meta:
+            self.meta_store.update_file(file_id, stage="inserting")
+            result = await self._update_document_chunks(db_id, rag, file_id, content, str(file_path))
+            self._save_fingerprint(db_id, file_id, DocumentFingerprint.from_text(content.partition("\n\n")[2]))
+        except Exception as e:
+            logger.error(f"更新文档 {file_id} 失败: {e}, {traceback.format_exc()}")
+            self.meta_store.update_file(file_id, status="failed", stage="failed", error=f"update failed: {e}")
+            raise
+        finally:
+            # 部分 chunk 可能已经写入或删除，无论成功与否都让缓存失效
+            self.query_cache.invalidate(db_id)
+            self.instance_pool.release(db_id)
+
+        file_path_obj = Path(file_path)
+        self.meta_store.update_file(
+            file_id, status="done", stage="done", error=None, path=str(file_path_obj),
+            filename=file_path_obj.name, updated_at=time.time(),
+        )
+        logger.info(f"Updated document {file_id} in {db_id}: {result}")
+        return result
+
+    async def _update_document_chunks(self, db_id: str, rag: LightRAG, doc_id: str, content: str, file_path: str) -> dict:
+        """对比新旧 chunk 并只写入变化部分，返回各类 chunk 数量"""
+        old_ids = self.meta_store.get_doc_chunk_ids(doc_id)
+        if not old_ids:
+            old_ids = await self._index_doc_chunks(db_id, rag, doc_id)
+        old_chunks = await rag.text_chunks.get_by_ids(old_ids) if old_ids else []
+
+        # 按顺序在新正文中定位旧 chunk，chunk 之间有重叠，所以下一次从上一个匹配位置之后开始查找
+        kept = []  # (start, end, chunk_id)
+        cursor = 0
+        for chunk_id, chunk in zip(old_ids, old_chunks):
+            # 按 token 切分的 chunk 边界可能截断多字节字符，解码后首尾会出现替换字符
+            text = ((chunk or {}).get("content") or "").strip("\ufffd").strip()
+            pos = content.find(text, cursor) if text else -1
+            if pos >= 0:
+                kept.append((pos, pos + len(text), chunk_id))
+                cursor = pos + 1
+
+        # 保留 chunk 之间未被覆盖的文本即为新增或修改的内容
+        ordered = []  # 新版本中按顺序排列的 (chunk_id, 新 chunk 文本或 None)
+        covered = 0
+        for start, end, chunk_id in kept + [(len(content), len(content), None)]:
+            gap = content[covered:start]
+            if gap.strip():
+                for dp in rag.chunking_func(rag.tokenizer, gap, None, False, rag.chunk_overlap_token_size, rag.chunk_token_size):
+                    # 与 ainsert_custom_chunks 一致先 clean_text，保证 chunk id 与写入时计算的相同
+                    text = clean_text(dp["content"])
+                    if text:
+                        ordered.append((compute_mdhash_id(text, prefix="chunk-"), text))
+            if chunk_id is not None:
+                ordered.append((chunk_id, None))
+            covered = max(covered, end)
+
+        new_ids = list(dict.fromkeys(chunk_id for chunk_id, _ in ordered))
+        old_id_set, new_id_set = set(old_ids), set(new_ids)
+        new_chunks = list({chunk_id: text for chunk_id, text in ordered if text is not None and chunk_id not in old_id_set}.items())
+        # chunk id 是内容哈希，可能与其他文档共用，只删除归属于本文档的 chunk
+        removed = [chunk_id for chunk_id, chunk in zip(old_ids, old_chunks)
+                   if chunk_id not in new_id_set and (chunk or {}).get("full_doc_id") == doc_id]
+
+        full_doc = await rag.full_docs.get_by_id(doc_id)
+        if new_chunks:
+            # ainsert_custom_chunks 会跳过 full_docs 中已存在的文档，直接传入 doc_id 什么也不会写入，
+            # 因此先移除旧的 full_docs 记录，写入失败时恢复
+            await rag.full_docs.delete([doc_id])
+            try:
+                await rag.ainsert_custom_chunks(content, [text for _, text in new_chunks], doc_id=doc_id)
+            except Exception:
+                if full_doc:
+                    await rag.full_docs.upsert({doc_id: full_doc})
+                raise
+        # 新 chunk 全部已存在于 text_chunks 时 ainsert_custom_chunks 不写入 full_docs，统一在这里更新正文
+        await rag.full_docs.upsert({doc_id: {**(full_doc or {}), "content": content}})
+
+        # 确认新版本的 chunk 都已写入后再删除旧 chunk，避免写入失败时丢失内容
+        chunks = await rag.text_chunks.get_by_ids(new_ids) if new_ids else []
+        missing = [chunk_id for chunk_id, chunk in zip(new_ids, chunks) if not chunk]
+        if missing:
+            raise RuntimeError(f"{len(missing)} new chunks of {doc_id} were not written: {missing[:5]}")
+
+        if removed:
+            await self._delete_doc_chunks(rag, removed)
+
+        # ainsert_custom_chunks 按传入列表编号，这里统一修正为在新版本中的顺序
+        updates = {
+            chunk_id: {**chunk, "chunk_order_index": order, "full_doc_id": doc_id, "file_path": file_path}
+            for order, (chunk_id, chunk) in enumerate(zip(new_ids, chunks))
+            if chunk and (chunk.get("chunk_order_index") != order or chunk.get("file_path") != file_path)
+        }
+        if updates:
+            await rag.text_chunks.upsert(updates)
+
+        doc_status = await rag.doc_status.get_by_id(doc_id) or {}
+        status_update = {
+            "content_summary": content[:100],
+            "content_length": len(content),
+            "chunks_count": len(new_ids),
+            "file_path": file_path,
+            "updated_at": datetime.now().isoformat(),
+        }
+        if "chunks_list" in doc_status:
+            status_update["chunks_list"] = new_ids
+        await rag.doc_status.upsert({doc_id: {**doc_status, **status_update}})
+
+        for storage in (rag.full_docs, rag.text_chunks, rag.doc_status, rag.chunks_vdb,
+                        rag.entities_vdb, rag.relationships_vdb, rag.chunk_entity_relation_graph):
+            await storage.index_done_callback()
+
+        self.meta_store.set_doc_chunks(db_id, doc_id, new_ids)
+        return {"kept": len(kept), "added": len(new_chunks), "removed": len(removed), "total": len(new_ids)}
+
+    async def _delete_doc_chunks(self, rag: LightRAG, chunk_ids: list[str]):
+        """删除 chunk，并从图谱中移除以这些 chunk 为来源的信息"""
+        chunk_id_set = set(chunk_ids)
+        graph = rag.chunk_entity_relation_graph
+
+        async with get_graph_db_lock(enable_logging=False):
+            nodes = await graph.get_nodes_by_chunk_ids(chunk_ids)
+            edges = await graph.get_edges_by_chunk_ids(chunk_ids)
+
+            def remaining_sources(data):
+                return [sid for sid in (data.get("source_id") or "").split(GRAPH_FIELD_SEP) if sid and sid not in chunk_id_set]
+
+            edges_to_delete = []
+            for edge in edges:
+                src, tgt = edge.get("source"), edge.get("target")
+                if not src or not tgt:
+                    continue
+                sources = remaining_sources(edge)
+                if sources:
+                    edge_data = {k: v for k, v in edge.items() if k not in ("source", "target")}
+                    await graph.upsert_edge(src, tgt, {**edge_data, "source_id": GRAPH_FIELD_SEP.join(sources)})
+                else:
+                    edges_to_delete.append((src, tgt))
+
+            nodes_to_delete = []
+            for node in nodes:
+                name = node.get("entity_id") or node.get("id")
+                if not name:
+                    continue
+                sources = remaining_sources(node)
+                if sources:
+                    node_data = {k: v for k, v in node.items() if k != "id"}
+                    await graph.upsert_node(name, {**node_data, "source_id": GRAPH_FIELD_SEP.join(sources)})
+                else:
+                    nodes_to_delete.append(name)
+
+            if edges_to_delete:
+                await graph.remove_edges(edges_to_delete)
+                await rag.relationships_vdb.delete([
+                    compute_mdhash_id(a + b, prefix="rel-") for src, tgt in edges_to_delete for a, b in ((src, tgt), (tgt, src))
+                ])
+            if nodes_to_delete:
+                await graph.remove_nodes(nodes_to_delete)
+                await rag.entities_vdb.delete([compute_mdhash_id(name, prefix="ent-") for name in nodes_to_delete])
+
+        await rag.chunks_vdb.delete(chunk_ids)
+        await rag.text_chunks.delete(chunk_ids)
+        logger.info(f"Deleted {len(chunk_ids)} chunks, {len(nodes_to_delete)} entities and {len(edges_to_delete)} relations")
+
+    async def get_file_info(self, db_id, file_id, offset=0, limit=None, max_content_length=None):
+        """获取文件信息和其 chunks - data_router.py 使用
+
+        通过 doc_id -> chunk_ids 索引分页读取，只加载当前页的 chunk。
+
+        Args:
+            offset: 起始 chunk 序号
+            limit: 返回的 chunk 数量，None 表示全部
+            max_content_length: 截断每个 chunk 的 content 到指定长度，None 表示不截断
+        """
+        file_record = self.meta_store.get_file(file_id)
+        if file_record is None:
             raise Exception(f"File not found: {file_id}")
 
         # 使用 LightRAG 获取 chunks
-        rag = await self._get_lightrag_instance(db_id)
-        if rag:
-            try:
-                # 获取文档的所有 chunks
-                assert hasattr(rag.text_chunks, 'get_all'), "text_chunks does not have get_all method"
-                all_chunks = await rag.text_chunks.get_all() # type: ignore
-
-                # 筛选属于该文档的 chunks
-                doc_chunks = []
-                for chunk_id, chunk_data in all_chunks.items():
-                    if isinstance(chunk_data, dict) and chunk_data.get("full_doc_id") == file_id:
+        async with self._lease_lightrag_instance(db_id) as rag:
+            if rag:
+                try:
+                    total = self.meta_store.count_doc_chunks(file_id)
+                    # 失败、重复跳过、处理中的文档在 LightRAG 中没有 chunk，不需要重建索引
+                    if not total and file_record.get("status", "done") == "done":
+                        await self._index_doc_chunks(db_id, rag, file_id)
+                        total = self.meta_store.count_doc_chunks(file_id)
+                        if not total and not self.meta_store.is_chunk_index_backfilled(db_id):
+                            await self._backfill_doc_chunks(rag, db_id)
+                            total = self.meta_store.count_doc_chunks(file_id)
+
+                    chunk_ids = self.meta_store.get_doc_chunk_ids(file_id, offset=offset, limit=limit)
+                    chunks = await rag.text_chunks.get_by_ids(chunk_ids) if chunk_ids else []
+
+                    doc_chunks = []
+                    for chunk_id, chunk_data in zip(chunk_ids, chunks):
+                        if not isinstance(chunk_data, dict):
+                            continue
+                        chunk_data = chunk_data.copy()
                         chunk_data["id"] = chunk_id
                         chunk_data["content_vector"] = []
+                        if max_content_length and len(chunk_data.get("content", "")) > max_content_length:
+                            chunk_data["content"] = chunk_data["content"][:max_content_length]
+                            chunk_data["truncated"] = True
                         doc_chunks.append(chunk_data)
 
-                # 按 chunk_order_index 排序
-                doc_chunks.sort(key=lambda x: x.get("chunk_order_index", 0))
-                # logger.debug(f"All chunks: {doc_chunks}")
-                return {"lines": doc_chunks}
+                    return {"lines": doc_chunks, "total": total, "offset": offset, "limit": limit}
 
-            except Exception as e:
-                logger.error(f"Error getting chunks for file {file_id}: {e}")
+                except Exception as e:
+                    logger.error(f"Error getting chunks for file {file_id}: {e}, {traceback.format_exc()}")
 
-        return {"lines": []}
+        return {"lines": [], "total": 0, "offset": offset, "limit": limit}
 
     def get_db_upload_path(self, db_id=None):
         """获取数据库上传路径 - data_router.py 使用"""
@@ -454,7 +909,7 @@ class LightRagBasedKB:
 
         self.databases_meta[db_id]["name"] = name
         self.databases_meta[db_id]["description"] = description
-        self._save_metadata()
+        self._save_database_meta(db_id)
 
         # 返回更新后的数据库信息
         return self.get_database_info(db_id)
@@ -467,12 +922,19 @@ class LightRagBasedKB:
         logger.warning("query is deprecated, use aquery instead")
         return asyncio.run(self.aquery(query_text, db_id, **kwargs))
 
-    async def aquery(self, query_text, db_id, **kwargs):
-        """查询知识库 - 用于检索器"""
-        rag = await self._get_lightrag_instance(db_id)
-        if not rag:
+    async def aquery(self, query_text, db_id, use_cache=True, raise_errors=False, **kwargs):
+        """查询知识库 - 用于检索器
+
+        结果会写入 query_cache，知识库内容变化（add_content / delete_file）时自动失效。
+        查询出错时默认记录日志并返回空字符串，raise_errors=True 时向调用方抛出异常。
+        """
+        if db_id not in self.databases_meta:
             raise ValueError(f"Database {db_id} not found")
 
+        rag = await self.instance_pool.acquire(db_id)
+        if not rag:
+            raise ValueError(f"Failed to get LightRAG instance for {db_id}")
+
         try:
             # 设置查询参数
             params_dict = {
@@ -480,18 +942,153 @@ class LightRagBasedKB:
                 "only_need_context": True,
                 "top_k": 10,
             } | kwargs
+
+            use_cache = use_cache and not params_dict.get("stream")
+            generation = self.query_cache.generation(db_id)
+            query_embedding = None
+            if use_cache:
+                if self.query_cache.semantic_enabled:
+                    query_embedding = (await rag.embedding_func([query_text]))[0]
+                cached = self.query_cache.get(db_id, query_text, params_dict, embedding=query_embedding)
+                if cached is not None:
+                    logger.debug(f"Query cache hit for {db_id}: {query_text}")
+                    return cached
+
             param = QueryParam(**params_dict)
 
             # 执行查询
             response = await rag.aquery(query_text, param)
             logger.debug(f"Query response: {response}")
 
+            if use_cache and isinstance(response, str) and response:
+                self.query_cache.put(db_id, query_text, params_dict, response, embedding=query_embedding, generation=generation)
+
             return response
 
         except Exception as e:
             logger.error(f"Query error: {e}, {traceback.format_exc()}")
+            if raise_errors:
+                raise
             return ""
 
+        finally:
+            self.instance_pool.release(db_id)
+
+    def resolve_database_ids(self, refs: dict[str, str | None]) -> tuple[dict[str, str], list[str]]:
+        """把外部知识库（如层级表中的 RAGFlow dataset）映射到 LightRAG 知识库
+
+        依次按以下规则匹配：ID 本身就是 LightRAG 知识库ID；知识库元数据中 hierarchy_db_id 等于该 ID；
+        名称唯一相同的知识库。
+
+        Args:
+            refs: {外部ID: 名称}
+
+        Returns:
+            ({外部ID: LightRAG 知识库ID}, [无法匹配的外部ID])
+        """
+        by_link, by_name = {}, {}
+        for db_id, meta in self.databases_meta.items():
+            link = (meta.get("metadata") or {}).get("hierarchy_db_id")
+            if link:
+                by_link[link] = db_id
+            by_name.setdefault(meta.get("name"), []).append(db_id)
+
+        resolved, unresolved = {}, []
+        for ref, name in refs.items():
+            if ref in self.databases_meta:
+                resolved[ref] = ref
+            elif ref in by_link:
+                resolved[ref] = by_link[ref]
+            elif name and len(by_name.get(name, [])) == 1:
+                resolved[ref] = by_name[name][0]
+            else:
+                unresolved.append(ref)
+        return resolved, unresolved
+
+    async def afederated_query(self, query_text, db_ids=None, timeout=None, fusion="rrf", top_k=10, **kwargs):
+        """并发查询多个知识库并融合结果
+
+        Args:
+            query_text: 查询文本
+            db_ids: 要查询的知识库ID列表，None 表示全部知识库
+            timeout: 单个知识库的查询超时时间（秒），超时的知识库会被跳过
+            fusion: 融合方式，"rrf" 为倒数排名融合，"rerank" 使用配置的重排序模型打分
+            top_k: 融合后每个小节（实体、关系、文档块）保留的记录数
+            **kwargs: 透传给 aquery 的查询参数
+
+        Returns:
+            dict: {"context": 融合后的上下文, "sources": {db_id: "success" | "timeout" | "failed" | "empty" | "not_found"}}
+        """
+        requested = list(dict.fromkeys(db_ids)) if db_ids is not None else list(self.databases_meta)
+        db_ids = [db_id for db_id in requested if db_id in self.databases_meta]
+        timeout = timeout or float(os.getenv("KB_FEDERATED_QUERY_TIMEOUT", 30))
+
+        async def query_one(db_id):
+            return await asyncio.wait_for(self.aquery(query_text, db_id, raise_errors=True, **kwargs), timeout=timeout)
+
+        results = await asyncio.gather(*[query_one(db_id) for db_id in db_ids], return_exceptions=True)
+
+        contexts, sources = {}, {}
+        for db_id in requested:
+            if db_id not in self.databases_meta:
+                logger.warning(f"Federated query skipped unknown database {db_id}")
+                sources[db_id] = "not_found"
+        for db_id, result in zip(db_ids, results):
+            if isinstance(result, asyncio.TimeoutError):
+                logger.warning(f"Federated query timed out on {db_id} after {timeout}s")
+                sources[db_id] = "timeout"
+            elif isinstance(result, Exception):
+                logger.error(f"Federated query failed on {db_id}: {result}")
+                sources[db_id] = "failed"
+            elif not result:
+                sources[db_id] = "empty"
+            else:
+                contexts[db_id] = result
+                sources[db_id] = "success"
+
+        scorer = None
+        if fusion == "rerank" and contexts:
+            from src.models.rerank_model import get_reranker
+            reranker = get_reranker(config.reranker)
+
+            def scorer(texts):
+                return reranker.compute_score([query_text, texts], normalize=True)
+
+        source_names = {db_id: self.databases_meta[db_id].get("name", db_id) for db_id in contexts}
+        context = await asyncio.to_thread(fuse_contexts, contexts, top_k=top_k, scorer=scorer, source_names=source_names)
+        return {"context": context, "sources": sources}
+
+    async def prewarm_instances(self, n=None):
+        """预先初始化使用次数最多的 n 个知识库的 LightRAG 实例"""
+        n = int(os.getenv("KB_PREWARM_COUNT", 0)) if n is None else n
+        if n <= 0:
+            return []
+
+        db_ids = [db_id for db_id in self.meta_store.get_most_used(n * 2) if db_id in self.databases_meta][:n]
+        logger.info(f"Prewarming LightRAG instances: {db_ids}")
+        await asyncio.gather(*[self.instance_pool.get(db_id) for db_id in db_ids])
+        return db_ids
+
+    async def startup(self):
+        """服务启动时调用：预热常用实例并启动空闲实例回收"""
+        try:
+            await self.prewarm_instances()
+        except Exception as e:
+            logger.error(f"Failed to prewarm LightRAG instances: {e}, {traceback.format_exc()}")
+        self.instance_pool.start_sweeper()
+
+    async def shutdown(self):
+        """服务退出时调用：释放所有 LightRAG 实例"""
+        await self.instance_pool.close()
+
+    def get_query_cache_stats(self):
+        """获取检索缓存的命中统计"""
+        return self.query_cache.stats()
+
+    def get_parse_cache_stats(self):
+        """获取解析缓存的命中统计"""
+        return self.parse_cache.stats() if self.parse_cache is not None else {"enabled": False}
+
     def get_retrievers(self):
         """获取所有检索器 - 用于工具系统"""
         retrievers = {}
@@ -0,0 +1,120 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+from src.utils import logger, hashfile
+
+
+class ParseCache:
+    """文档解析结果缓存
+
+    以 (文件内容哈希, 解析器, 解析参数) 为键，把解析得到的 markdown 正文保存到磁盘，
+    同一文件重复上传或上传到其他知识库时可直接复用，跳过 OCR / MinerU / PaddleX 等解析步骤。
+    总大小超过 max_bytes 时按最近访问时间淘汰。
+    """
+
+    # 解析逻辑有不兼容的变化时递增，使旧缓存失效
+    VERSION = 1
+
+    def __init__(self, cache_dir, max_bytes=2 * 1024 ** 3):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.cache_dir = cache_dir
+        self.max_bytes = int(max_bytes)
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+
+        self._conn = sqlite3.connect(os.path.join(cache_dir, "index.db"), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, size INTEGER NOT NULL, last_access REAL NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_last_access ON entries (last_access)")
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def make_key(self, file_path, parser: str, params: dict | None = None) -> str:
+        """计算缓存键，文件内容按块读取计算哈希"""
+        params_key = json.dumps(params or {}, sort_keys=True, ensure_ascii=False, default=str)
+        raw = f"{hashfile(file_path)}:{parser}:{params_key}:v{self.VERSION}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.md")
+
+    def get(self, key) -> str | None:
+        with self._lock:
+            row = self._conn.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self._stats["misses"] += 1
+                return None
+            try:
+                with open(self._path(key), encoding="utf-8") as f:
+                    text = f.read()
+            except FileNotFoundError:
+                # 缓存文件被外部删除，同步清理索引
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._total_bytes -= row[0]
+                self._stats["misses"] += 1
+                return None
+            self._conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._stats["hits"] += 1
+            return text
+
+    def put(self, key, text: str):
+        data = text.encode("utf-8")
+        if len(data) > self.max_bytes:
+            return
+
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+
+        with self._lock:
+            os.replace(tmp_path, path)
+            row = self._conn.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+            self._total_bytes += len(data) - (row[0] if row else 0)
+            self._conn.execute("INSERT OR REPLACE INTO entries (key, size, last_access) VALUES (?, ?, ?)", (key, len(data), time.time()))
+            self._stats["writes"] += 1
+            self._evict()
+
+    def _evict(self):
+        """淘汰最久未访问的条目，直到总大小不超过上限"""
+        while self._total_bytes > self.max_bytes:
+            rows = self._conn.execute("SELECT key, size FROM entries ORDER BY last_access LIMIT 100").fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                if self._total_bytes <= self.max_bytes:
+                    break
+                try:
+                    os.remove(self._path(key))
+                except FileNotFoundError:
+                    pass
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._total_bytes -= size
+                self._stats["evictions"] += 1
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "entries": entries,
+                "total_bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "hit_rate": round(self._stats["hits"] / lookups, 4) if lookups else 0.0,
+            }
+
+
+def get_parse_cache(save_dir) -> ParseCache | None:
+    """PARSE_CACHE_ENABLED=false 时返回 None"""
+    if os.getenv("PARSE_CACHE_ENABLED", "true").lower() not in ("1", "true", "yes"):
+        return None
+    try:
+        return ParseCache(os.path.join(save_dir, "parse_cache"), max_bytes=int(os.getenv("PARSE_CACHE_MAX_BYTES", 2 * 1024 ** 3)))
+    except Exception as e:
+        logger.warning(f"解析缓存初始化失败，将不使用缓存: {e}")
+        return None
@@ -0,0 +1,125 @@
+import json
+import time
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+class QueryCache:
+    """知识库检索结果缓存
+
+    按 db_id 隔离，包含两层：
+    - 精确匹配层：以 (db_id, 查询文本, 查询参数) 为键
+    - 语义相似层（可选）：精确匹配未命中时，与同一知识库、相同查询参数下已缓存查询的向量计算余弦相似度，
+      超过阈值即视为命中
+
+    缓存条目按 LRU 淘汰并带有过期时间。知识库内容变化时通过 invalidate 清空该库的缓存，
+    每个库维护一个版本号，查询开始后库内容发生变化的结果不会被写入缓存。
+    """
+
+    def __init__(self, max_size=1024, ttl=3600, similarity_threshold=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold or None
+        self._entries: OrderedDict[tuple, dict] = OrderedDict()
+        self._generations: dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "semantic_hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    @property
+    def semantic_enabled(self):
+        return self.similarity_threshold is not None
+
+    @staticmethod
+    def _params_key(params: dict | None) -> str:
+        return json.dumps(params or {}, sort_keys=True, ensure_ascii=False, default=str)
+
+    def generation(self, db_id: str) -> int:
+        return self._generations.get(db_id, 0)
+
+    def get(self, db_id: str, query_text: str, params: dict | None = None, embedding=None):
+        """查询缓存，未命中返回 None；传入 embedding 时会在精确匹配未命中后尝试语义匹配"""
+        params_key = self._params_key(params)
+        now = time.time()
+        with self._lock:
+            key = (db_id, query_text, params_key)
+            entry = self._entries.get(key)
+            if entry is not None and now - entry["created_at"] <= self.ttl:
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return entry["response"]
+            if entry is not None:
+                del self._entries[key]
+
+            if self.semantic_enabled and embedding is not None:
+                best_key, best_score = self._most_similar(db_id, params_key, embedding, now)
+                if best_key is not None and best_score >= self.similarity_threshold:
+                    self._entries.move_to_end(best_key)
+                    self._stats["semantic_hits"] += 1
+                    return self._entries[best_key]["response"]
+
+            self._stats["misses"] += 1
+            return None
+
+    def _most_similar(self, db_id, params_key, embedding, now):
+        candidates = []
+        for key, entry in list(self._entries.items()):
+            if key[0] != db_id or key[2] != params_key or entry["embedding"] is None:
+                continue
+            if now - entry["created_at"] > self.ttl:
+                del self._entries[key]
+                continue
+            candidates.append((key, entry["embedding"]))
+
+        if not candidates:
+            return None, 0.0
+
+        query_vec = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        query_vec = query_vec / (np.linalg.norm(query_vec) or 1.0)
+        matrix = np.stack([vec for _, vec in candidates])
+        scores = matrix @ query_vec
+        best = int(np.argmax(scores))
+        return candidates[best][0], float(scores[best])
+
+    def put(self, db_id: str, query_text: str, params: dict | None, response, embedding=None, generation=None):
+        """写入缓存；generation 与当前版本不一致时（查询期间库内容已变化）不写入"""
+        with self._lock:
+            if generation is not None and generation != self.generation(db_id):
+                return
+
+            if embedding is not None:
+                embedding = np.asarray(embedding, dtype=np.float32).reshape(-1)
+                embedding = embedding / (np.linalg.norm(embedding) or 1.0)
+
+            key = (db_id, query_text, self._params_key(params))
+            self._entries[key] = {"response": response, "embedding": embedding, "created_at": time.time()}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def invalidate(self, db_id: str):
+        """清空指定知识库的缓存"""
+        with self._lock:
+            self._generations[db_id] = self.generation(db_id) + 1
+            for key in [key for key in self._entries if key[0] == db_id]:
+                del self._entries[key]
+            self._stats["invalidations"] += 1
+
+    def clear(self):
+        with self._lock:
+            for db_id in {key[0] for key in self._entries}:
+                self._generations[db_id] = self.generation(db_id) + 1
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self._stats["hits"] + self._stats["semantic_hits"] + self._stats["misses"]
+            return self._stats | {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "similarity_threshold": self.similarity_threshold,
+                "hit_rate": (self._stats["hits"] + self._stats["semantic_hits"]) / total if total else 0.0,
+            }
@@ -0,0 +1,117 @@
+"""多知识库检索结果融合
+
+LightRAG 在 only_need_context=True 时返回的上下文由若干小节组成，例如::
+
+    -----Entities(KG)-----
+    ```json
+    [{"id": 1, "entity": "...", "description": "..."}, ...]
+    ```
+    -----Document Chunks(DC)-----
+    ```json
+    [{"id": 1, "content": "...", "file_path": "..."}, ...]
+    ```
+
+这里把每个知识库的上下文拆分为检索单元，按小节分别进行 RRF 或重排序融合、去重，
+再拼装回相同格式的上下文。
+"""
+import re
+import json
+import hashlib
+
+# 小节标题独占一行，避免把 markdown 表格分隔行（|---|---|）误认为小节标题
+SECTION_PATTERN = re.compile(r"^-{3,}\s*(.+?)\s*-{3,}$", re.M)
+JSON_BLOCK_PATTERN = re.compile(r"```(?:json)?\s*(.*?)```", re.S)
+DEFAULT_SECTION = "Context"
+
+
+def split_context(context: str) -> dict[str, list[dict]]:
+    """将 LightRAG 的上下文拆分为 {小节名: [记录, ...]}，记录保持原有顺序（即检索排名）"""
+    sections: dict[str, list[dict]] = {}
+    if not context:
+        return sections
+
+    matches = list(SECTION_PATTERN.finditer(context))
+    if not matches:
+        return {DEFAULT_SECTION: _split_plain(context)}
+
+    for i, match in enumerate(matches):
+        body = context[match.end():matches[i + 1].start() if i + 1 < len(matches) else len(context)]
+        block = JSON_BLOCK_PATTERN.search(body)
+        records = None
+        if block:
+            try:
+                records = json.loads(block.group(1))
+            except json.JSONDecodeError:
+                records = None
+        if not isinstance(records, list):
+            records = _split_plain(body)
+        sections.setdefault(match.group(1).strip(), []).extend(r if isinstance(r, dict) else {"content": str(r)} for r in records)
+
+    return sections
+
+
+def _split_plain(text: str) -> list[dict]:
+    """无法解析为 JSON 时按空行切分"""
+    text = JSON_BLOCK_PATTERN.sub(lambda m: m.group(1), text)
+    return [{"content": p.strip()} for p in re.split(r"\n\s*\n", text) if p.strip()]
+
+
+def record_text(record: dict) -> str:
+    """提取记录中用于去重和重排序的文本"""
+    if "content" in record:
+        return str(record["content"])
+    if "entity" in record:
+        return f"{record['entity']}: {record.get('description', '')}"
+    if "entity1" in record or "src_id" in record:
+        src = record.get("entity1", record.get("src_id", ""))
+        tgt = record.get("entity2", record.get("tgt_id", ""))
+        return f"{src} -> {tgt}: {record.get('description', '')}"
+    return json.dumps({k: v for k, v in record.items() if k != "id"}, ensure_ascii=False, sort_keys=True)
+
+
+def _dedup_key(section: str, record: dict) -> str:
+    text = re.sub(r"\s+", " ", record_text(record)).strip().lower()
+    return hashlib.md5(f"{section}\x00{text}".encode()).hexdigest()
+
+
+def fuse_contexts(contexts: dict[str, str], top_k: int = 10, rrf_k: int = 60, scorer=None, source_names: dict | None = None) -> str:
+    """融合多个知识库的上下文
+
+    Args:
+        contexts: {db_id: LightRAG 返回的上下文}
+        top_k: 每个小节保留的记录数
+        rrf_k: RRF 平滑常数
+        scorer: 可选的重排序函数 scorer(texts) -> scores，提供时以其分数代替 RRF 分数
+        source_names: {db_id: 知识库名称}，写入每条记录的 source_kb 字段
+    """
+    source_names = source_names or {}
+    fused: dict[str, dict[str, dict]] = {}
+
+    for db_id, context in contexts.items():
+        for section, records in split_context(context).items():
+            section_units = fused.setdefault(section, {})
+            for rank, record in enumerate(records):
+                key = _dedup_key(section, record)
+                unit = section_units.get(key)
+                if unit is None:
+                    unit = section_units[key] = {"record": dict(record), "score": 0.0, "sources": []}
+                unit["score"] += 1.0 / (rrf_k + rank + 1)
+                unit["sources"].append(source_names.get(db_id, db_id))
+
+    output = []
+    for section, units in fused.items():
+        units = list(units.values())
+        if scorer is not None and units:
+            scores = scorer([record_text(u["record"]) for u in units])
+            for unit, score in zip(units, scores):
+                unit["score"] = float(score)
+        units.sort(key=lambda u: u["score"], reverse=True)
+
+        records = []
+        for i, unit in enumerate(units[:top_k]):
+            record = unit["record"] | {"id": i + 1, "source_kb": ", ".join(dict.fromkeys(unit["sources"]))}
+            records.append(record)
+
+        output.append(f"-----{section}-----\n\n```json\n{json.dumps(records, ensure_ascii=False, indent=2)}\n```")
+
+    return "\n\n".join(output)
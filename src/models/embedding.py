@@ -1,13 +1,47 @@
 import os
 import json
-import requests
+import time
+import random
 import asyncio
+import weakref
+import requests
+import httpx
 from abc import abstractmethod
 from zhipuai import ZhipuAI
 from langchain_huggingface import HuggingFaceEmbeddings
 
 from src import config
-from src.utils import hashstr, logger, get_docker_safe_url
+from src.utils import hashstr, logger, get_docker_safe_url, estimate_tokens
+from src.models.embedding_cache import get_embedding_cache
+
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# 同步请求复用同一个 Session 的连接池；异步请求按事件循环复用 AsyncClient
+# 以事件循环本身为弱引用键，循环被回收后对应的 client 随之释放，不会因 id 复用拿到其他循环的 client
+_session = requests.Session()
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """获取当前事件循环共享的 httpx.AsyncClient"""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None or client.is_closed:
+        max_connections = int(os.getenv("EMBED_MAX_CONNECTIONS", 32))
+        client = httpx.AsyncClient(
+            timeout=httpx.Timeout(float(os.getenv("EMBED_TIMEOUT", 60)), connect=10),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        )
+        _async_clients[loop] = client
+    return client
+
+
+async def aclose_async_client():
+    """关闭当前事件循环的 AsyncClient，在事件循环结束前（如应用关闭时）调用"""
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None and not client.is_closed:
+        await client.aclose()
 
 
 class BaseEmbeddingModel:
@@ -19,51 +53,184 @@ class BaseEmbeddingModel:
         self.model = self.info["name"]
         self.dimension = self.info.get("dimension", None)
         self.url = get_docker_safe_url(self.info["base_url"])
-        self.api_key = os.getenv(self.info["api_key"], self.info["api_key"])
+        self.api_key = os.getenv(self.info.get("api_key", ""), self.info.get("api_key"))
+        self.headers = {"Content-Type": "application/json"}
+
+        # 并发与批处理限制，可在 models.yaml 中按模型配置
+        self.max_concurrency = int(self.info.get("max_concurrency") or os.getenv("EMBED_MAX_CONCURRENCY", 8))
+        self.max_batch_tokens = int(self.info.get("max_batch_tokens") or os.getenv("EMBED_MAX_BATCH_TOKENS", 8192))
+        self.max_retries = int(self.info.get("max_retries") or os.getenv("EMBED_MAX_RETRIES", 3))
+
+        # 按 (model_id, 文本哈希) 缓存向量，只把未命中的文本发给服务端
+        self.cache = get_embedding_cache(model_id, self.dimension)
 
     @abstractmethod
-    def predict(self, message):
+    def build_payload(self, message):
+        raise NotImplementedError("Subclasses must implement this method")
+
+    @abstractmethod
+    def parse_response(self, response: dict) -> list:
         raise NotImplementedError("Subclasses must implement this method")
 
+    def _retry_delay(self, attempt, response=None):
+        """指数退避，优先使用服务端返回的 Retry-After"""
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        return min(2 ** attempt, 30) + random.random()
+
+    def predict(self, message):
+        if isinstance(message, str):
+            message = [message]
+
+        payload = self.build_payload(message)
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = _session.post(self.url, json=payload, headers=self.headers, timeout=60)
+            except requests.RequestException as e:
+                if attempt >= self.max_retries:
+                    raise
+                logger.warning(f"Embedding request failed: {e}, retrying ({attempt + 1}/{self.max_retries})")
+                time.sleep(self._retry_delay(attempt))
+                continue
+
+            if response.status_code in RETRY_STATUS_CODES and attempt < self.max_retries:
+                logger.warning(f"Embedding request got {response.status_code}, retrying ({attempt + 1}/{self.max_retries})")
+                time.sleep(self._retry_delay(attempt, response))
+                continue
+
+            return self.parse_response(json.loads(response.text))
+
+    async def apredict(self, message):
+        """异步请求 embedding，使用共享连接池，遇到 429/5xx 时退避重试"""
+        if isinstance(message, str):
+            message = [message]
+
+        client = get_async_client()
+        payload = self.build_payload(message)
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = await client.post(self.url, json=payload, headers=self.headers)
+            except httpx.TransportError as e:
+                if attempt >= self.max_retries:
+                    raise
+                logger.warning(f"Embedding request failed: {e}, retrying ({attempt + 1}/{self.max_retries})")
+                await asyncio.sleep(self._retry_delay(attempt))
+                continue
+
+            if response.status_code in RETRY_STATUS_CODES and attempt < self.max_retries:
+                logger.warning(f"Embedding request got {response.status_code}, retrying ({attempt + 1}/{self.max_retries})")
+                await asyncio.sleep(self._retry_delay(attempt, response))
+                continue
+
+            return self.parse_response(response.json())
+
+    def _lookup_cache(self, messages):
+        """查询缓存，返回 (结果列表, 去重后的未命中文本)，未命中位置为 None"""
+        cached = self.cache.get_many(messages) if self.cache else [None] * len(messages)
+        missing = list(dict.fromkeys(m for m, v in zip(messages, cached) if v is None))
+        return cached, missing
+
+    def _merge_cache(self, messages, cached, missing, embeddings):
+        """将新计算的向量写入缓存，并按原始顺序合并结果"""
+        assert len(embeddings) == len(missing), f"Embedding count mismatch: {len(embeddings)=}, {len(missing)=}"
+        if self.cache and missing:
+            self.cache.put_many(missing, embeddings)
+        computed = dict(zip(missing, embeddings))
+        return [v if v is not None else computed[m] for m, v in zip(messages, cached)]
+
     def encode(self, message):
-        return self.predict(message)
+        if isinstance(message, str):
+            message = [message]
+        cached, missing = self._lookup_cache(message)
+        embeddings = self.predict(missing) if missing else []
+        return self._merge_cache(message, cached, missing, embeddings)
 
     def encode_queries(self, queries):
-        return self.predict(queries)
+        return self.encode(queries)
 
     async def aencode(self, message):
-        return await asyncio.to_thread(self.encode, message)
+        if isinstance(message, str):
+            message = [message]
+        cached, missing = self._lookup_cache(message)
+        embeddings = await self.apredict(missing) if missing else []
+        return self._merge_cache(message, cached, missing, embeddings)
 
     async def aencode_queries(self, queries):
-        return await asyncio.to_thread(self.encode_queries, queries)
+        return await self.aencode(queries)
+
+    def make_batches(self, messages, batch_size=20):
+        """按条数上限和 token 上限切分批次，返回 [(start, batch), ...]"""
+        batches = []
+        start, tokens = 0, 0
+        for i, msg in enumerate(messages):
+            msg_tokens = estimate_tokens(msg)
+            if i > start and (i - start >= batch_size or tokens + msg_tokens > self.max_batch_tokens):
+                batches.append((start, messages[start:i]))
+                start, tokens = i, 0
+            tokens += msg_tokens
+        if start < len(messages):
+            batches.append((start, messages[start:]))
+        return batches
 
     async def abatch_encode(self, messages, batch_size=20):
-        return await asyncio.to_thread(self.batch_encode, messages, batch_size)
+        """并发发送多个批次，同时在途的请求数不超过 max_concurrency"""
+        cached, missing = self._lookup_cache(messages)
+        logger.info(f"Batch encoding {len(messages)} messages (async, {len(missing)} cache misses, max_concurrency={self.max_concurrency})")
+        batches = self.make_batches(missing, batch_size)
+        data = [None] * len(missing)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        task_id = hashstr(messages)
+        self.embed_state[task_id] = {
+            'status': 'in-progress',
+            'total': len(messages),
+            'progress': len(messages) - len(missing)
+        }
+
+        async def encode_batch(start, group_msg):
+            async with semaphore:
+                response = await self.apredict(group_msg)
+            assert len(response) == len(group_msg), f"Embedding count mismatch: {len(response)=}, {len(group_msg)=}"
+            data[start:start + len(group_msg)] = response
+            self.embed_state[task_id]['progress'] += len(group_msg)
+
+        try:
+            await asyncio.gather(*[encode_batch(start, group_msg) for start, group_msg in batches])
+        except Exception:
+            self.embed_state[task_id]['status'] = 'failed'
+            raise
+
+        self.embed_state[task_id]['status'] = 'completed'
+        return self._merge_cache(messages, cached, missing, data)
 
     def batch_encode(self, messages, batch_size=20):
-        logger.info(f"Batch encoding {len(messages)} messages")
+        cached, missing = self._lookup_cache(messages)
+        logger.info(f"Batch encoding {len(messages)} messages ({len(missing)} cache misses)")
         data = []
 
-        if len(messages) > batch_size:
+        if len(missing) > batch_size:
             task_id = hashstr(messages)
             self.embed_state[task_id] = {
                 'status': 'in-progress',
                 'total': len(messages),
-                'progress': 0
+                'progress': len(messages) - len(missing)
             }
 
-        for i in range(0, len(messages), batch_size):
-            group_msg = messages[i:i+batch_size]
-            logger.info(f"Encoding {i} to {i+batch_size} with {len(messages)} messages")
-            response = self.encode(group_msg)
+        for start, group_msg in self.make_batches(missing, batch_size):
+            logger.info(f"Encoding {start} to {start+len(group_msg)} with {len(missing)} messages")
+            response = self.predict(group_msg)
             # logger.debug(f"Response: {len(response)=}, {len(group_msg)=}, {len(response[0])=}")
             data.extend(response)
 
-        if len(messages) > batch_size:
+        if len(missing) > batch_size:
             self.embed_state[task_id]['progress'] = len(messages)
             self.embed_state[task_id]['status'] = 'completed'
 
-        return data
+        return self._merge_cache(messages, cached, missing, data)
 
 class OllamaEmbedding(BaseEmbeddingModel):
     """
@@ -74,16 +241,13 @@ class OllamaEmbedding(BaseEmbeddingModel):
         super().__init__(model_id)
         self.url = self.url or get_docker_safe_url("http://localhost:11434/api/embed")
 
-    def predict(self, message: list[str] | str):
-        if isinstance(message, str):
-            message = [message]
-
-        payload = {
+    def build_payload(self, message):
+        return {
             "model": self.model,
             "input": message,
         }
-        response = requests.request("POST", self.url, json=payload)
-        response = json.loads(response.text)
+
+    def parse_response(self, response):
         assert response.get("embeddings"), f"Ollama Embedding failed: {response}"
         return response["embeddings"]
 
@@ -97,20 +261,17 @@ class OtherEmbedding(BaseEmbeddingModel):
             "Content-Type": "application/json"
         }
 
-    def predict(self, message):
-        payload = self.build_payload(message)
-        response = requests.request("POST", self.url, json=payload, headers=self.headers)
-        response = json.loads(response.text)
-        assert response["data"], f"Other Embedding failed: {response}"
-        data = [a["embedding"] for a in response["data"]]
-        return data
-
     def build_payload(self, message):
         return {
             "model": self.model,
             "input": message,
         }
 
+    def parse_response(self, response):
+        assert response.get("data"), f"Other Embedding failed: {response}"
+        data = [a["embedding"] for a in response["data"]]
+        return data
+
 def get_embedding_model(model_id):
     provider, model_name = model_id.split('/', 1) if model_id else ("", "")
     support_embed_models = config.embed_model_names.keys()
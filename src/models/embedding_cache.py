@@ -0,0 +1,203 @@
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import threading
+
+import numpy as np
+
+from src import config
+from src.utils import logger
+
+
+class EmbeddingCache:
+    """按内容寻址的向量持久化缓存
+
+    每个 embedding 模型一个目录：
+    - vectors.f32：float32 向量矩阵，使用 np.memmap 读写，按槽位（行）存放
+    - index.db：sqlite 索引，记录 文本哈希 -> 槽位 以及最近访问时间
+
+    条目数超过 max_entries 时按最近访问时间淘汰最旧的一批，腾出的槽位会被复用。
+    """
+
+    EVICT_RATIO = 0.05
+
+    def __init__(self, cache_dir, dimension=None, max_entries=500_000):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.cache_dir = cache_dir
+        self.max_entries = max(1, int(max_entries))
+        self.vectors_path = os.path.join(cache_dir, "vectors.f32")
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+
+        self._conn = sqlite3.connect(os.path.join(cache_dir, "index.db"), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, slot INTEGER NOT NULL, last_access REAL NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_last_access ON entries (last_access)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (k TEXT PRIMARY KEY, v TEXT)")
+
+        row = self._conn.execute("SELECT v FROM meta WHERE k = 'dimension'").fetchone()
+        self.dimension = int(row[0]) if row else (int(dimension) if dimension else None)
+
+        self._vectors = None
+        self._allocated = 0
+        self._free_slots = []
+        if self.dimension:
+            self._open_vectors()
+
+    @staticmethod
+    def make_key(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def _open_vectors(self):
+        """根据文件大小打开 memmap，并计算空闲槽位"""
+        row_bytes = self.dimension * 4
+        size = os.path.getsize(self.vectors_path) if os.path.exists(self.vectors_path) else 0
+        self._allocated = size // row_bytes
+        self._vectors = None
+        if self._allocated:
+            self._vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r+", shape=(self._allocated, self.dimension))
+
+        used = {slot for (slot,) in self._conn.execute("SELECT slot FROM entries")}
+        self._free_slots = [slot for slot in range(self._allocated - 1, -1, -1) if slot not in used]
+
+    def _grow(self):
+        """扩容向量文件（倍增，不超过 max_entries）"""
+        new_rows = min(self.max_entries, max(1024, self._allocated * 2))
+        if new_rows <= self._allocated:
+            return False
+        if self._vectors is not None:
+            self._vectors.flush()
+            self._vectors = None
+        with open(self.vectors_path, "ab") as f:
+            f.truncate(new_rows * self.dimension * 4)
+        self._vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r+", shape=(new_rows, self.dimension))
+        self._free_slots.extend(range(new_rows - 1, self._allocated - 1, -1))
+        self._allocated = new_rows
+        return True
+
+    def _evict(self):
+        """淘汰最久未访问的一批条目"""
+        count = max(1, int(self.max_entries * self.EVICT_RATIO))
+        rows = self._conn.execute("SELECT key, slot FROM entries ORDER BY last_access LIMIT ?", (count,)).fetchall()
+        self._conn.executemany("DELETE FROM entries WHERE key = ?", [(key,) for key, _ in rows])
+        self._free_slots.extend(slot for _, slot in rows)
+        self._stats["evictions"] += len(rows)
+
+    def _allocate_slot(self):
+        if not self._free_slots and not self._grow():
+            self._evict()
+        return self._free_slots.pop()
+
+    def get_many(self, texts: list[str]) -> list[list[float] | None]:
+        """批量查询，未命中的位置返回 None"""
+        keys = [self.make_key(text) for text in texts]
+        results = [None] * len(texts)
+        with self._lock:
+            if self._vectors is None:
+                self._stats["misses"] += len(texts)
+                return results
+
+            slots = {}
+            unique_keys = list(dict.fromkeys(keys))
+            for i in range(0, len(unique_keys), 500):
+                batch = unique_keys[i:i + 500]
+                placeholders = ",".join("?" * len(batch))
+                slots.update(self._conn.execute(f"SELECT key, slot FROM entries WHERE key IN ({placeholders})", batch).fetchall())
+
+            hits = 0
+            for i, key in enumerate(keys):
+                if key in slots:
+                    results[i] = self._vectors[slots[key]].tolist()
+                    hits += 1
+
+            if slots:
+                now = time.time()
+                self._conn.executemany("UPDATE entries SET last_access = ? WHERE key = ?", [(now, key) for key in slots])
+
+            self._stats["hits"] += hits
+            self._stats["misses"] += len(keys) - hits
+        return results
+
+    def put_many(self, texts: list[str], vectors: list[list[float]]):
+        """批量写入，每条先写向量再写索引，保证索引指向的槽位已有数据"""
+        if not texts:
+            return
+        with self._lock:
+            if self.dimension is None:
+                self.dimension = len(vectors[0])
+                self._open_vectors()
+            if self._vectors is None and not self._grow():
+                return
+            self._conn.execute("INSERT OR REPLACE INTO meta (k, v) VALUES ('dimension', ?)", (str(self.dimension),))
+
+            written = set()
+            now = time.time()
+            self._conn.execute("BEGIN")
+            try:
+                for text, vector in zip(texts, vectors):
+                    if len(vector) != self.dimension:
+                        logger.warning(f"Embedding dimension mismatch in cache {self.cache_dir}: {len(vector)} != {self.dimension}, skipped")
+                        continue
+                    key = self.make_key(text)
+                    if key in written:
+                        continue
+                    existing = self._conn.execute("SELECT slot FROM entries WHERE key = ?", (key,)).fetchone()
+                    slot = existing[0] if existing else self._allocate_slot()
+                    self._vectors[slot] = np.asarray(vector, dtype=np.float32)
+                    self._conn.execute("INSERT OR REPLACE INTO entries (key, slot, last_access) VALUES (?, ?, ?)", (key, slot, now))
+                    written.add(key)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                # 回滚后按索引重新计算空闲槽位
+                self._vectors.flush()
+                self._open_vectors()
+                raise
+
+            if written:
+                self._vectors.flush()
+                self._stats["writes"] += len(written)
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM entries")
+            self._free_slots = list(range(self._allocated - 1, -1, -1))
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "entries": entries,
+                "max_entries": self.max_entries,
+                "dimension": self.dimension,
+                "size_bytes": self._allocated * (self.dimension or 0) * 4,
+                "hit_rate": round(self._stats["hits"] / lookups, 4) if lookups else 0.0,
+            }
+
+
+_caches: dict[str, EmbeddingCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_embedding_cache(model_id, dimension=None) -> EmbeddingCache | None:
+    """获取模型对应的缓存实例，EMBED_CACHE_ENABLED=false 时返回 None"""
+    if os.getenv("EMBED_CACHE_ENABLED", "true").lower() not in ("1", "true", "yes"):
+        return None
+
+    with _caches_lock:
+        if model_id not in _caches:
+            cache_dir = os.path.join(config.save_dir, "embedding_cache", re.sub(r"[^\w.-]", "_", model_id))
+            max_entries = int(os.getenv("EMBED_CACHE_MAX_ENTRIES", 500_000))
+            _caches[model_id] = EmbeddingCache(cache_dir, dimension=dimension, max_entries=max_entries)
+        return _caches[model_id]
+
+
+def get_embedding_cache_stats():
+    with _caches_lock:
+        caches = dict(_caches)
+    return {model_id: cache.stats() for model_id, cache in caches.items()}
@@ -1,8 +1,14 @@
 import os
-import uuid
+import atexit
+import threading
+import multiprocessing
 from pathlib import Path
 from argparse import ArgumentParser
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
+import cv2
 import fitz  # fitz就是pip install PyMuPDF
 import numpy as np  # Added import for numpy
 from PIL import Image
@@ -14,6 +20,11 @@ from src.utils import logger, is_text_pdf
 
 GOLBAL_STATE = {}
 
+# 页面级 OCR 进程池（每个进程持有一个 ONNX 会话），首次使用时创建
+_PAGE_POOL = None
+_PAGE_POOL_LOCK = threading.Lock()
+_WORKER_STATE = {}
+
 
 class OCRPlugin:
     """OCR 插件"""
@@ -21,6 +32,7 @@ class OCRPlugin:
     def __init__(self, **kwargs):
         self.ocr = None
         self.det_box_thresh = kwargs.get('det_box_thresh', 0.3)
+        self.intra_op_threads = kwargs.get('intra_op_threads')
 
     def load_model(self):
         """加载 OCR 模型"""
@@ -32,10 +44,13 @@ class OCRPlugin:
             f"模型文件不存在，请下载 SWHL/RapidOCR 到 {model_dir}，"
             "并确认是否在 docker-compose.dev.yml 中添加 MODEL_DIR 环境变量"
         )
-        self.ocr = RapidOCR(det_box_thresh=0.3, det_model_path=det_model_dir, rec_model_path=rec_model_dir)
+        params = {}
+        if self.intra_op_threads:
+            params["intra_op_num_threads"] = int(self.intra_op_threads)
+        self.ocr = RapidOCR(det_box_thresh=0.3, det_model_path=det_model_dir, rec_model_path=rec_model_dir, **params)
         logger.info(f"OCR Plugin for det_box_thresh = {self.det_box_thresh} loaded.")
 
-    def process_image(self, image):
+    def process_image(self, image, is_bgr=False):
         """
         对单张图像执行OCR并提取文本
 
@@ -43,7 +58,8 @@ class OCRPlugin:
             image: 图像数据，支持多种格式：
                   - str: 图像文件路径
                   - PIL.Image: PIL图像对象
-                  - numpy.ndarray: numpy图像数组
+                  - numpy.ndarray: numpy图像数组，默认按 RGB 处理
+            is_bgr: numpy 图像是否已经是 BGR 顺序（RapidOCR 对数组输入按 BGR 处理）
 
         Returns:
             str: 提取的文本内容
@@ -52,23 +68,16 @@ class OCRPlugin:
         if self.ocr is None:
             self.load_model()
 
-        # 处理不同类型的输入图像
         try:
-            if isinstance(image, str):
-                # 图像路径直接传递给OCR处理
-                image_path = image
-                is_temp_file = False
-            else:
-                # 创建临时文件
-                is_temp_file = True
-                image_path = self._create_temp_image_file(image)
+            # 图像直接在内存中交给 OCR，不再写临时文件
+            if isinstance(image, np.ndarray):
+                if image.ndim == 3 and image.shape[2] == 3 and not is_bgr:
+                    image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+            elif not isinstance(image, (str, Image.Image)):
+                raise ValueError("不支持的图像类型，必须是图像路径、PIL.Image或numpy数组")
 
             # 执行 OCR
-            result, _ = self.ocr(image_path)
-
-            # 清理临时文件
-            if is_temp_file and os.path.exists(image_path):
-                os.remove(image_path)
+            result, _ = self.ocr(image)
 
             # 提取文本
             if result:
@@ -82,39 +91,15 @@ class OCRPlugin:
             logger.error(f"OCR处理失败: {str(e)}")
             raise
 
-    def _create_temp_image_file(self, image):
+    def process_pdf(self, pdf_path, zoom=2):
         """
-        将图像数据保存为临时文件
+        处理PDF文件并提取文本
 
-        Args:
-            image: PIL.Image或numpy.ndarray格式的图像数据
+        页面在进程池中逐页渲染并识别，同时在途的页面数不超过 OCR_QUEUE_DEPTH，
+        内存占用与队列深度相关而与页数无关，结果按页码顺序合并。
+        OCR_WORKERS 为进程数（即 ONNX 会话数），OCR_INTRA_OP_THREADS 为每个会话的线程数，
+        OCR_WORKERS=1 时在当前进程内逐页处理。
 
-        Returns:
-            str: 临时文件路径
-        """
-        # 为临时文件创建目录（如果不存在）
-        tmp_dir = os.path.join(os.getcwd(), 'tmp')
-        os.makedirs(tmp_dir, exist_ok=True)
-
-        # 生成临时文件路径
-        temp_filename = f'ocr_temp_{uuid.uuid4().hex[:8]}.png'
-        image_path = os.path.join(tmp_dir, temp_filename)
-
-        # 根据图像类型保存文件
-        if isinstance(image, Image.Image):
-            # 保存PIL图像对象到临时文件
-            image.save(image_path)
-        elif isinstance(image, np.ndarray):
-            # 将numpy数组转换为PIL图像并保存
-            Image.fromarray(image).save(image_path)
-        else:
-            raise ValueError("不支持的图像类型，必须是PIL.Image或numpy数组")
-
-        return image_path
-
-    def process_pdf(self, pdf_path):
-        """
-        处理PDF文件并提取文本
         :param pdf_path: PDF文件路径
         :return: 提取的文本
         """
@@ -123,30 +108,57 @@ class OCRPlugin:
             raise FileNotFoundError(f"PDF file not found: {pdf_path}")
 
         try:
-            images = []
-
-            pdfDoc = fitz.open(pdf_path)
-            totalPage = pdfDoc.page_count
-            for pg in tqdm(range(totalPage), desc='to images', ncols=100):
-                page = pdfDoc[pg]
-                rotate, zoom_x, zoom_y = 0, 2, 2
-                mat = fitz.Matrix(zoom_x, zoom_y).prerotate(rotate)
-                pix = page.get_pixmap(matrix=mat, alpha=False)
-                img_pil = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-                images.append(img_pil)
-
-            # 处理每个图像并合并文本
-            all_text = []
-            for img_path in tqdm(images, desc='to txt', ncols=100):
-                text = self.process_image(img_path)
-                all_text.append(text)
-
-            return '\n\n'.join(all_text)
+            return '\n\n'.join(self.ocr_pdf_pages(pdf_path, zoom=zoom))
 
         except Exception as e:
             logger.error(f"PDF processing error: {str(e)}")
             return ""
 
+    def ocr_pdf_pages(self, pdf_path, pages=None, zoom=2):
+        """识别 PDF 中指定页（默认全部页面），按 pages 的顺序返回每页文本"""
+        if pages is None:
+            with fitz.open(pdf_path) as pdfDoc:
+                pages = list(range(pdfDoc.page_count))
+
+        workers = int(os.getenv("OCR_WORKERS", min(4, os.cpu_count() or 1)))
+        if workers <= 1 or len(pages) <= 1:
+            return list(self._iter_pdf_pages(pdf_path, pages, zoom))
+        return list(self._iter_pdf_pages_parallel(pdf_path, pages, zoom, workers))
+
+    def _iter_pdf_pages(self, pdf_path, pages, zoom=2):
+        """在当前进程内逐页渲染并识别，同一时间只保留一页图像"""
+        with fitz.open(pdf_path) as pdfDoc:
+            for pg in tqdm(pages, desc='to txt', ncols=100):
+                yield _ocr_page(self, pdfDoc[pg], zoom)
+
+    def _iter_pdf_pages_parallel(self, pdf_path, pages, zoom, workers):
+        """提交页面到进程池，维持固定大小的在途窗口，按页码顺序产出文本"""
+        global _PAGE_POOL
+        pool = _get_page_pool(workers)
+        depth = max(1, int(os.getenv("OCR_QUEUE_DEPTH", workers * 2)))
+
+        pending = deque()
+        page_iter = iter(pages)
+        try:
+            with tqdm(total=len(pages), desc='to txt', ncols=100) as bar:
+                for pg in page_iter:
+                    pending.append(pool.submit(_ocr_pdf_page, pdf_path, pg, zoom))
+                    if len(pending) >= depth:
+                        yield pending.popleft().result()
+                        bar.update()
+                while pending:
+                    yield pending.popleft().result()
+                    bar.update()
+        except BrokenProcessPool:
+            # 子进程异常退出后进程池不可再用，下次调用时重建
+            with _PAGE_POOL_LOCK:
+                if _PAGE_POOL is pool:
+                    _PAGE_POOL = None
+            raise
+        finally:
+            for future in pending:
+                future.cancel()
+
     def process_pdf_mineru(self, pdf_path):
         """
         使用Mineru OCR处理PDF文件
@@ -195,6 +207,72 @@ class OCRPlugin:
 
         return result["full_text"]
 
+def _ocr_page(plugin, page, zoom=2):
+    """将 PDF 页面渲染为 pixmap，并以零拷贝的 numpy 视图交给 OCR
+
+    视图直接引用 pixmap 的像素缓冲区，因此 OCR 必须在 pixmap 存活期间完成。
+    """
+    rotate, zoom_x, zoom_y = 0, zoom, zoom
+    mat = fitz.Matrix(zoom_x, zoom_y).prerotate(rotate)
+    pix = page.get_pixmap(matrix=mat, alpha=False)
+    image = np.frombuffer(pix.samples_mv, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
+    return plugin.process_image(image)
+
+
+def _get_page_pool(workers):
+    """获取页面 OCR 进程池；默认使用 forkserver（不支持时使用 spawn），可通过 OCR_MP_START_METHOD 指定
+
+    服务进程中有事件循环、线程池和数据库连接等多个线程，fork 会复制其他线程持有的锁，子进程可能死锁，因此不默认使用 fork。
+    子进程导入 src 包时不会创建知识库（见 src/__init__.py 中 knowledge_base 的延迟创建），只加载 OCR 模型。
+    """
+    global _PAGE_POOL
+    with _PAGE_POOL_LOCK:
+        if _PAGE_POOL is None:
+            default_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            intra_op_threads = int(os.getenv("OCR_INTRA_OP_THREADS", max(1, (os.cpu_count() or 1) // workers)))
+            _PAGE_POOL = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context(os.getenv("OCR_MP_START_METHOD", default_method)),
+                initializer=_init_page_worker,
+                initargs=(intra_op_threads,),
+            )
+            logger.info(f"OCR page pool started with {workers} workers, {intra_op_threads} intra-op threads each")
+        return _PAGE_POOL
+
+
+def _shutdown_page_pool():
+    global _PAGE_POOL
+    with _PAGE_POOL_LOCK:
+        if _PAGE_POOL is not None:
+            _PAGE_POOL.shutdown(wait=False, cancel_futures=True)
+            _PAGE_POOL = None
+
+
+atexit.register(_shutdown_page_pool)
+
+
+def _init_page_worker(intra_op_threads):
+    """子进程初始化：限制线程数并加载各自的 OCR 模型"""
+    os.environ["OMP_NUM_THREADS"] = str(intra_op_threads)
+    plugin = OCRPlugin(intra_op_threads=intra_op_threads)
+    plugin.load_model()
+    _WORKER_STATE["ocr"] = plugin
+    _WORKER_STATE["docs"] = OrderedDict()
+
+
+def _ocr_pdf_page(pdf_path, page_no, zoom=2):
+    """子进程任务：打开（或复用已打开的）PDF，渲染并识别单页"""
+    docs = _WORKER_STATE["docs"]
+    key = (pdf_path, os.path.getmtime(pdf_path))
+    if key not in docs:
+        docs[key] = fitz.open(pdf_path)
+        while len(docs) > 4:
+            _, doc = docs.popitem(last=False)
+            doc.close()
+    docs.move_to_end(key)
+    return _ocr_page(_WORKER_STATE["ocr"], docs[key][page_no], zoom)
+
+
 def get_state(task_id):
     return GOLBAL_STATE.get(task_id, {})
 
@@ -1,23 +1,48 @@
+import re
 import time
 import hashlib
 import os
 from src.utils.logging_config import logger
 
-def is_text_pdf(pdf_path):
+_CJK_CHARS = re.compile('[一-鿿぀-ヿ가-힯]')
+
+def extract_pdf_text_layer(pdf_path):
+    """一次遍历提取 PDF 每一页的文本层，返回按页排列的文本列表"""
     import fitz
-    doc = fitz.open(pdf_path)
-    total_pages = len(doc)
+    with fitz.open(pdf_path) as doc:
+        return [page.get_text() for page in doc]
+
+
+def is_garbled_text(text, min_chars=20, min_valid_ratio=0.6):
+    """判断页面文本层是否为空或乱码（需要走 OCR）
+
+    文本层字符数过少视为空页；常见的乱码来源是缺少 ToUnicode 映射的字体，
+    提取结果中会出现大量替换字符、私有区字符或控制字符，有效字符比例会明显偏低。
+    """
+    chars = [ch for ch in text if not ch.isspace()]
+    if len(chars) < min_chars:
+        return True
+
+    valid = 0
+    for ch in chars:
+        code = ord(ch)
+        if ch == '\ufffd' or 0xE000 <= code <= 0xF8FF or code < 0x20:
+            continue
+        if ch.isalnum() or 0x3000 <= code <= 0x303F or 0xFF00 <= code <= 0xFFEF or ch in ".,;:!?'\"()[]{}<>-_/\\%&*+=#@$~|`^":
+            valid += 1
+    return valid / len(chars) < min_valid_ratio
+
+
+def is_text_pdf(pdf_path, page_texts=None):
+    """超过 50% 的页面有文本内容则认为是文本 PDF；可传入已提取的 page_texts 避免重复解析"""
+    if page_texts is None:
+        page_texts = extract_pdf_text_layer(pdf_path)
+    total_pages = len(page_texts)
     if total_pages == 0:
         return False
 
-    text_pages = 0
-    for page_num in range(total_pages):
-        page = doc.load_page(page_num)
-        text = page.get_text()
-        if text.strip():  # 检查是否有文本内容
-            text_pages += 1
-
     # 计算有文本内容的页面比例
+    text_pages = sum(1 for text in page_texts if text.strip())
     text_ratio = text_pages / total_pages
     # 如果超过50%的页面有文本内容，则认为是文本PDF
     return text_ratio > 0.5
@@ -46,6 +71,21 @@ def hashstr(input_string, length=None, with_salt=False):
     return hash
 
 
+def estimate_tokens(text: str) -> int:
+    """粗略估计文本的 token 数：中日韩字符按 1 个 token，其他字符按 4 个字符 1 个 token"""
+    cjk = len(_CJK_CHARS.findall(text))
+    return cjk + (len(text) - cjk) // 4 + 1
+
+
+def hashfile(file_path, chunk_size=1024 * 1024):
+    """按块读取文件内容计算 sha256，避免大文件一次性读入内存"""
+    hasher = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        while chunk := f.read(chunk_size):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
 def get_docker_safe_url(base_url):
     if os.getenv("RUNNING_IN_DOCKER") == "true":
         # 替换所有可能的本地地址形式
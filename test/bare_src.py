@@ -0,0 +1,47 @@
+"""在不执行 src/__init__.py 的情况下导入 src 下的模块
+
+src/__init__.py 会加载 .env、读取配置，并在导入 knowledge_base 时创建 LightRagBasedKB（打开元数据库、创建工作目录等），
+测试和基准脚本只需要其中个别模块。预先注册不执行 __init__.py 的空包即可跳过这些副作用，
+模块中 `from src import config`、`from src.plugins import ocr` 等用到的属性通过 src_attrs / package_attrs 提供。
+
+项目依赖（lightrag、loguru 等）没有安装时，测试文件通过 require 整体跳过。
+
+用法：
+    require("numpy", "loguru", "pytz")
+    chunking = import_module("src.core.chunking")
+    embedding_cache = import_module("src.models.embedding_cache", config=SimpleNamespace(save_dir=tmp_dir))
+"""
+import os
+import sys
+import types
+import importlib
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BARE_PACKAGES = ("src", "src.core", "src.models", "src.plugins")
+
+
+def import_module(name, package_attrs: dict[str, dict] | None = None, **src_attrs):
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    for package in BARE_PACKAGES:
+        if package not in sys.modules:
+            module = types.ModuleType(package)
+            module.__path__ = [os.path.join(ROOT, *package.split("."))]
+            sys.modules[package] = module
+    for package, attrs in {**(package_attrs or {}), "src": {**(package_attrs or {}).get("src", {}), **src_attrs}}.items():
+        for key, value in attrs.items():
+            setattr(sys.modules[package], key, value)
+    return importlib.import_module(name)
+
+
+def require(*modules):
+    """缺少依赖时跳过当前测试文件；没有安装 pytest 时直接抛出 ImportError"""
+    try:
+        import pytest
+    except ImportError:
+        pytest = None
+    for module in modules:
+        if pytest is not None:
+            pytest.importorskip(module)
+        else:
+            importlib.import_module(module)
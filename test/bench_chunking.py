@@ -0,0 +1,123 @@
+"""切分性能测试：对比 LangChain RecursiveCharacterTextSplitter 与 src.core.chunking 的 chunks/s 与峰值内存
+
+每个切分器在独立的子进程中运行，峰值内存（ru_maxrss）互不影响。导入切分器所需的模块之后才记录基线，
+报告的内存增量只包含切分过程本身；src.core.chunking 通过 bare_src 导入，不会执行 src/__init__.py 创建知识库。
+旧切分器与原 chunk_with_parser 一致：先整体读入文件再切分；新切分器按块流式读取。
+
+用法：
+    python test/bench_chunking.py --file path/to/large.txt
+    python test/bench_chunking.py --size-mb 50          # 生成中文测试语料
+"""
+import os
+import sys
+import time
+import random
+import resource
+import tempfile
+import multiprocessing as mp
+from argparse import ArgumentParser
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+
+def make_corpus(path, size_mb):
+    """生成带标题、段落和中文标点的测试语料"""
+    rng = random.Random(0)
+    chars = "的一是在不了有和人这中大为上个国我以要他时来用们生到作地于出就分对成会可主发年动同工也能下过子说产种面而方后多定行学法"
+    target = size_mb * 1024 * 1024
+    written = 0
+    with open(path, "w", encoding="utf-8") as f:
+        while written < target:
+            block = [f"## 第{written // 4096}节\n\n"]
+            for _ in range(rng.randint(2, 6)):
+                sentences = ("".join(rng.choices(chars, k=rng.randint(8, 60))) + rng.choice("。！？；，")
+                             for _ in range(rng.randint(2, 10)))
+                block.append("".join(sentences) + "\n\n")
+            text = "".join(block)
+            f.write(text)
+            written += len(text.encode("utf-8"))
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def prepare_langchain(path, chunk_size, chunk_overlap):
+    """导入并创建切分器，返回执行切分的函数"""
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        separators=["\n\n", "\n", ".", " ", ""],
+    )
+
+    def run():
+        with open(path, encoding="utf-8") as f:
+            text = f.read()
+        return len(splitter.split_text(text))
+    return run
+
+
+def prepare_chunking(path, chunk_size, chunk_overlap, unit="chars", mode="text"):
+    from bare_src import import_module
+    chunking = import_module("src.core.chunking")
+    chunker = chunking.get_chunker({"chunk_size": chunk_size, "chunk_overlap": chunk_overlap, "chunk_unit": unit, "chunk_mode": mode})
+    if unit == "tokens":
+        chunking.count_tokens("")  # 预先加载 tiktoken 编码表
+
+    def run():
+        return sum(1 for _ in chunker.iter_records(chunking.iter_file(path)))
+    return run
+
+
+def worker(name, prepare, args, queue):
+    try:
+        run = prepare(*args)
+        base_rss = peak_rss_mb()
+        start_time = time.time()
+        count = run()
+        elapsed = time.time() - start_time
+        queue.put((name, count, elapsed, peak_rss_mb(), peak_rss_mb() - base_rss))
+    except Exception as e:
+        queue.put((name, e))
+
+
+def bench(name, prepare, args):
+    queue = mp.Queue()
+    proc = mp.Process(target=worker, args=(name, prepare, args, queue))
+    proc.start()
+    result = queue.get()
+    proc.join()
+    if len(result) == 2:
+        print(f"{name:<22} failed: {result[1]!r}")
+        return
+    name, count, elapsed, peak, delta = result
+    print(f"{name:<22} {count:>8} chunks in {elapsed:6.2f}s, {count / elapsed:10.0f} chunks/s, "
+          f"peak RSS {peak:7.1f} MB (+{delta:.1f} MB)")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument('--file', type=str, default=None, help='Text/markdown file to split')
+    parser.add_argument('--size-mb', type=int, default=20, help='Size of the generated corpus when --file is not given')
+    parser.add_argument('--chunk-size', type=int, default=500)
+    parser.add_argument('--chunk-overlap', type=int, default=100)
+    args = parser.parse_args()
+
+    mp.set_start_method("spawn")
+    path = args.file
+    if path is None:
+        path = os.path.join(tempfile.gettempdir(), f"bench_chunking_{args.size_mb}mb.md")
+        if not os.path.exists(path):
+            make_corpus(path, args.size_mb)
+    print(f"file: {path} ({os.path.getsize(path) / 1024 / 1024:.1f} MB)")
+
+    size = (path, args.chunk_size, args.chunk_overlap)
+    try:
+        import langchain_text_splitters  # noqa: F401
+        bench("langchain recursive", prepare_langchain, size)
+    except ImportError:
+        print("langchain_text_splitters not installed, skip baseline")
+    bench("streaming chars", prepare_chunking, size + ("chars", "text"))
+    bench("streaming tokens", prepare_chunking, size + ("tokens", "text"))
+    bench("markdown headings", prepare_chunking, size + ("chars", "markdown"))
@@ -0,0 +1,74 @@
+"""OCR 性能测试：对比旧的临时文件路径与内存路径的每秒页数
+
+用法：
+    python test/bench_ocr.py --pdf-path path/to/scanned.pdf --pages 20
+"""
+import os
+import sys
+import time
+import uuid
+from argparse import ArgumentParser
+
+import fitz
+from PIL import Image
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.plugins._ocr import OCRPlugin, _ocr_page  # noqa: E402
+
+
+def legacy_ocr_page(plugin, page, zoom=2):
+    """旧路径：渲染为 PIL 图像，写入临时 PNG，再由 RapidOCR 从磁盘读回"""
+    mat = fitz.Matrix(zoom, zoom)
+    pix = page.get_pixmap(matrix=mat, alpha=False)
+    image = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
+
+    tmp_dir = os.path.join(os.getcwd(), 'tmp')
+    os.makedirs(tmp_dir, exist_ok=True)
+    image_path = os.path.join(tmp_dir, f'ocr_temp_{uuid.uuid4().hex[:8]}.png')
+    image.save(image_path)
+    try:
+        result, _ = plugin.ocr(image_path)
+    finally:
+        os.remove(image_path)
+    return '\n'.join([line[1] for line in result]) if result else ""
+
+
+def bench(name, func, pdf_path, pages):
+    plugin = OCRPlugin()
+    plugin.load_model()
+    with fitz.open(pdf_path) as doc:
+        pages = min(pages, doc.page_count)
+        # 预热一次，排除模型首次推理的开销
+        func(plugin, doc[0])
+        start_time = time.time()
+        chars = sum(len(func(plugin, doc[pg])) for pg in range(pages))
+        elapsed = time.time() - start_time
+    print(f"{name:<12} {pages} pages in {elapsed:.2f}s, {pages / elapsed:.2f} pages/s, {chars} chars")
+    return elapsed
+
+
+def bench_parallel(pdf_path, pages):
+    """进程池并行路径（整个文件），用于对比多核扩展性"""
+    with fitz.open(pdf_path) as doc:
+        total = doc.page_count
+    start_time = time.time()
+    text = OCRPlugin().process_pdf(pdf_path)
+    elapsed = time.time() - start_time
+    print(f"{'parallel':<12} {total} pages in {elapsed:.2f}s, {total / elapsed:.2f} pages/s, {len(text)} chars "
+          f"(OCR_WORKERS={os.getenv('OCR_WORKERS', 'auto')})")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument('--pdf-path', type=str, required=True, help='Path to the PDF file')
+    parser.add_argument('--pages', type=int, default=10, help='Number of pages for the sequential comparison')
+    parser.add_argument('--parallel', action='store_true', help='Also run the process-pool path on the whole file')
+    args = parser.parse_args()
+
+    legacy = bench("temp-file", legacy_ocr_page, args.pdf_path, args.pages)
+    in_memory = bench("in-memory", _ocr_page, args.pdf_path, args.pages)
+    print(f"speedup: {legacy / in_memory:.2f}x")
+
+    if args.parallel:
+        bench_parallel(args.pdf_path, args.pages)
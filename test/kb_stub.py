@@ -0,0 +1,139 @@
+"""知识库测试共用的 LightRagBasedKB 与内存版 LightRAG
+
+new_kb() 在临时目录中创建真实的 LightRagBasedKB（元数据库、查询缓存等均为真实实现），
+FakeRAG 以内存字典实现 LightRAG 的存储接口，ainsert / ainsert_custom_chunks 按 LightRAG 1.3.9 的行为过滤已存在的文档和 chunk，
+抽取实体时以 chunk 中「：」之前的文本作为实体名，并记录每次抽取的 chunk 文本。
+"""
+import tempfile
+from types import SimpleNamespace
+
+from bare_src import import_module, require
+
+require("numpy", "loguru", "pytz", "lightrag")
+
+config = SimpleNamespace(save_dir=tempfile.mkdtemp())
+kb_module = import_module("src.core.lightrag_based_kb", config=config, package_attrs={"src.plugins": {"ocr": None}})
+
+from lightrag.utils import compute_mdhash_id, clean_text  # noqa: E402
+from lightrag.constants import GRAPH_FIELD_SEP  # noqa: E402
+from lightrag.kg.shared_storage import initialize_share_data  # noqa: E402
+
+initialize_share_data(workers=1)
+
+
+def new_kb():
+    """在新的临时目录中创建知识库，互不共享元数据"""
+    config.save_dir = tempfile.mkdtemp()
+    return kb_module.LightRagBasedKB()
+
+
+class FakeKV:
+    def __init__(self):
+        self.data = {}
+
+    async def get_by_id(self, key):
+        return self.data.get(key)
+
+    async def get_by_ids(self, keys):
+        return [self.data.get(key) for key in keys]
+
+    async def filter_keys(self, keys):
+        return {key for key in keys if key not in self.data}
+
+    async def upsert(self, items):
+        for key, value in items.items():
+            self.data[key] = {**self.data.get(key, {}), **value}
+
+    async def delete(self, keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    async def index_done_callback(self):
+        pass
+
+
+class FakeVDB(FakeKV):
+    async def query(self, text, top_k=5):
+        return [{"id": key, **value} for key, value in self.data.items() if text in value.get("content", "")][:top_k]
+
+
+class FakeGraph:
+    """节点 source_id 记录来源 chunk，与 LightRAG 图存储一致"""
+
+    def __init__(self):
+        self.nodes, self.edges = {}, {}
+
+    async def get_nodes_by_chunk_ids(self, chunk_ids):
+        return [{"id": name, **node} for name, node in self.nodes.items()
+                if set(node["source_id"].split(GRAPH_FIELD_SEP)) & set(chunk_ids)]
+
+    async def get_edges_by_chunk_ids(self, chunk_ids):
+        return []
+
+    async def upsert_node(self, name, data):
+        self.nodes[name] = data
+
+    async def upsert_edge(self, src, tgt, data):
+        self.edges[(src, tgt)] = data
+
+    async def remove_nodes(self, names):
+        for name in names:
+            self.nodes.pop(name, None)
+
+    async def remove_edges(self, edges):
+        for edge in edges:
+            self.edges.pop(edge, None)
+
+    async def index_done_callback(self):
+        pass
+
+
+class FakeRAG:
+    chunk_token_size = 60
+    chunk_overlap_token_size = 0
+    tokenizer = None
+
+    def __init__(self):
+        self.full_docs, self.text_chunks, self.doc_status = FakeKV(), FakeKV(), FakeKV()
+        self.chunks_vdb, self.entities_vdb, self.relationships_vdb = FakeVDB(), FakeVDB(), FakeVDB()
+        self.chunk_entity_relation_graph = FakeGraph()
+        self.inserted = []  # 通过 ainsert 导入的文档 id
+        self.extracted = []  # 抽取过实体的 chunk 文本
+
+    @staticmethod
+    def chunking_func(tokenizer, content, split_by_character, split_by_character_only, overlap, max_tokens):
+        """按段落切分"""
+        return [{"content": part, "chunk_order_index": i} for i, part in enumerate(p for p in content.split("\n\n") if p.strip())]
+
+    async def ainsert(self, input, ids=None, file_paths=None):
+        chunks = [dp["content"] for dp in self.chunking_func(self.tokenizer, input, None, False, 0, self.chunk_token_size)]
+        await self.ainsert_custom_chunks(input, chunks, doc_id=ids)
+        self.inserted.append(ids)
+        chunk_ids = [compute_mdhash_id(clean_text(chunk), prefix="chunk-") for chunk in chunks]
+        await self.doc_status.upsert({ids: {"status": "processed", "chunks_list": chunk_ids, "file_path": file_paths}})
+
+    async def ainsert_custom_chunks(self, full_text, text_chunks, doc_id=None):
+        full_text = clean_text(full_text)
+        text_chunks = [clean_text(chunk) for chunk in text_chunks]
+        doc_key = doc_id or compute_mdhash_id(full_text, prefix="doc-")
+        if not await self.full_docs.filter_keys({doc_key}):
+            return  # This document is already in the storage.
+
+        inserting = {
+            compute_mdhash_id(text, prefix="chunk-"): {"content": text, "full_doc_id": doc_key, "chunk_order_index": i, "file_path": ""}
+            for i, text in enumerate(text_chunks)
+        }
+        new_keys = await self.text_chunks.filter_keys(set(inserting))
+        inserting = {key: value for key, value in inserting.items() if key in new_keys}
+        if not inserting:
+            return  # All chunks are already in the storage.
+
+        for chunk_id, chunk in inserting.items():
+            self.extracted.append(chunk["content"])
+            entity = chunk["content"].split("：")[0]
+            node = self.chunk_entity_relation_graph.nodes.get(entity, {"entity_id": entity, "source_id": ""})
+            sources = [sid for sid in node["source_id"].split(GRAPH_FIELD_SEP) if sid] + [chunk_id]
+            await self.chunk_entity_relation_graph.upsert_node(entity, {**node, "source_id": GRAPH_FIELD_SEP.join(sources)})
+        await self.chunks_vdb.upsert(inserting)
+        await self.full_docs.upsert({doc_key: {"content": full_text}})
+        await self.text_chunks.upsert(inserting)
@@ -0,0 +1,97 @@
+"""导入去重测试：正文完全相同的文档被跳过，近似重复的文档照常导入并标注 near_duplicate_of
+
+知识库使用 kb_stub 中的真实 LightRagBasedKB 与内存版 LightRAG，文件通过 _process_file_to_markdown 按 .md 直接读取。
+
+用法：
+    python -m pytest test/test_dedup.py
+    python test/test_dedup.py
+"""
+import os
+import random
+import asyncio
+import tempfile
+
+from kb_stub import FakeRAG, new_kb
+from bare_src import import_module
+
+DocumentFingerprint = import_module("src.core.dedup").DocumentFingerprint
+
+DB_ID = "kb_test"
+CHARS = "的一是在不了有和人这中大为上个国我以要他时来用们生到作地于出就分对成会可主发年动同工也能下过子说产种面而方后多定行学法"
+
+
+def make_text(seed, length=3000):
+    rng = random.Random(seed)
+    return "".join(rng.choice(CHARS) + ("。\n" if rng.random() < 0.05 else "") for _ in range(length))
+
+
+def write_files(**texts):
+    folder = tempfile.mkdtemp()
+    paths = {}
+    for name, text in texts.items():
+        paths[name] = os.path.join(folder, f"{name}.md")
+        with open(paths[name], "w", encoding="utf-8") as f:
+            f.write(text)
+    return paths
+
+
+def ingest(kb, rag, paths, **params):
+    records = asyncio.run(kb._run_ingestion(DB_ID, rag, list(paths.values()), params))
+    return dict(zip(paths, records))
+
+
+def test_fingerprint_ignores_whitespace():
+    text = make_text(1)
+    assert DocumentFingerprint.from_text(text).content_hash == DocumentFingerprint.from_text("  " + text.replace("\n", "\n\n") + "\n").content_hash
+    assert DocumentFingerprint.from_text(text).content_hash != DocumentFingerprint.from_text(make_text(2)).content_hash
+
+
+def test_exact_duplicate_skipped():
+    kb, rag = new_kb(), FakeRAG()
+    text = make_text(1)
+    paths = write_files(a=text, b=text.replace("\n", "\n\n"), c=make_text(2))
+    records = ingest(kb, rag, paths, parse_concurrency=1)
+
+    a, b, c = records["a"], records["b"], records["c"]
+    assert (a["status"], c["status"]) == ("done", "done")
+    # 同一批次内的重复文件：文件名不同、空白不同，正文相同
+    assert (b["status"], b["stage"], b["duplicate_of"]) == ("skipped", "duplicate", a["file_id"])
+    assert rag.inserted == [a["file_id"], c["file_id"]]
+
+    # 之后批次中的重复文件通过已保存的指纹识别
+    d = ingest(kb, rag, write_files(d=make_text(2)))["d"]
+    assert (d["status"], d["duplicate_of"]) == ("skipped", c["file_id"])
+    assert kb.meta_store.get_file(d["file_id"])["status"] == "skipped"
+    assert len(rag.inserted) == 2
+
+    # on_duplicate=insert 时仍然导入
+    e = ingest(kb, rag, write_files(e=text), on_duplicate="insert")["e"]
+    assert e["status"] == "done" and "duplicate_of" not in e
+    assert rag.inserted[-1] == e["file_id"]
+
+
+def test_near_duplicate_flagged():
+    kb, rag = new_kb(), FakeRAG()
+    text = make_text(1)
+    original = ingest(kb, rag, write_files(original=text))["original"]
+
+    # 修改约 1% 的字符
+    rng = random.Random(3)
+    chars = list(text)
+    for pos in rng.sample(range(len(chars)), len(chars) // 100):
+        chars[pos] = "改"
+    records = ingest(kb, rag, write_files(edited="".join(chars), other=make_text(4)))
+
+    edited, other = records["edited"], records["other"]
+    assert edited["status"] == "done"
+    assert edited["near_duplicate_of"] == original["file_id"]
+    assert 0.8 <= edited["similarity"] < 1.0
+    assert other["status"] == "done" and "near_duplicate_of" not in other
+    assert len(rag.inserted) == 3
+
+
+if __name__ == "__main__":
+    test_fingerprint_ignores_whitespace()
+    test_exact_duplicate_skipped()
+    test_near_duplicate_flagged()
+    print("ok")
@@ -0,0 +1,99 @@
+"""embedding 缓存测试：命中的文本不再发送给服务端，缓存在重新打开后仍然有效，超过上限时按最近访问淘汰
+
+用法：
+    python -m pytest test/test_embedding_cache.py
+    python test/test_embedding_cache.py
+"""
+import os
+import asyncio
+import tempfile
+from types import SimpleNamespace
+
+from bare_src import import_module, require
+
+require("numpy", "loguru", "pytz", "requests", "httpx", "zhipuai", "langchain_huggingface")
+
+SAVE_DIR = tempfile.mkdtemp()
+MODEL_ID = "test/fake-embedding"
+DIMENSION = 4
+config = SimpleNamespace(
+    save_dir=SAVE_DIR,
+    embed_model_names={MODEL_ID: {"name": "fake-embedding", "dimension": DIMENSION, "base_url": "http://localhost:1/embed"}},
+)
+embedding_cache = import_module("src.models.embedding_cache", config=config)
+embedding = import_module("src.models.embedding", config=config)
+
+
+def fake_vector(text):
+    return [float(len(text)), float(ord(text[0])), 0.5, -1.0]
+
+
+class FakeEmbedding(embedding.BaseEmbeddingModel):
+    """记录发送给服务端的文本"""
+
+    def __init__(self):
+        super().__init__(MODEL_ID)
+        self.requests = []
+
+    def predict(self, message):
+        self.requests.append(list(message))
+        return [fake_vector(text) for text in message]
+
+    async def apredict(self, message):
+        return self.predict(message)
+
+
+def test_cache_get_put_and_reopen():
+    cache_dir = tempfile.mkdtemp(dir=SAVE_DIR)
+    cache = embedding_cache.EmbeddingCache(cache_dir, dimension=DIMENSION)
+    assert cache.get_many(["a", "b"]) == [None, None]
+
+    cache.put_many(["a", "b"], [fake_vector("a"), fake_vector("b")])
+    assert cache.get_many(["b", "x", "a", "b"]) == [fake_vector("b"), None, fake_vector("a"), fake_vector("b")]
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["writes"], stats["entries"]) == (3, 3, 2, 2)
+
+    reopened = embedding_cache.EmbeddingCache(cache_dir)
+    assert reopened.dimension == DIMENSION
+    assert reopened.get_many(["a"]) == [fake_vector("a")]
+
+
+def test_cache_evicts_least_recently_used():
+    cache = embedding_cache.EmbeddingCache(tempfile.mkdtemp(dir=SAVE_DIR), dimension=DIMENSION, max_entries=20)
+    texts = [f"text-{i}" for i in range(20)]
+    for text in texts:
+        cache.put_many([text], [fake_vector(text)])
+    cache._conn.execute("UPDATE entries SET last_access = 0 WHERE key = ?", (cache.make_key("text-0"),))
+
+    cache.put_many(["new"], [fake_vector("new")])
+    assert cache.get_many(["text-0", "new", "text-19"]) == [None, fake_vector("new"), fake_vector("text-19")]
+    assert cache.stats()["entries"] == 20 and cache.stats()["evictions"] == 1
+
+
+def test_model_only_requests_misses():
+    model = FakeEmbedding()
+    model.cache.clear()
+
+    assert model.encode(["alpha", "beta"]) == [fake_vector("alpha"), fake_vector("beta")]
+    assert model.requests == [["alpha", "beta"]]
+
+    # 命中的文本不再请求，同一批次内的重复文本只请求一次
+    assert model.encode(["beta", "gamma", "gamma", "alpha"]) == [fake_vector(t) for t in ["beta", "gamma", "gamma", "alpha"]]
+    assert model.requests[-1] == ["gamma"]
+
+    async def run():
+        return await model.abatch_encode(["alpha", "beta", "gamma"], batch_size=2)
+
+    assert asyncio.run(run()) == [fake_vector(t) for t in ["alpha", "beta", "gamma"]]
+    assert len(model.requests) == 2
+
+    # 同一模型的缓存实例是共享的，新建的模型对象同样命中
+    assert FakeEmbedding().cache is model.cache
+    assert os.path.dirname(model.cache.cache_dir) == os.path.join(SAVE_DIR, "embedding_cache")
+
+
+if __name__ == "__main__":
+    test_cache_get_put_and_reopen()
+    test_cache_evicts_least_recently_used()
+    test_model_only_requests_misses()
+    print("ok")
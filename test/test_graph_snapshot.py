@@ -0,0 +1,71 @@
+"""图快照测试：构建期间发生的修改在构建完成后重放，且重放不会再次被记录
+
+用法：
+    python -m pytest test/test_graph_snapshot.py
+    python test/test_graph_snapshot.py
+"""
+import threading
+
+from bare_src import import_module, require
+
+require("numpy", "loguru", "pytz")
+GraphSnapshot = import_module("src.core.graph_snapshot").GraphSnapshot
+
+
+def edge(h, t, rel_type="RELATED"):
+    return {"id": f"{h}-{rel_type}-{t}", "h_id": h, "h": h, "t_id": t, "t": t, "type": rel_type}
+
+
+class FakeDriver:
+    """按查询返回固定结果，导出关系时调用 on_edges 模拟构建期间的并发写入"""
+
+    def __init__(self, nodes, edges, on_edges=None):
+        self.nodes, self.edges, self.on_edges = nodes, edges, on_edges
+
+    def session(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def run(self, query):
+        if "embedding" in query:
+            return iter([{"id": name, "name": name, "embedding": [1.0, 0.0]} for name in self.nodes])
+        if self.on_edges:
+            self.on_edges()
+        return iter(self.edges)
+
+
+def build_in_thread(snapshot, driver, timeout=5):
+    thread = threading.Thread(target=snapshot.build, args=(driver,), daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "build did not finish"
+
+
+def test_changes_during_build_are_replayed_once():
+    snapshot = GraphSnapshot()
+
+    def write_during_build():
+        snapshot.apply_edges([edge("b", "c")])
+        snapshot.set_embeddings([("a", [0.0, 1.0])])
+
+    build_in_thread(snapshot, FakeDriver(["a", "b"], [edge("a", "b")], on_edges=write_during_build))
+
+    assert snapshot.ready and not snapshot._building and snapshot._pending == []
+    assert snapshot.stats()["nodes"] == 3 and snapshot.stats()["edges"] == 2
+    assert [row[2]["name"] for row in snapshot.query_entity("c", hops=1)] == ["b"]
+    # 重放的 embedding 覆盖了导出时的旧值
+    assert snapshot.query_by_embedding([0.0, 1.0], threshold=0.99)[0][0]["name"] == "a"
+
+    # 构建完成后的修改直接生效，不再记录
+    snapshot.apply_edges([edge("c", "d")])
+    assert snapshot._pending == [] and snapshot.stats()["edges"] == 3
+
+
+if __name__ == "__main__":
+    test_changes_during_build_are_replayed_once()
+    print("ok")
@@ -0,0 +1,68 @@
+"""增量更新文档测试：只对修改过的段落重新抽取，新内容可以被检索到
+
+知识库与 LightRAG 使用 kb_stub 中的共用实现，FakeRAG 按 LightRAG 1.3.9 的行为跳过已存在的文档和 chunk。
+
+用法：
+    python -m pytest test/test_update_document.py
+    python test/test_update_document.py
+"""
+import asyncio
+
+from kb_stub import FakeRAG, new_kb
+
+DB_ID = "kb_test"
+DOC_ID = "doc-test"
+PARAGRAPHS = [f"实体{i}：这是第 {i} 段的内容，描述了实体{i}的属性和它与其他实体之间的关系。" for i in range(6)]
+
+
+async def make_kb_and_rag(content):
+    kb, rag = new_kb(), FakeRAG()
+    await kb._insert_document(DB_ID, rag, content, DOC_ID, "doc.md")
+    rag.extracted.clear()
+    return kb, rag
+
+
+def test_update_one_paragraph():
+    async def run():
+        old_content = "\n\n".join(PARAGRAPHS)
+        kb, rag = await make_kb_and_rag(old_content)
+
+        edited = "实体3：第 3 段被改写了，现在说明实体3已经迁移到新的位置。"
+        new_content = old_content.replace(PARAGRAPHS[3], edited)
+        result = await kb._update_document_chunks(DB_ID, rag, DOC_ID, new_content, "doc.md")
+
+        assert result == {"kept": 5, "added": 1, "removed": 1, "total": 6}, result
+        # 只有修改过的段落调用了抽取
+        assert rag.extracted == [edited]
+        # 新内容可以被检索到，旧内容已经删除
+        hits = await rag.chunks_vdb.query("迁移到新的位置")
+        assert [hit["content"] for hit in hits] == [edited]
+        assert not await rag.chunks_vdb.query("第 3 段的内容")
+        assert (await rag.full_docs.get_by_id(DOC_ID))["content"] == new_content
+
+        # chunk 索引与 text_chunks 一致，顺序与新版本相同
+        chunk_ids = kb.meta_store.get_doc_chunk_ids(DOC_ID)
+        chunks = await rag.text_chunks.get_by_ids(chunk_ids)
+        assert [chunk["content"] for chunk in chunks] == PARAGRAPHS[:3] + [edited] + PARAGRAPHS[4:]
+        assert [chunk["chunk_order_index"] for chunk in chunks] == list(range(6))
+        # 实体3 的来源替换为新 chunk
+        assert rag.chunk_entity_relation_graph.nodes["实体3"]["source_id"] == chunk_ids[3]
+
+    asyncio.run(run())
+
+
+def test_update_unchanged_document():
+    async def run():
+        content = "\n\n".join(PARAGRAPHS)
+        kb, rag = await make_kb_and_rag(content)
+        result = await kb._update_document_chunks(DB_ID, rag, DOC_ID, content, "doc.md")
+        assert result == {"kept": 6, "added": 0, "removed": 0, "total": 6}, result
+        assert rag.extracted == []
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    test_update_one_paragraph()
+    test_update_unchanged_document()
+    print("ok")
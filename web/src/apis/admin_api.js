@@ -149,6 +149,16 @@ export const knowledgeBaseApi = {
     }, true)
   },
 
+  /**
+   * 用新版本文件更新文档，只重新处理变化的分块
+   * @param {Object} data - 包含 db_id, file_id, file_path (上传后的新文件路径), params
+   * @returns {Promise} - 保留、新增、删除的分块数量
+   */
+  updateDocument: async (data) => { // data: { db_id, file_id, file_path, params }
+    checkAdminPermission()
+    return apiPost('/api/data/update-document', data, {}, true)
+  },
+
   /**
    * 添加文件或URL到知识库
    * @param {Object} data - 包含 db_id, items (文件路径或URL列表), params (包含 content_type 等参数)
@@ -444,6 +454,16 @@ export const graphApi = {
     checkAdminPermission()
     return apiPost('/api/data/graph/index-nodes', { kgdb_name: dbName }, {}, true)
   },
+
+  /**
+   * 获取节点索引任务进度
+   * @param {string} jobId - 任务ID
+   * @returns {Promise} - 任务进度
+   */
+  getIndexNodesJob: async (jobId) => {
+    checkAdminPermission()
+    return apiGet(`/api/data/graph/index-nodes/${jobId}`, {}, true)
+  },
 }
 
 // 系统配置API